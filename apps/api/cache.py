@@ -0,0 +1,45 @@
+# apps/api/cache.py
+
+import logging
+import threading
+import time
+
+from django.core.cache import cache
+
+logger = logging.getLogger('api')
+
+
+def cached_with_revalidate(key, compute, ttl, stale_ttl):
+    """
+    Кешувати результат compute() за схемою stale-while-revalidate
+
+    - перші ttl секунд значення віддається з кешу
+    - ще stale_ttl секунд після цього віддається застаріле значення,
+      а compute() перераховує його у фоновому потоці (один потік на ключ)
+    - якщо значення немає або воно старше за ttl + stale_ttl, compute()
+      виконується одразу в поточному запиті
+
+    compute() у фоні виконується поза контекстом запиту (без identity map,
+    reads_from() тощо) - потрібний контекст він має встановлювати сам.
+    """
+    entry = cache.get(key)
+    if entry is None:
+        return _store(key, compute(), ttl, stale_ttl)
+
+    if entry['fresh_until'] <= time.time() and cache.add(f"{key}:refreshing", True, ttl + stale_ttl):
+        threading.Thread(target=_refresh, args=(key, compute, ttl, stale_ttl), daemon=True).start()
+    return entry['value']
+
+
+def _store(key, value, ttl, stale_ttl):
+    cache.set(key, {'value': value, 'fresh_until': time.time() + ttl}, ttl + stale_ttl)
+    return value
+
+
+def _refresh(key, compute, ttl, stale_ttl):
+    try:
+        _store(key, compute(), ttl, stale_ttl)
+    except Exception as e:
+        logger.error(f"Background refresh of '{key}' failed: {e}")
+    finally:
+        cache.delete(f"{key}:refreshing")
@@ -6,6 +6,9 @@ from .rate_limit import RateLimitMiddleware
 from .request_logging import RequestLoggingMiddleware
 from .security import SecurityMiddleware
 from .ip_whitelist import IPWhitelistMiddleware
+from .identity_map import MongoIdentityMapMiddleware
+from .query_stats import MongoQueryStatsMiddleware
+from .metrics import HTTPMetricsMiddleware
 
 __all__ = [
     'JWTAuthenticationMiddleware',
@@ -14,4 +17,7 @@ __all__ = [
     'RequestLoggingMiddleware',
     'SecurityMiddleware',
     'IPWhitelistMiddleware',
+    'MongoIdentityMapMiddleware',
+    'MongoQueryStatsMiddleware',
+    'HTTPMetricsMiddleware',
 ]
@@ -0,0 +1,25 @@
+# apps/api/middleware/identity_map.py
+
+from core.mongo_orm import identity_map
+
+
+class MongoIdentityMapMiddleware:
+    """
+    Middleware для identity map MongoDB ORM
+    
+    На час обробки запиту кожен документ (колекція, _id) завантажується
+    не більше одного разу: повторні find_by_id / in_bulk беруть екземпляр з карти.
+    Після завершення запиту карта відкидається.
+    
+    За замовчуванням не підключений: identity map вмикається на окремих
+    сторінках декоратором @identity_map() (див. core.mongo_orm.identity_map).
+    Додавати в MIDDLEWARE лише якщо жоден view не змінює екземпляри
+    перед повторними запитами.
+    """
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        with identity_map():
+            return self.get_response(request)
@@ -0,0 +1,37 @@
+# apps/api/middleware/metrics.py
+
+import time
+
+from core.metrics import http_request_seconds
+
+
+class HTTPMetricsMiddleware:
+    """
+    Middleware для метрик HTTP запитів (http_request_duration_seconds)
+
+    Мітка route - шаблон URL (наприклад, api/products/<str:pk>/get/),
+    а не сам шлях, щоб кількість рядів не росла з кожним id.
+    Запити без маршруту (404 або відповідь middleware до маршрутизації,
+    наприклад 401/429) потрапляють у route="<unmatched>".
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        response = self.get_response(request)
+        http_request_seconds.observe(
+            time.perf_counter() - started,
+            method=request.method,
+            route=self.get_route(request),
+            status=response.status_code,
+        )
+        return response
+
+    def get_route(self, request):
+        """Шаблон URL, що обробив запит"""
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return '<unmatched>'
+        return match.route or match.view_name or '<unmatched>'
@@ -0,0 +1,60 @@
+# apps/api/middleware/query_stats.py
+
+import logging
+
+from django.conf import settings
+
+from core.mongo_orm import query_comment, set_query_comment
+from core.query_profiler import collect_request_queries
+
+logger = logging.getLogger('api')
+
+
+class MongoQueryStatsMiddleware:
+    """
+    Middleware для статистики запитів MongoDB на один HTTP запит
+
+    - Додає заголовок Server-Timing: mongo;dur=<мс>;desc="<N> queries"
+      (видно у DevTools -> Network -> Timing)
+    - Пише підсумок (кількість, час, документи) в лог на рівні DEBUG
+    - Попереджає про N+1: однакові за формою запити, повторені
+      MONGO_N_PLUS_ONE_THRESHOLD разів і більше
+    - Позначає запити view коментарем (модуль.назва view), який видно
+      в profiler та db.currentOp() MongoDB
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.threshold = getattr(settings, 'MONGO_N_PLUS_ONE_THRESHOLD', 10)
+
+    def __call__(self, request):
+        with collect_request_queries() as queries, query_comment(None):
+            response = self.get_response(request)
+
+        if not queries.count:
+            return response
+
+        timing = f'mongo;dur={queries.total_ms:.1f};desc="{queries.count} queries"'
+        existing = response.get('Server-Timing')
+        response['Server-Timing'] = f"{existing}, {timing}" if existing else timing
+
+        docs = sum(entry['docs'] or 0 for entry in queries.entries)
+        logger.debug(
+            f"Mongo {request.method} {request.path}: {queries.count} queries, "
+            f"{queries.total_ms:.1f}ms, {docs} docs"
+        )
+
+        if self.threshold:
+            for (collection, operation, shape), n in queries.repeated(self.threshold):
+                logger.warning(
+                    f"Possible N+1 on {request.method} {request.path}: "
+                    f"{collection}.{operation} {shape} executed {n} times"
+                )
+
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # DRF @api_view та class-based views - ім'я класу, інакше - функції
+        target = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None) or view_func
+        set_query_comment(f"{target.__module__}.{getattr(target, '__name__', type(target).__name__)}")
+        return None
@@ -11,6 +11,7 @@ class RoleBasedAccessMiddleware:
     
     Правила доступу:
     - /api/admin/* - тільки admin
+    - /api/metrics/ - тільки admin
     - /api/user/* - всі авторизовані
     - /crm/admin/* - тільки admin (через session)
     """
@@ -22,7 +23,7 @@ class RoleBasedAccessMiddleware:
         path = request.path
         
         # Правила для API (перевіряємо request.user з JWT)
-        api_admin_paths = ['/api/admin/', '/api/analytics/']
+        api_admin_paths = ['/api/admin/', '/api/analytics/', '/api/metrics/']
         api_user_paths = ['/api/user/profile/', '/api/products/']
         
         # Правила для Web (перевіряємо session)
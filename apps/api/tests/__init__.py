@@ -4,4 +4,4 @@
 Добавлен, чтобы Python и Django корректно импортировали подпакеты/модули тестов
 """
 
-__all__ = ["test_user_jwt_authentication"]
+__all__ = ["test_user_jwt_authentication", "test_mongo_orm"]
@@ -0,0 +1,1342 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from django.test import SimpleTestCase
+
+from apps.crm.models import Contract, Supplier
+from apps.main.models import Product
+from core.mongo_orm import as_object_id, identity_map
+
+
+class FakeCursor:
+    """Ледачий курсор: запам'ятовує skip/limit/batch_size та кількість виданих документів"""
+
+    def __init__(self, docs):
+        self.docs = docs
+        self.skip_value = 0
+        self.limit_value = 0
+        self.batch_size_value = None
+        self.sort_value = None
+        self.yielded = 0
+
+    def sort(self, value, direction=None):
+        self.sort_value = value if direction is None else [(value, direction)]
+        return self
+
+    def skip(self, value):
+        self.skip_value = value
+        return self
+
+    def limit(self, value):
+        self.limit_value = value
+        return self
+
+    def batch_size(self, value):
+        self.batch_size_value = value
+        return self
+
+    def __iter__(self):
+        docs = self.docs[self.skip_value:]
+        if self.limit_value:
+            docs = docs[:self.limit_value]
+        for doc in docs:
+            self.yielded += 1
+            yield doc
+
+
+class FakeCollection:
+    """Мінімальна заміна pymongo колекції: рахує запити та фільтрує по _id"""
+
+    def __init__(self, docs=None):
+        self.docs = list(docs or [])
+        self.find_calls = []
+        self.projections = []
+        self.updates = []
+        self.cursors = []
+        self.bulk_writes = []
+        self.pipelines = []
+        self.aggregate_result = []
+        self.options = []
+
+    OPERATORS = {
+        '$in': lambda value, arg: value in arg,
+        '$gte': lambda value, arg: value is not None and value >= arg,
+        '$lt': lambda value, arg: value is not None and value < arg,
+    }
+
+    def _matches(self, doc, query):
+        for key, condition in query.items():
+            value = doc.get(key)
+            if isinstance(condition, dict) and set(condition) <= set(self.OPERATORS):
+                if not all(self.OPERATORS[op](value, arg) for op, arg in condition.items()):
+                    return False
+            elif value != condition:
+                return False
+        return True
+
+    def _project(self, doc, projection):
+        if not projection:
+            return dict(doc)
+        if any(projection.values()):
+            return {key: value for key, value in doc.items() if key == '_id' or key in projection}
+        return {key: value for key, value in doc.items() if key not in projection}
+
+    def with_options(self, **kwargs):
+        return self
+
+    def find(self, query=None, projection=None, *args, **kwargs):
+        self.find_calls.append(query or {})
+        self.projections.append(projection)
+        self.options.append(kwargs)
+        cursor = FakeCursor([self._project(doc, projection) for doc in self.docs if self._matches(doc, query or {})])
+        self.cursors.append(cursor)
+        return cursor
+
+    def find_one(self, query=None, projection=None, *args, **kwargs):
+        self.find_calls.append(query or {})
+        self.projections.append(projection)
+        self.options.append(kwargs)
+        for doc in self.docs:
+            if self._matches(doc, query or {}):
+                return self._project(doc, projection)
+        return None
+
+    def count_documents(self, query, skip=0, limit=0, **kwargs):
+        self.options.append(kwargs)
+        docs = [doc for doc in self.docs if self._matches(doc, query)][skip:]
+        return len(docs[:limit] if limit else docs)
+
+    def update_one(self, query, update, *args, **kwargs):
+        self.updates.append((query, update))
+
+    def update_many(self, query, update, upsert=False):
+        self.updates.append((query, update))
+        return SimpleNamespace(modified_count=len([doc for doc in self.docs if self._matches(doc, query)]))
+
+    def find_one_and_update(self, query, update, projection=None, sort=None, upsert=False, return_document=None):
+        self.updates.append((query, update))
+        for doc in self.docs:
+            if self._matches(doc, query):
+                for field, value in update.get('$inc', {}).items():
+                    doc[field] = doc.get(field, 0) + value
+                return self._project(doc, projection)
+        return None
+
+    def insert_many(self, docs, ordered=True):
+        ids = [ObjectId() for _ in docs]
+        self.docs.extend({**doc, '_id': _id} for doc, _id in zip(docs, ids))
+        return SimpleNamespace(inserted_ids=ids)
+
+    def bulk_write(self, operations, ordered=True):
+        self.bulk_writes.append((operations, ordered))
+        return SimpleNamespace(modified_count=len(operations))
+
+    def aggregate(self, pipeline, **kwargs):
+        self.pipelines.append(pipeline)
+        self.options.append(kwargs)
+        return iter(self.aggregate_result)
+
+
+class PrefetchTests(SimpleTestCase):
+
+    def setUp(self):
+        self.supplier_id = ObjectId()
+        self.product_ids = [ObjectId(), ObjectId()]
+        self.suppliers = FakeCollection([{'_id': self.supplier_id, 'name': 'Supplier'}])
+        self.products = FakeCollection([
+            {'_id': pid, 'name': f'Product {i}'} for i, pid in enumerate(self.product_ids)
+        ])
+        self.contracts = FakeCollection([
+            {
+                '_id': ObjectId(),
+                'number': str(10_000_000 + i),
+                'supplier_id': self.supplier_id,
+                'products': [
+                    {'product_id': self.product_ids[0], 'quantity': 1, 'unit_price': 1.0},
+                    # Рядкові id теж зустрічаються в базі
+                    {'product_id': str(self.product_ids[1]), 'quantity': 2, 'unit_price': 2.0},
+                ],
+            }
+            for i in range(5)
+        ])
+
+        for model, collection in ((Contract, self.contracts), (Supplier, self.suppliers), (Product, self.products)):
+            patcher = patch.object(model, 'get_collection', return_value=collection)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_prefetch_uses_one_query_per_path(self):
+        contracts = Contract.objects().prefetch('supplier_id', 'products.product_id').all()
+
+        self.assertEqual(len(self.suppliers.find_calls), 1)
+        self.assertEqual(len(self.products.find_calls), 1)
+
+        for contract in contracts:
+            self.assertEqual(contract.get_related('supplier_id').name, 'Supplier')
+            names = [
+                contract.get_related('products.product_id', item['product_id']).name
+                for item in contract.products
+            ]
+            self.assertEqual(names, ['Product 0', 'Product 1'])
+
+        # Усі звернення обслуговуються з prefetch-кешу
+        self.assertEqual(len(self.suppliers.find_calls), 1)
+        self.assertEqual(len(self.products.find_calls), 1)
+
+    def test_get_related_without_prefetch_falls_back_to_find_by_id(self):
+        contract = Contract.objects().first()
+
+        self.assertEqual(contract.get_related('supplier_id').name, 'Supplier')
+        self.assertEqual(self.suppliers.find_calls, [{'_id': self.supplier_id}])
+
+    def test_prefetch_rejects_non_reference_path(self):
+        with self.assertRaises(ValueError):
+            Contract.objects().prefetch('number')
+
+    def test_paths_to_same_model_share_one_query(self):
+        from apps.crm.models import Employee, Repair
+
+        employee_id, technician_id = ObjectId(), ObjectId()
+        employees = FakeCollection([
+            {'_id': employee_id, 'full_name': 'Manager'},
+            {'_id': technician_id, 'full_name': 'Technician'},
+        ])
+        repairs = FakeCollection([{
+            '_id': ObjectId(),
+            'employee_id': employee_id,
+            'technician_id': technician_id,
+            'product_id': self.product_ids[0],
+            'products_used': [{'product_id': str(self.product_ids[1]), 'quantity': 1, 'unit_price': 1.0}],
+        }])
+
+        with patch.object(Repair, 'get_collection', return_value=repairs), \
+                patch.object(Employee, 'get_collection', return_value=employees):
+            repair = Repair.objects().prefetch(
+                'employee_id', 'technician_id', 'product_id', 'products_used.product_id'
+            ).first()
+
+        self.assertEqual(len(employees.find_calls), 1)
+        self.assertEqual(len(self.products.find_calls), 1)
+        self.assertEqual(repair.get_related('technician_id').full_name, 'Technician')
+        self.assertEqual(repair.get_related('products_used.product_id', str(self.product_ids[1])).name, 'Product 1')
+
+
+class IdentityMapTests(SimpleTestCase):
+
+    def setUp(self):
+        self.product_ids = [ObjectId() for _ in range(3)]
+        self.products = FakeCollection([
+            {'_id': pid, 'name': f'Product {i}'} for i, pid in enumerate(self.product_ids)
+        ])
+        patcher = patch.object(Product, 'get_collection', return_value=self.products)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_find_by_id_is_cached_inside_identity_map(self):
+        with identity_map():
+            first = Product.find_by_id(str(self.product_ids[0]))
+            second = Product.find_by_id(self.product_ids[0])
+
+        self.assertIs(first, second)
+        self.assertEqual(len(self.products.find_calls), 1)
+
+    def test_find_by_id_without_identity_map_always_queries(self):
+        Product.find_by_id(self.product_ids[0])
+        Product.find_by_id(self.product_ids[0])
+
+        self.assertEqual(len(self.products.find_calls), 2)
+
+    def test_in_bulk_loads_only_missing_ids(self):
+        with identity_map():
+            cached = Product.find_by_id(self.product_ids[0])
+            unknown_id = ObjectId()
+            result = Product.in_bulk([str(pid) for pid in self.product_ids] + [unknown_id])
+
+            self.assertEqual(set(result), set(self.product_ids))
+            self.assertIs(result[self.product_ids[0]], cached)
+            self.assertEqual(
+                sorted(self.products.find_calls[-1]['_id']['$in']),
+                sorted(self.product_ids[1:] + [unknown_id]),
+            )
+
+            # Після in_bulk повторні find_by_id не звертаються до бази
+            calls = len(self.products.find_calls)
+            Product.find_by_id(self.product_ids[2])
+            self.assertEqual(len(self.products.find_calls), calls)
+
+
+class ProjectionTests(SimpleTestCase):
+
+    def setUp(self):
+        self.product_id = ObjectId()
+        self.products = FakeCollection([{
+            '_id': self.product_id,
+            'name': 'GPU',
+            'category': 'component',
+            'price': 500.0,
+            'description': 'x' * 1000,
+            'specifications': [{'name': 'VRAM', 'value': '8GB'}],
+        }])
+        patcher = patch.object(Product, 'get_collection', return_value=self.products)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_only_passes_projection_and_skips_other_fields(self):
+        product = Product.objects().only('name', 'price').first()
+
+        self.assertEqual(self.products.projections, [{'name': 1, 'price': 1}])
+        self.assertEqual((product.id, product.name, product.price), (self.product_id, 'GPU', 500.0))
+        with self.assertRaises(AttributeError):
+            product.description
+
+    def test_defer_excludes_fields(self):
+        products = Product.objects().defer('description', 'specifications').all()
+
+        self.assertEqual(self.products.projections, [{'description': 0, 'specifications': 0}])
+        self.assertEqual(products[0].category, 'component')
+        self.assertFalse(hasattr(products[0], 'specifications'))
+
+    def test_partial_instance_refuses_save_unless_allowed(self):
+        product = Product.objects().only('name', 'category', 'price').first()
+
+        with self.assertRaises(ValueError):
+            product.save()
+        self.assertEqual(self.products.updates, [])
+
+        product.price = 450.0
+        product.save(allow_partial=True)
+        query, update = self.products.updates[0]
+        self.assertEqual(query, {'_id': self.product_id})
+        self.assertEqual(update, {'$set': {'price': 450.0}})
+
+    def test_partial_instances_bypass_identity_map(self):
+        with identity_map():
+            partial = Product.objects().only('name').first()
+            full = Product.find_by_id(self.product_id)
+
+        self.assertIsNot(partial, full)
+        self.assertEqual(full.description, 'x' * 1000)
+
+    def test_only_rejects_unknown_field(self):
+        with self.assertRaises(ValueError):
+            Product.objects().only('nope')
+
+
+class StreamingTests(SimpleTestCase):
+
+    def setUp(self):
+        self.supplier_id = ObjectId()
+        self.suppliers = FakeCollection([{'_id': self.supplier_id, 'name': 'Supplier'}])
+        self.contracts = FakeCollection([
+            {
+                '_id': ObjectId(),
+                'number': str(10_000_000 + i),
+                'supplier_id': self.supplier_id,
+                'status': 'active',
+                'signing_date': datetime(2026, 1, 1) + timedelta(days=i),
+            }
+            for i in range(7)
+        ])
+        for model, collection in ((Contract, self.contracts), (Supplier, self.suppliers)):
+            patcher = patch.object(model, 'get_collection', return_value=collection)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_iterator_builds_models_lazily(self):
+        iterator = Contract.objects().iterator(batch_size=2)
+
+        first = next(iterator)
+        cursor = self.contracts.cursors[0]
+        self.assertEqual(first.number, '10000000')
+        self.assertEqual(cursor.batch_size_value, 2)
+        self.assertEqual(cursor.yielded, 1)
+        self.assertEqual(len(list(iterator)), 6)
+
+    def test_iterator_prefetches_per_batch(self):
+        contracts = list(Contract.objects().prefetch('supplier_id').iterator(batch_size=3))
+
+        self.assertEqual(len(contracts), 7)
+        self.assertEqual(len(self.suppliers.find_calls), 3)
+        self.assertTrue(all(c.get_related('supplier_id').name == 'Supplier' for c in contracts))
+
+    def test_values_returns_raw_rows_with_projection(self):
+        rows = list(Contract.objects().filter(number='10000001').values('id', 'number'))
+
+        self.assertEqual(rows, [{'id': self.contracts.docs[1]['_id'], 'number': '10000001'}])
+        self.assertEqual(self.contracts.projections[-1], {'_id': 1, 'number': 1})
+
+    def test_values_list_flat_and_tuples(self):
+        numbers = list(Contract.objects().limit(2).values_list('number', flat=True))
+        pairs = list(Contract.objects().limit(1).values_list('number', 'status'))
+
+        self.assertEqual(numbers, ['10000000', '10000001'])
+        self.assertEqual(pairs, [('10000000', 'active')])
+        self.assertEqual(self.contracts.projections[0], {'number': 1, '_id': 0})
+        with self.assertRaises(ValueError):
+            Contract.objects().values_list('number', 'status', flat=True)
+        with self.assertRaises(ValueError):
+            Contract.objects().values('missing')
+
+    def test_iterator_does_not_fill_identity_map(self):
+        with identity_map():
+            streamed = next(iter(Contract.objects()))
+            loaded = Contract.find_by_id(streamed.id)
+
+        self.assertIsNot(streamed, loaded)
+
+    def test_slicing_maps_to_skip_and_limit(self):
+        query = Contract.objects()[2:5]
+
+        self.assertEqual((query._skip_value, query._limit_value), (2, 3))
+        self.assertEqual([c.number for c in query.all()], ['10000002', '10000003', '10000004'])
+        self.assertEqual(len(query), 3)
+        self.assertEqual(Contract.objects()[1:][1].number, '10000002')
+        self.assertEqual(Contract.objects()[5:10].all()[-1].number, '10000006')
+        self.assertEqual(Contract.objects()[3:3].all(), [])
+        with self.assertRaises(IndexError):
+            Contract.objects()[10]
+
+    def test_paginate_after_builds_keyset_filter(self):
+        page = Contract.objects().filter(status='active').paginate_after(['-signing_date'], limit=3)
+        cursor = self.contracts.cursors[-1]
+        self.assertEqual(cursor.sort_value, [('signing_date', -1), ('_id', -1)])
+        self.assertEqual(cursor.limit_value, 4)
+        self.assertIsNone(page.prev_cursor)
+        self.assertIsNotNone(page.next_cursor)
+
+        last = page.items[-1]
+        Contract.objects().filter(status='active').paginate_after(['-signing_date'], page.next_cursor, limit=3)
+        self.assertEqual(self.contracts.find_calls[-1], {'$and': [{'status': 'active'}, {'$or': [
+            {'signing_date': {'$lt': last.signing_date}},
+            {'signing_date': last.signing_date, '_id': {'$lt': last.id}},
+        ]}]})
+
+    def test_paginate_after_rejects_bad_cursor(self):
+        with self.assertRaises(ValueError):
+            Contract.objects().paginate_after(['name'], 'not-a-cursor')
+
+    def test_len_fetches_once_and_iteration_reuses_results(self):
+        query = Contract.objects()
+
+        with patch.object(self.contracts, 'count_documents', side_effect=AssertionError):
+            self.assertEqual(len(query), 7)
+            self.assertTrue(query)
+            numbers = [contract.number for contract in list(query)]
+            self.assertEqual(len(Contract.objects().skip(5)), 2)
+            self.assertEqual(len(list(Contract.objects())), 7)
+
+        self.assertEqual(len(self.contracts.find_calls), 3)
+        self.assertEqual(numbers[0], '10000000')
+
+
+class DirtyTrackingTests(SimpleTestCase):
+
+    def setUp(self):
+        self.product_id = ObjectId()
+        self.doc = {
+            '_id': self.product_id,
+            'name': 'GPU',
+            'description': '',
+            'category': 'component',
+            'product_type': 'gpu',
+            'manufacturer': 'Asus',
+            'manufacturer_key': 'asus',
+            'specifications': [{'name': 'VRAM', 'value': '8GB'}],
+            'price': 500.0,
+            'quantity_in_stock': 3,
+            'warranty_months': 12,
+            'image_url': 'https://example.com/gpu.png',
+            'created_at': datetime(2026, 1, 1),
+            'updated_at': datetime(2026, 1, 1),
+        }
+        self.products = FakeCollection([self.doc])
+        patcher = patch.object(Product, 'get_collection', return_value=self.products)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_unchanged_instance_skips_write(self):
+        product = Product.find_by_id(self.product_id)
+        product.save()
+        self.assertEqual(self.products.updates, [])
+
+    def test_only_changed_fields_are_set(self):
+        product = Product.find_by_id(self.product_id)
+        product.quantity_in_stock -= 1
+        product.specifications.append({'name': 'TDP', 'value': '200W'})
+        product.save()
+
+        self.assertEqual(self.products.updates, [({'_id': self.product_id}, {'$set': {
+            'quantity_in_stock': 2,
+            'specifications': [{'name': 'VRAM', 'value': '8GB'}, {'name': 'TDP', 'value': '200W'}],
+        }})])
+
+        product.save()
+        self.assertEqual(len(self.products.updates), 1)
+
+    def test_fields_missing_in_document_are_dirty(self):
+        del self.doc['updated_at']
+        product = Product.find_by_id(self.product_id)
+        self.assertEqual(product.get_dirty_fields(), ['updated_at'])
+
+
+class BulkWriteTests(SimpleTestCase):
+
+    def setUp(self):
+        self.products = FakeCollection()
+        patcher = patch.object(Product, 'get_collection', return_value=self.products)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _product(self, name, **kwargs):
+        fields = {
+            'name': name,
+            'category': 'component',
+            'product_type': 'gpu',
+            'manufacturer': 'Asus',
+            'image_url': f'https://example.com/{name}.png',
+        }
+        return Product(**{**fields, **kwargs})
+
+    def test_bulk_create_inserts_once_and_assigns_ids(self):
+        products = Product.bulk_create([self._product('a'), self._product('b')])
+
+        self.assertEqual(len(self.products.docs), 2)
+        self.assertEqual([p.id for p in products], [doc['_id'] for doc in self.products.docs])
+        self.assertEqual(products[0].get_dirty_fields(), [])
+
+    def test_bulk_create_validates_whole_batch_first(self):
+        with self.assertRaises(ValueError):
+            Product.bulk_create([self._product('a'), self._product('b', product_type='tractor')])
+        self.assertEqual(self.products.docs, [])
+
+    def test_bulk_update_sends_one_bulk_write(self):
+        products = Product.bulk_create([self._product('a'), self._product('b')])
+        for product in products:
+            product.quantity_in_stock = 5
+
+        modified = Product.objects().bulk_update(products, ['quantity_in_stock'])
+
+        self.assertEqual(modified, 2)
+        operations, ordered = self.products.bulk_writes[0]
+        self.assertTrue(ordered)
+        self.assertEqual(operations, [
+            UpdateOne({'_id': product.id}, {'$set': {'quantity_in_stock': 5}}) for product in products
+        ])
+
+    def test_bulk_update_without_fields_uses_dirty_fields(self):
+        products = Product.bulk_create([self._product('a'), self._product('b')])
+        products[1].price = 10.0
+
+        Product.objects().bulk_update(products)
+
+        operations, _ = self.products.bulk_writes[0]
+        self.assertEqual(operations, [UpdateOne({'_id': products[1].id}, {'$set': {'price': 10.0}})])
+
+
+class UpdateOperatorTests(SimpleTestCase):
+
+    def setUp(self):
+        self.product_id = ObjectId()
+        self.products = FakeCollection([{'_id': self.product_id, 'name': 'GPU', 'quantity_in_stock': 3}])
+        patcher = patch.object(Product, 'get_collection', return_value=self.products)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_update_translates_operator_kwargs(self):
+        Product.objects().filter(id=self.product_id).update(
+            inc__quantity_in_stock=-2,
+            push__specifications={'name': 'TDP', 'value': '200W'},
+            unset__description=True,
+            set_on_insert__warranty_months=12,
+            name='GPU X',
+        )
+
+        self.assertEqual(self.products.updates[-1], ({'_id': self.product_id}, {
+            '$inc': {'quantity_in_stock': -2},
+            '$push': {'specifications': {'name': 'TDP', 'value': '200W'}},
+            '$unset': {'description': ''},
+            '$setOnInsert': {'warranty_months': 12},
+            '$set': {'name': 'GPU X'},
+        }))
+
+    def test_nested_paths_use_dots(self):
+        Product.objects().update(max__specifications__0__value='16GB')
+        self.assertEqual(self.products.updates[-1][1], {'$max': {'specifications.0.value': '16GB'}})
+
+    def test_find_one_and_update_with_guard(self):
+        products = Product.objects().filter(id=self.product_id).only('quantity_in_stock')
+
+        product = products.filter(quantity_in_stock__gte=2).find_one_and_update(inc__quantity_in_stock=-2)
+        self.assertEqual(product.quantity_in_stock, 1)
+
+        self.assertIsNone(products.filter(quantity_in_stock__gte=2).find_one_and_update(inc__quantity_in_stock=-2))
+
+    def test_update_requires_fields(self):
+        with self.assertRaises(ValueError):
+            Product.objects().update(id=self.product_id)
+
+
+class IndexSpecTests(SimpleTestCase):
+
+    def test_index_spec_formats(self):
+        from core.mongo_orm import _normalize_index
+
+        self.assertEqual(_normalize_index('-sale_date'), ([('sale_date', -1)], {'name': 'sale_date_-1'}))
+        self.assertEqual(_normalize_index(('sale_date', -1)), ([('sale_date', -1)], {'name': 'sale_date_-1'}))
+        self.assertEqual(
+            _normalize_index(['status', '-sale_date']),
+            ([('status', 1), ('sale_date', -1)], {'name': 'status_1_sale_date_-1'}),
+        )
+        self.assertEqual(
+            _normalize_index({'fields': 'expires_at', 'ttl': 0, 'partial': {'used': False}}),
+            ([('expires_at', 1)], {'name': 'expires_at_1', 'expireAfterSeconds': 0, 'partialFilterExpression': {'used': False}}),
+        )
+
+    def test_ensure_indexes_creates_missing_and_reports_extra(self):
+        collection = FakeCollection()
+        collection.index_information = lambda: {
+            '_id_': {'key': [('_id', 1)]},
+            'number_1': {'key': [('number', 1)], 'unique': True},
+            'legacy_1': {'key': [('legacy', 1)]},
+        }
+        collection.created = []
+        collection.create_index = lambda keys, **options: collection.created.append((keys, options))
+
+        with patch.object(Contract, 'get_collection', return_value=collection):
+            report = Contract.ensure_indexes()
+
+        self.assertEqual(report['existing'], ['number_1'])
+        self.assertEqual(report['extra'], ['legacy_1'])
+        self.assertIn(([('products.product_id', 1)], {'name': 'products.product_id_1'}), collection.created)
+        self.assertEqual(len(report['created']), len(Contract._indexes))
+
+    def test_ensure_indexes_reports_existing_index_with_different_options(self):
+        collection = FakeCollection()
+        collection.index_information = lambda: {
+            '_id_': {'key': [('_id', 1)]},
+            'number_1': {'key': [('number', 1)]},  # без unique
+        }
+        collection.create_index = lambda keys, **options: None
+
+        with patch.object(Contract, 'get_collection', return_value=collection):
+            report = Contract.ensure_indexes()
+
+        self.assertNotIn('number_1', report['existing'])
+        self.assertIn('unique=False (declared True)', report['errors']['number_1'])
+
+    def test_ensure_indexes_command_fails_on_errors(self):
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+
+        with self.assertRaises(CommandError):
+            call_command('ensure_indexes', model=['NoSuchModel'])
+
+        report = {'created': [], 'existing': [], 'extra': [], 'errors': {'number_1': 'boom'}}
+        with patch.object(Contract, 'ensure_indexes', return_value=report), self.assertRaises(CommandError):
+            call_command('ensure_indexes', model=['Contract'], stdout=MagicMock())
+
+
+class QueryProfilerTests(SimpleTestCase):
+    def test_mask_value_keeps_shape_not_data(self):
+        from core.query_profiler import mask_value
+
+        self.assertEqual(
+            mask_value({'status': {'$in': ['paid', 'pending']}, 'deleted': False, 'total': {'$gte': 10}}),
+            {'status': {'$in': ['<str>']}, 'deleted': False, 'total': {'$gte': '<int>'}},
+        )
+
+    def test_suggest_index_follows_esr(self):
+        from core.query_profiler import suggest_index
+
+        self.assertEqual(
+            suggest_index({'sale_date': {'$gte': '<datetime>'}, 'status': '<str>'}, [('created_at', -1)]),
+            ['status', '-created_at', 'sale_date'],
+        )
+        self.assertEqual(suggest_index({'category': '<str>'}, None), 'category')
+        self.assertIsNone(suggest_index({}, None))
+
+
+class HydrationTests(SimpleTestCase):
+    def setUp(self):
+        self.doc = {'_id': ObjectId(), 'name': 'Core i5', 'price': 199.0, 'legacy_code': 'X1'}
+
+    def test_generated_constructor_applies_defaults_and_extras(self):
+        product = Product._from_document(self.doc)
+
+        self.assertEqual(product.id, self.doc['_id'])
+        self.assertEqual(product.specifications, [])
+        self.assertEqual(product.quantity_in_stock, 0)
+        self.assertIsNotNone(product.created_at)
+        self.assertEqual(product.legacy_code, 'X1')
+        self.assertEqual(Product(id='abc', name='x').id, 'abc')
+
+    def test_read_only_returns_slotted_rows(self):
+        products = FakeCollection([self.doc])
+        with patch.object(Product, 'get_collection', return_value=products):
+            row = Product.objects().read_only().first()
+
+        self.assertEqual(type(row).__name__, 'ProductRow')
+        self.assertFalse(hasattr(row, '__dict__'))
+        self.assertEqual((row.id, row.name, row.specifications), (self.doc['_id'], 'Core i5', []))
+        self.assertEqual(row.to_model().name, 'Core i5')
+        self.assertEqual(row.to_dict()['id'], str(self.doc['_id']))
+
+
+class CompiledValidationTests(SimpleTestCase):
+    def test_field_validator_is_compiled_once(self):
+        from core.mongo_orm import StringField
+
+        field = StringField(max_length=5, regex=r'^[a-z]+$', choices=[('abc', 'ABC'), 'xyz'])
+
+        self.assertTrue(field.validate('abc'))
+        validator = field._validator
+        self.assertTrue(field.validate('xyz'))
+        self.assertIs(field._validator, validator)
+        for value in ('ABC', 'qwe', ['abc']):
+            with self.assertRaises(ValueError):
+                field.validate(value)
+
+    def test_embedded_validation_does_not_build_models(self):
+        from core.mongo_orm import EmbeddedField
+        from apps.main.models import ProductListItem
+
+        field = EmbeddedField(ProductListItem, required=True)
+        with patch.object(ProductListItem, '__init__', side_effect=AssertionError):
+            self.assertTrue(field.validate({'product_id': ObjectId(), 'quantity': 1}))
+        with self.assertRaises(ValueError):
+            field.validate(None)
+        with self.assertRaises(ValueError):
+            field.validate('item')
+
+
+class AggregationTests(SimpleTestCase):
+    def setUp(self):
+        self.sales = FakeCollection()
+        patcher = patch.object(Contract, 'get_collection', return_value=self.sales)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_group_by_compiles_match_unwind_and_group(self):
+        from core.mongo_orm import Count, Sum
+
+        supplier_id = ObjectId()
+        self.sales.aggregate_result = [{'_id': supplier_id, 'total': 7.0, 'n': 2}]
+
+        rows = Contract.objects().filter(status='active').unwind('products').group_by(
+            'supplier_id', total=Sum('products.unit_price'), n=Count()
+        )
+
+        self.assertEqual(rows, [{'supplier_id': supplier_id, 'total': 7.0, 'n': 2}])
+        self.assertEqual(self.sales.pipelines[0], [
+            {'$match': {'status': 'active'}},
+            {'$unwind': {'path': '$products', 'preserveNullAndEmptyArrays': False}},
+            {'$group': {'_id': '$supplier_id', 'total': {'$sum': '$products.unit_price'}, 'n': {'$sum': 1}}},
+        ])
+
+    def test_aggregate_and_shortcuts_use_empty_values(self):
+        from core.mongo_orm import Count, Sum
+
+        self.assertEqual(Contract.objects().aggregate(total=Sum('total_amount'), n=Count()), {'total': 0, 'n': 0})
+        self.assertIsNone(Contract.objects().max('total_amount'))
+        self.assertEqual(self.sales.pipelines[-1], [{'$group': {'_id': None, 'value': {'$max': '$total_amount'}}}])
+        with self.assertRaises(ValueError):
+            Contract.objects().aggregate(total='total_amount')
+
+    def test_facet_parses_each_branch(self):
+        from core.mongo_orm import Count, GroupBy
+
+        self.sales.aggregate_result = [{
+            'totals': [{'_id': None, 'n': 3}],
+            'by_status': [{'_id': 'active', 'n': 3}],
+        }]
+
+        result = Contract.objects().facet(totals={'n': Count()}, by_status=GroupBy('status', n=Count()))
+
+        self.assertEqual(result, {'totals': {'n': 3}, 'by_status': [{'status': 'active', 'n': 3}]})
+
+
+class ExistsAndCountTests(SimpleTestCase):
+    def setUp(self):
+        from core import mongo_orm
+
+        mongo_orm._count_cache.clear()
+        self.products = FakeCollection([{'_id': ObjectId(), 'name': 'Core i5', 'category': 'cpu'}])
+        self.products.count_calls = 0
+        count_documents = self.products.count_documents
+
+        def counting(query, **kwargs):
+            self.products.count_calls += 1
+            return count_documents(query, **kwargs)
+
+        self.products.count_documents = counting
+        patcher = patch.object(Product, 'get_collection', return_value=self.products)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_exists_fetches_only_id(self):
+        self.assertTrue(Product.objects().filter(name='Core i5').exists())
+        self.assertFalse(Product.objects().filter(name='Ryzen').exists())
+        self.assertEqual(self.products.projections, [{'_id': 1}, {'_id': 1}])
+
+    def test_count_cache_is_keyed_by_filter_and_reset_by_writes(self):
+        query = Product.objects().filter(category='cpu')
+
+        self.assertEqual(query.count(cache_ttl=30), 1)
+        self.assertEqual(query.count(cache_ttl=30), 1)
+        self.assertEqual(Product.objects().filter(category='gpu').count(cache_ttl=30), 0)
+        self.assertEqual(self.products.count_calls, 2)
+
+        Product.objects().filter(category='cpu').update(price=10.0)
+        query.count(cache_ttl=30)
+        self.assertEqual(self.products.count_calls, 3)
+
+    def test_count_cache_separates_collations(self):
+        query = Product.objects().filter(category='cpu')
+
+        query.count(cache_ttl=30)
+        query.collation({'locale': 'uk', 'strength': 2}).count(cache_ttl=30)
+        query.collation({'locale': 'uk', 'strength': 2}).count(cache_ttl=30)
+        self.assertEqual(self.products.count_calls, 2)
+
+    def test_estimated_count_uses_collection_metadata(self):
+        self.products.estimated_document_count = lambda **kwargs: 42
+
+        self.assertEqual(Product.estimated_count(), 42)
+
+
+class RequestQueryStatsTests(SimpleTestCase):
+    def setUp(self):
+        self.ids = [ObjectId() for _ in range(3)]
+        self.products = FakeCollection([{'_id': pk, 'name': f'P{n}'} for n, pk in enumerate(self.ids)])
+        patcher = patch.object(Product, 'get_collection', return_value=self.products)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_collector_records_shape_and_documents(self):
+        from core.query_profiler import collect_request_queries
+
+        with collect_request_queries() as queries:
+            for product in Product.objects().filter(name='P1'):
+                Product.find_by_id(product.id)
+            for pk in self.ids:
+                Product.find_by_id(pk)
+
+        self.assertEqual(queries.count, 5)
+        self.assertEqual([entry['docs'] for entry in queries.entries], [1, 1, 1, 1, 1])
+        ((collection, operation, _), n), = queries.repeated(3)
+        self.assertEqual((collection, operation, n), ('products', 'find_one', 4))
+
+    def test_middleware_sets_server_timing_and_warns_on_n_plus_one(self):
+        from django.http import HttpResponse
+        from django.test import RequestFactory
+        from apps.api.middleware import MongoQueryStatsMiddleware
+
+        def view(request):
+            for pk in self.ids:
+                Product.find_by_id(pk)
+            return HttpResponse('ok')
+
+        middleware = MongoQueryStatsMiddleware(view)
+        middleware.threshold = 3
+        with self.assertLogs('api', level='WARNING') as logs:
+            response = middleware(RequestFactory().get('/crm/sales/'))
+
+        self.assertRegex(response['Server-Timing'], r'^mongo;dur=[\d.]+;desc="3 queries"$')
+        self.assertIn('products.find_one', logs.output[0])
+
+
+class MetricsTests(SimpleTestCase):
+    def test_histogram_renders_cumulative_prometheus_buckets(self):
+        from core.metrics import MetricsRegistry
+
+        registry = MetricsRegistry()
+        latency = registry.histogram('demo_seconds', "Demo", ('route',), buckets=(0.01, 0.1))
+        latency.observe(0.005, route='a')
+        latency.observe(0.05, route='a')
+        latency.observe(3, route='a')
+
+        self.assertEqual(registry.render().splitlines(), [
+            '# HELP demo_seconds Demo',
+            '# TYPE demo_seconds histogram',
+            'demo_seconds_bucket{route="a",le="0.01"} 1',
+            'demo_seconds_bucket{route="a",le="0.1"} 2',
+            'demo_seconds_bucket{route="a",le="+Inf"} 3',
+            'demo_seconds_sum{route="a"} 3.055',
+            'demo_seconds_count{route="a"} 3',
+        ])
+
+    def test_command_listener_labels_by_collection(self):
+        from core.metrics import CommandMetricsListener, mongo_command_seconds
+
+        mongo_command_seconds.clear()
+        listener = CommandMetricsListener()
+        listener.started(SimpleNamespace(
+            command_name='find', command={'find': 'sales', 'filter': {}}, connection_id=('db', 27017), request_id=1,
+        ))
+        listener.succeeded(SimpleNamespace(
+            command_name='find', duration_micros=2500, connection_id=('db', 27017), request_id=1,
+        ))
+
+        self.assertIn(
+            'mongo_command_duration_seconds_count{collection="sales",command="find",outcome="success"} 1',
+            mongo_command_seconds.samples(),
+        )
+
+
+class MongoConnectionTests(SimpleTestCase):
+    def test_client_is_created_lazily_and_again_after_fork(self):
+        from core import mongo_connection as module
+
+        connection = module.MongoConnection()
+        connection.close()
+        self.addCleanup(connection.close)
+        clients = []
+
+        def fake_client(uri, **options):
+            clients.append(options)
+            return MagicMock()
+
+        env = {'MONGODB_MAX_POOL_SIZE': '8', 'MONGODB_COMPRESSORS': 'zlib'}
+        with patch.object(module, 'MongoClient', side_effect=fake_client), patch.dict('os.environ', env):
+            db = module.get_db()
+            self.assertIs(module.get_db(), db)
+            with patch.object(module.os, 'getpid', return_value=-1):
+                self.assertIsNot(module.get_db(), db)
+
+        self.assertEqual(len(clients), 2)
+        self.assertEqual((clients[0]['maxPoolSize'], clients[0]['compressors']), (8, 'zlib'))
+        self.assertNotIn('minPoolSize', clients[0])
+
+
+class ReadPreferenceTests(SimpleTestCase):
+    def test_reads_from_routes_model_collections(self):
+        from pymongo.read_preferences import SecondaryPreferred
+        from core.mongo_orm import reads_from
+
+        db = {'products': MagicMock()}
+        with patch('core.mongo_orm.get_db', return_value=db):
+            self.assertIs(Product.get_collection(), db['products'])
+            with reads_from(SecondaryPreferred(max_staleness=120)):
+                Product.get_collection()
+
+        (_, kwargs), = db['products'].with_options.call_args_list
+        self.assertEqual(kwargs['read_preference'], SecondaryPreferred(max_staleness=120))
+
+    def test_using_resolves_routes_and_rejects_unknown_modes(self):
+        from pymongo.read_preferences import Primary
+
+        from core.mongo_orm import QuerySet
+
+        collection = MagicMock()
+        query = QuerySet(Product, collection).filter(category='cpu').using('primary')
+        collection.with_options.assert_called_once_with(read_preference=Primary())
+        self.assertEqual(query._filter, {'category': 'cpu'})
+
+        with self.assertRaises(ValueError):
+            QuerySet(Product, collection).using('replica')
+
+
+class CursorOptionTests(SimpleTestCase):
+    def setUp(self):
+        self.products = FakeCollection([{'_id': ObjectId(), 'name': 'Core i5', 'category': 'cpu'}])
+        patcher = patch.object(Product, 'get_collection', return_value=self.products)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_options_are_passed_to_find_and_count(self):
+        from core.mongo_orm import query_comment
+
+        query = Product.objects().filter(category='cpu').hint(['category', '-created_at']) \
+            .max_time_ms(500).batch_size(100).collation({'locale': 'uk'})
+        with query_comment('apps.main.views.catalog'):
+            query.all()
+            query.count()
+
+        self.assertEqual(self.products.options, [
+            {'hint': [('category', 1), ('created_at', -1)], 'collation': {'locale': 'uk'},
+             'comment': 'apps.main.views.catalog', 'max_time_ms': 500, 'batch_size': 100},
+            {'hint': [('category', 1), ('created_at', -1)], 'collation': {'locale': 'uk'},
+             'comment': 'apps.main.views.catalog', 'maxTimeMS': 500},
+        ])
+
+    def test_default_deadline_can_be_disabled_and_aggregate_allows_disk_use(self):
+        from core.mongo_connection import DEFAULT_MAX_TIME_MS
+
+        Product.objects().first()
+        Product.objects().max_time_ms(None).comment('export').aggregate([{'$match': {}}], allow_disk_use=True)
+
+        self.assertEqual(self.products.options, [
+            {'max_time_ms': DEFAULT_MAX_TIME_MS},
+            {'comment': 'export', 'allowDiskUse': True},
+        ])
+
+    def test_streaming_reads_skip_default_deadline(self):
+        from core.mongo_connection import DEFAULT_MAX_TIME_MS
+
+        list(Product.objects().iterator(batch_size=10))
+        list(Product.objects().values('name', batch_size=10))
+        list(Product.objects().values_list('name'))
+        list(Product.objects().max_time_ms(500).iterator())
+
+        self.assertEqual(self.products.options, [
+            {}, {}, {'max_time_ms': DEFAULT_MAX_TIME_MS}, {'max_time_ms': 500},
+        ])
+
+
+class StaleWhileRevalidateTests(SimpleTestCase):
+    def test_stale_value_is_served_while_refreshing(self):
+        from django.core.cache import cache
+        from apps.api import cache as swr
+
+        cache.delete('test:swr')
+        self.addCleanup(cache.delete, 'test:swr')
+        values = iter([1, 2])
+        clock = [1000.0]
+
+        def run_now(target, args, daemon):
+            return SimpleNamespace(start=lambda: target(*args))
+
+        with patch.object(swr.time, 'time', lambda: clock[0]), patch.object(swr.threading, 'Thread', run_now):
+            self.assertEqual(swr.cached_with_revalidate('test:swr', lambda: next(values), 60, 600), 1)
+            self.assertEqual(swr.cached_with_revalidate('test:swr', lambda: next(values), 60, 600), 1)
+            clock[0] += 61
+            self.assertEqual(swr.cached_with_revalidate('test:swr', lambda: next(values), 60, 600), 1)
+            self.assertEqual(swr.cached_with_revalidate('test:swr', lambda: next(values), 60, 600), 2)
+
+    def test_failed_analytics_build_is_not_cached(self):
+        import json
+        from django.core.cache import cache
+        from django.test import RequestFactory
+        from apps.api import cache as swr
+        from apps.api.views import analytics_views
+
+        cache.delete('api:analytics')
+        self.addCleanup(cache.delete, 'api:analytics')
+        request = RequestFactory().get('/api/analytics/')
+        good = {**analytics_views.empty_analytics(), 'repair_counts': [1, 2, 3, 4, 5]}
+        clock = [1000.0]
+
+        def run_now(target, args, daemon):
+            return SimpleNamespace(start=lambda: target(*args))
+
+        with patch.object(swr.time, 'time', lambda: clock[0]), patch.object(swr.threading, 'Thread', run_now):
+            # Перший запит без кешу: порожні графіки, але нічого не кешується
+            with patch.object(analytics_views, 'build_analytics', side_effect=RuntimeError('secondary down')):
+                response = analytics_views.analytics_api(request)
+            self.assertEqual(json.loads(response.content)['repair_counts'], [0] * 5)
+            self.assertIsNone(cache.get('api:analytics'))
+
+            with patch.object(analytics_views, 'build_analytics', return_value=good):
+                analytics_views.analytics_api(request)
+
+            # Невдалий фоновий перерахунок залишає попереднє значення
+            clock[0] += 61
+            with patch.object(analytics_views, 'build_analytics', side_effect=RuntimeError('secondary down')):
+                response = analytics_views.analytics_api(request)
+            self.assertEqual(json.loads(response.content)['repair_counts'], [1, 2, 3, 4, 5])
+            self.assertEqual(cache.get('api:analytics')['value'], good)
+
+
+class SalesRollupTests(SimpleTestCase):
+    def test_status_change_moves_contribution_between_rows(self):
+        from pymongo import DeleteOne
+        from apps.crm import rollups
+        from apps.crm.models import SaleDailyRollup
+
+        employee_id, product_id = ObjectId(), ObjectId()
+        products = {product_id: ('component', 'gpu')}
+        sale = {
+            'sale_date': datetime(2026, 10, 2, 15, 30),
+            'status': 'pending',
+            'payment_method': 'card',
+            'employee_id': str(employee_id),
+            'total_amount': 250.0,
+            'products': [{'product_id': product_id, 'quantity': 2, 'unit_price': 125.0}],
+        }
+        before = rollups.sale_contribution(sale, products)
+        after = rollups.sale_contribution({**sale, 'status': 'paid'}, products)
+
+        day = datetime(2026, 10, 2)
+        self.assertEqual(before, {
+            (day, 'pending', 'card', None, None, employee_id): {'revenue': 250.0, 'sales': 1},
+            (day, 'pending', 'card', 'component', 'gpu', employee_id): {'units': 2, 'line_revenue': 250.0},
+        })
+
+        rows = FakeCollection()
+        with patch.object(SaleDailyRollup, 'get_collection', return_value=rows):
+            rollups.apply_delta(before, after)
+
+        operations, ordered = rows.bulk_writes[0]
+        self.assertTrue(ordered)
+        self.assertIn(UpdateOne(
+            dict(zip(rollups.KEY_FIELDS, (day, 'paid', 'card', None, None, employee_id))),
+            {'$inc': {'revenue': 250.0, 'sales': 1}}, upsert=True,
+        ), operations)
+        self.assertIn(UpdateOne(
+            dict(zip(rollups.KEY_FIELDS, (day, 'pending', 'card', 'component', 'gpu', employee_id))),
+            {'$inc': {'units': -2, 'line_revenue': -250.0}}, upsert=True,
+        ), operations)
+        self.assertEqual(sum(isinstance(op, DeleteOne) for op in operations), 2)
+
+    def test_stored_contribution_uses_snapshot_after_recategorization(self):
+        from apps.crm import rollups
+        from apps.crm.models import Sale
+
+        sale_id, product_id, employee_id = ObjectId(), ObjectId(), ObjectId()
+        sales = FakeCollection([{
+            '_id': sale_id,
+            'sale_date': datetime(2026, 10, 2, 15, 30),
+            'status': 'paid',
+            'payment_method': 'card',
+            'employee_id': employee_id,
+            'total_amount': 100.0,
+            'products': [{'product_id': product_id, 'quantity': 1, 'unit_price': 100.0}],
+            'rollup_products': {str(product_id): ['component', 'gpu']},
+        }])
+        # Продукт після продажу перенесли в іншу категорію
+        products = FakeCollection([{'_id': product_id, 'category': 'peripheral', 'product_type': 'mouse'}])
+        with patch.object(Sale, 'get_collection', return_value=sales), \
+                patch.object(Product, 'get_collection', return_value=products):
+            before = rollups.stored_contribution(sale_id)
+
+        self.assertEqual(products.find_calls, [])
+        self.assertIn((datetime(2026, 10, 2), 'paid', 'card', 'component', 'gpu', employee_id), before)
+
+
+    def test_bulk_update_writes_one_rollup_delta_for_the_batch(self):
+        from apps.crm import rollups
+        from apps.crm.models import Sale, SaleDailyRollup
+
+        product_id, employee_id = ObjectId(), ObjectId()
+        docs = [{
+            '_id': ObjectId(),
+            'user_id': ObjectId(),
+            'sale_date': datetime(2026, 10, 2, hour),
+            'status': 'pending',
+            'payment_method': 'card',
+            'employee_id': employee_id,
+            'total_amount': 50.0,
+            'products': [{'product_id': product_id, 'quantity': 1, 'unit_price': 50.0}],
+        } for hour in (9, 10, 11)]
+        sales = FakeCollection(docs)
+        products = FakeCollection([{'_id': product_id, 'category': 'component', 'product_type': 'gpu'}])
+        rows = FakeCollection()
+        with patch.object(Sale, 'get_collection', return_value=sales), \
+                patch.object(Product, 'get_collection', return_value=products), \
+                patch.object(SaleDailyRollup, 'get_collection', return_value=rows):
+            batch = list(Sale.objects())
+            for sale in batch:
+                sale.status = 'paid'
+            Sale.objects().bulk_update(batch)
+
+        # Читання пачки + один запит збережених документів
+        self.assertEqual(len(sales.find_calls), 2)
+        self.assertEqual(len(products.find_calls), 1)
+        (operations, _), = rows.bulk_writes
+        paid = dict(zip(rollups.KEY_FIELDS, (datetime(2026, 10, 2), 'paid', 'card', None, None, employee_id)))
+        self.assertIn(UpdateOne(paid, {'$inc': {'revenue': 150.0, 'sales': 3}}, upsert=True), operations)
+        self.assertEqual(batch[0].rollup_products, {str(product_id): ['component', 'gpu']})
+
+
+class ManufacturerKeyTests(SimpleTestCase):
+    def test_pre_save_stores_normalized_key_for_prefix_range(self):
+        products = FakeCollection()
+        product = Product(
+            name='rog', category='component', product_type='gpu',
+            manufacturer='  ASUS  Tek ', image_url='https://example.com/rog.png',
+        )
+        with patch.object(Product, 'get_collection', return_value=products):
+            Product.bulk_create([product])
+
+        self.assertEqual(products.docs[0]['manufacturer_key'], 'asus tek')
+        self.assertEqual(
+            Product.objects().filter(**Product.manufacturer_filter(' Asus '))._filter,
+            {'manufacturer_key': {'$gte': 'asus', '$lt': 'asus\U0010ffff'}},
+        )
+
+
+class ChangeStockTests(SimpleTestCase):
+    OPERATORS = {
+        '$ifNull': lambda value, default: default if value is None else value,
+        '$add': lambda a, b: a + b,
+        '$subtract': lambda a, b: a - b,
+        '$max': max,
+    }
+
+    def _evaluate(self, expression, doc):
+        """Мінімальний обчислювач виразів pipeline-update для перевірки результату"""
+        if isinstance(expression, str) and expression.startswith('$'):
+            return doc.get(expression[1:])
+        if isinstance(expression, dict):
+            (operator, args), = expression.items()
+            return self.OPERATORS[operator](*(self._evaluate(arg, doc) for arg in args))
+        return expression
+
+    def _stock_after(self, docs, items, direction):
+        from apps.crm.views import change_stock
+
+        products = FakeCollection(docs)
+        with patch.object(Product, 'get_collection', return_value=products):
+            change_stock(items, direction)
+
+        (operations, ordered), = products.bulk_writes
+        self.assertFalse(ordered)
+        stock = {}
+        for operation in operations:
+            doc = next(doc for doc in docs if doc['_id'] == operation._filter['_id'])
+            (stage,) = operation._doc
+            stock[doc['_id']] = self._evaluate(stage['$set']['quantity_in_stock'], doc)
+        return stock
+
+    def test_decrement_clamps_at_zero_and_treats_missing_stock_as_zero(self):
+        enough, short, null, missing = ObjectId(), ObjectId(), ObjectId(), ObjectId()
+        docs = [
+            {'_id': enough, 'quantity_in_stock': 5},
+            {'_id': short, 'quantity_in_stock': 1},
+            {'_id': null, 'quantity_in_stock': None},
+            {'_id': missing},
+        ]
+        items = [{'product_id': str(product_id), 'quantity': 2} for product_id in (enough, short, null, missing)]
+
+        self.assertEqual(self._stock_after(docs, items, -1), {enough: 3, short: 0, null: 0, missing: 0})
+
+    def test_increment_adds_to_null_stock(self):
+        product_id = ObjectId()
+        stock = self._stock_after([{'_id': product_id, 'quantity_in_stock': None}], [{'product_id': product_id, 'quantity': 3}], 1)
+
+        self.assertEqual(stock, {product_id: 3})
+
+
+class QueryViewsTests(SimpleTestCase):
+    def _context(self, view, collections, path='/crm/queries/', post=None):
+        """Виконати view з підміненими колекціями ({модель: колекція}) та повернути контекст шаблону"""
+        from contextlib import ExitStack
+        from django.test import RequestFactory
+        from apps.crm import queries_views
+
+        request = RequestFactory().post(path, post) if post is not None else RequestFactory().get(path)
+        request.user = SimpleNamespace(role='admin', is_authenticated=True)
+        rendered = {}
+
+        def render(request, template, context):
+            rendered.update(context)
+
+        with ExitStack() as stack:
+            stack.enter_context(patch.object(queries_views, 'render', render))
+            for model, collection in collections.items():
+                stack.enter_context(patch.object(model, 'get_collection', return_value=collection))
+            view(request)
+        return rendered
+
+    def test_suppliers_with_products_groups_contract_lines_on_server(self):
+        from apps.crm.queries_views import query1_suppliers_with_products
+
+        supplier_id, other_id = ObjectId(), ObjectId()
+        product = {'_id': ObjectId(), 'name': 'RTX', 'manufacturer': 'nvidia', 'product_type': 'gpu'}
+        contracts = FakeCollection()
+        contracts.aggregate_result = [{'_id': supplier_id, 'products': [
+            {'product': product, 'quantity': 3, 'unit_price': 10.5, 'subtotal': 31.5},
+        ]}]
+        suppliers = FakeCollection([{'_id': supplier_id, 'name': 'A'}, {'_id': other_id, 'name': 'B'}])
+
+        context = self._context(query1_suppliers_with_products, {Contract: contracts, Supplier: suppliers})
+
+        (pipeline,) = contracts.pipelines
+        groups = [stage['$group'] for stage in pipeline if '$group' in stage]
+        self.assertEqual(set(groups[0]['_id']), {'supplier_id', 'product_id'})
+        self.assertEqual(groups[1]['_id'], '$_id.supplier_id')
+        self.assertIn('subtotal', groups[1]['products']['$push'])
+        self.assertEqual(len(suppliers.find_calls), 1)
+
+        first, second = context['results']
+        self.assertEqual(first['supplier'].id, supplier_id)
+        self.assertEqual(first['total_products'], 1)
+        self.assertEqual(first['products'][0]['product']['name'], 'RTX')
+        self.assertEqual(first['products'][0]['subtotal'], 31.5)
+        self.assertEqual((second['products'], second['total_products']), ([], 0))
+
+    def test_components_multiple_suppliers_filters_on_server(self):
+        from apps.crm.queries_views import query1_components_multiple_suppliers
+
+        row = {
+            '_id': ObjectId(),
+            'product': {'name': 'RTX', 'manufacturer': 'nvidia', 'product_type': 'gpu'},
+            'suppliers': [{'_id': ObjectId(), 'name': 'A'}, {'_id': ObjectId(), 'name': 'B'}],
+            'suppliers_count': 2,
+        }
+        contracts = FakeCollection()
+        contracts.aggregate_result = [row]
+
+        context = self._context(query1_components_multiple_suppliers, {Contract: contracts})
+
+        (pipeline,) = contracts.pipelines
+        self.assertIn('$addToSet', next(stage['$group'] for stage in pipeline if '$group' in stage)['supplier_ids'])
+        self.assertIn({'$match': {'_id': {'$ne': None}, 'supplier_ids.1': {'$exists': True}}}, pipeline)
+        project = next(stage['$project'] for stage in pipeline if '$project' in stage)
+        self.assertEqual(project['suppliers_count'], {'$size': '$supplier_ids'})
+
+        (result,) = context['results']
+        self.assertEqual(result['product']['name'], 'RTX')
+        self.assertEqual([supplier['name'] for supplier in result['suppliers']], ['A', 'B'])
+        self.assertEqual(result['suppliers_count'], 2)
+
+    def test_customers_by_manufacturer_matches_mixed_product_ids(self):
+        from apps.crm.models import Sale
+        from apps.crm.queries_views import query2_customers_by_manufacturer
+
+        rog, tuf, other = ObjectId(), ObjectId(), ObjectId()
+        products = FakeCollection([
+            {'_id': rog, 'name': 'ROG', 'manufacturer_key': 'asus'},
+            {'_id': tuf, 'name': 'TUF', 'manufacturer_key': 'asus tek'},
+            {'_id': other, 'name': 'MSI', 'manufacturer_key': 'msi'},
+        ])
+        sales = FakeCollection()
+        # Сервер повертає product_id вже приведеним до ObjectId
+        sales.aggregate_result = [{
+            '_id': ObjectId(),
+            'customer': {'username': 'ann', 'email': 'ann@example.com'},
+            'purchases': [
+                {'product_id': rog, 'sale': {'sale_date': datetime(2026, 10, 1), 'total_amount': 10.0}},
+                {'product_id': tuf, 'sale': {'sale_date': datetime(2026, 10, 2), 'total_amount': 20.0}},
+                {'product_id': None, 'sale': {'sale_date': datetime(2026, 10, 3), 'total_amount': 5.0}},
+            ],
+            'total_purchases': 3,
+        }]
+
+        context = self._context(
+            query2_customers_by_manufacturer, {Product: products, Sale: sales},
+            path='/crm/queries/2/?manufacturer=Asus',
+        )
+
+        (pipeline,) = sales.pipelines
+        product_ids = pipeline[0]['$match']['products.product_id']['$in']
+        self.assertEqual(set(product_ids), {rog, tuf, str(rog), str(tuf)})
+        self.assertEqual(pipeline[3], pipeline[0])  # повторний $match після $unwind
+        group = next(stage['$group'] for stage in pipeline if '$group' in stage)
+        self.assertEqual(group['purchases']['$push']['product_id'], as_object_id('products.product_id'))
+
+        (row,) = context['results']
+        self.assertEqual(context['manufacturer'], 'Asus')
+        self.assertEqual([purchase['product_name'] for purchase in row['purchases']], ['ROG', 'TUF', 'Unknown'])
+
+    def test_custom_aggregation_runs_with_orm_deadline(self):
+        import json
+        from core.mongo_orm import DEFAULT_MAX_TIME_MS
+        from apps.crm.queries_views import execute_aggregation
+
+        from apps.crm.models import Sale
+
+        sales = FakeCollection()
+        sales.aggregate_result = [{'_id': 'paid', 'n': 2}]
+        context = self._context(execute_aggregation, {Sale: sales}, post={
+            'collection': 'sales',
+            'pipeline': json.dumps([{'$group': {'_id': '$status', 'n': {'$sum': 1}}}]),
+        })
+
+        self.assertEqual(sales.pipelines, [[{'$group': {'_id': '$status', 'n': {'$sum': 1}}}]])
+        self.assertEqual(sales.options[0]['maxTimeMS'], DEFAULT_MAX_TIME_MS)
+        self.assertTrue(sales.options[0]['allowDiskUse'])
+        self.assertEqual(context['results'], [{'_id': 'paid', 'n': 2}])
@@ -1,5 +1,6 @@
 # apps/api/urls.py
 from django.urls import path, include
+from apps.api.views.metrics_views import metrics_view
 
 app_name = 'api'
 
@@ -8,4 +9,5 @@ urlpatterns = [
     path('user/', include('apps.api.urls.user_urls')),
     path('analytics/', include('apps.api.urls.analytics_urls')),
     path('order/', include('apps.api.urls.order_urls')),
+    path('metrics/', metrics_view, name='metrics'),
 ]
\ No newline at end of file
@@ -1,118 +1,115 @@
 # apps/api/views/analytics_views.py
+import logging
+
 from django.http import JsonResponse
-from datetime import timedelta
 from django.utils import timezone
-from apps.crm.models import Sale, Repair
-from apps.main.models import User, Product
+from apps.api.cache import cached_with_revalidate
+from apps.crm.models import Repair, SaleDailyRollup
+from apps.main.models import User
+from core.mongo_orm import Count, GroupBy, Sum, reads_from
+
+# Дані графіків кешуються: ANALYTICS_CACHE_SECONDS віддаються як є,
+# ще ANALYTICS_STALE_SECONDS - застарілі, поки у фоні рахуються нові
+ANALYTICS_CACHE_SECONDS = 60
+ANALYTICS_STALE_SECONDS = 600
+ANALYTICS_MONTHS = 6
+
+REPAIR_STATUSES = ('received', 'diagnosed', 'repairing', 'completed', 'returned')
+REPAIR_LABELS = ['Received', 'Diagnosed', 'Repairing', 'Completed', 'Returned']
+
+logger = logging.getLogger('api')
+
 
 def analytics_api(request):
-    now = timezone.now()
-
-    # --- Revenue per month (6 місяців) ---
-    months = []
-    revenue = []
-    for i in range(6):
-        # беремо початок місяця i місяців назад
-        month_start = (now - timedelta(days=30 * i)).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        # груба межа наступного місяця
-        if month_start.month == 12:
-            month_end = month_start.replace(year=month_start.year + 1, month=1)
-        else:
-            month_end = month_start.replace(month=month_start.month + 1)
-
-        months.append(month_start.strftime("%b %Y"))
-
-        total_for_month = 0
-        try:
-            # Фільтруємо продажі за sale_date та сумуємо total_amount
-            sales = Sale.objects().filter(
-                sale_date__gte=month_start,
-                sale_date__lt=month_end,
-                status__in=['paid', 'pending']
-            ).all()
-            total_for_month = sum(float(sale.total_amount or 0) for sale in sales)
-        except Exception:
-            total_for_month = 0
-
-        revenue.append(total_for_month)
-
-    # --- Sales per category (продажі по категоріям продуктів) ---
-    cat_labels = []
-    cat_values = []
     try:
-        # Підраховуємо продажі по категоріям продуктів
-        cats = {}
-        sales = Sale.objects().filter(status__in=['paid', 'pending']).all()
-        for sale in sales:
-            if hasattr(sale, 'products') and sale.products:
-                for product_item in sale.products:
-                    if isinstance(product_item, dict):
-                        product_id = product_item.get('product_id')
-                    else:
-                        product_id = getattr(product_item, 'product_id', None)
-                    
-                    if product_id:
-                        try:
-                            product = Product.find_by_id(str(product_id))
-                            if product:
-                                cat = getattr(product, 'category', 'Uncategorized')
-                                quantity = product_item.get('quantity', 0) if isinstance(product_item, dict) else getattr(product_item, 'quantity', 0)
-                                cats[cat] = cats.get(cat, 0) + int(quantity or 0)
-                        except Exception:
-                            pass
-        
-        # Перетворимо словник у списки
-        for k, v in sorted(cats.items(), key=lambda x: x[1], reverse=True)[:10]:  # Топ 10 категорій
-            cat_labels.append(k)
-            cat_values.append(v)
-    except Exception:
-        pass
+        result = cached_with_revalidate(
+            'api:analytics',
+            build_analytics,
+            ANALYTICS_CACHE_SECONDS,
+            ANALYTICS_STALE_SECONDS,
+        )
+    except Exception as e:
+        # Кешу ще немає, а рахунок не вдався - порожні графіки без кешування,
+        # наступний запит спробує знову
+        logger.error(f"Analytics build failed: {e}")
+        result = empty_analytics()
+    return JsonResponse(result)
+
+
+def _month_starts(now, count):
+    """Початки останніх count календарних місяців (від найстарішого до поточного)"""
+    year, month = now.year, now.month
+    starts = []
+    for _ in range(count):
+        starts.append(now.replace(year=year, month=month, day=1, hour=0, minute=0, second=0, microsecond=0))
+        year, month = (year - 1, 12) if month == 1 else (year, month - 1)
+    return starts[::-1]
+
+
+def _month_key(path):
+    """Вираз Mongo: дата -> 'YYYY-MM' (UTC)"""
+    return {'$dateToString': {'format': '%Y-%m', 'date': f'${path}'}}
+
+
+@reads_from('reporting')
+def build_analytics(now=None):
+    """
+    Дані для графіків аналітики трьома агрегаціями на сервері:
+    денні підсумки продажів ($facet: виручка по місяцях та топ категорій),
+    ремонти по статусах та нові клієнти по місяцях
+
+    Помилки не перехоплюються: cached_with_revalidate не кешує невдалий
+    рахунок і залишає попереднє значення.
+    """
+    now = now or timezone.now()
+    months = _month_starts(now, ANALYTICS_MONTHS)
+    month_keys = [f"{month:%Y-%m}" for month in months]
+    month_labels = [month.strftime("%b %Y") for month in months]
+
+    # --- Revenue per month та Sales per category (один запит до sales_daily_rollups) ---
+    by_month = GroupBy({'month': _month_key('date')}, total=Sum('revenue'))
+    sales = SaleDailyRollup.objects().filter(status__in=['paid', 'pending']).facet(
+        revenue=[{'$match': {'date': {'$gte': months[0]}}}] + by_month.stages(),
+        categories=[
+            {'$match': {'category': {'$ne': None}}},
+            {'$group': {'_id': '$category', 'quantity': {'$sum': '$units'}}},
+            {'$sort': {'quantity': -1}},
+            {'$limit': 10},  # Топ 10 категорій
+        ],
+    )
+    totals = {row['month']: row['total'] for row in by_month.parse(sales['revenue'])}
 
     # --- Repairs count breakdown (by status) ---
-    repair_labels = ['Received', 'Diagnosed', 'Repairing', 'Completed', 'Returned']
-    repair_counts = [0, 0, 0, 0, 0]
-    try:
-        repair_counts[0] = Repair.objects().filter(status='received').count()
-        repair_counts[1] = Repair.objects().filter(status='diagnosed').count()
-        repair_counts[2] = Repair.objects().filter(status='repairing').count()
-        repair_counts[3] = Repair.objects().filter(status='completed').count()
-        repair_counts[4] = Repair.objects().filter(status='returned').count()
-    except Exception:
-        repair_counts = [0, 0, 0, 0, 0]
+    by_status = {row['status']: row['count'] for row in Repair.objects().group_by('status', count=Count())}
 
     # --- New customers per month (користувачі з role='user') ---
-    cust_labels = []
-    cust_values = []
-    for i in range(6):
-        month_start = (now - timedelta(days=30 * i)).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        if month_start.month == 12:
-            month_end = month_start.replace(year=month_start.year + 1, month=1)
-        else:
-            month_end = month_start.replace(month=month_start.month + 1)
-        
-        cust_labels.append(month_start.strftime("%b %Y"))
-        
-        try:
-            # Підраховуємо користувачів з role='user' (не адмінів та не операторів)
-            users = User.objects().filter(
-                created_at__gte=month_start,
-                created_at__lt=month_end,
-                role='user'
-            ).all()
-            cust_values.append(len(users))
-        except Exception:
-            cust_values.append(0)
-
-    # Повертаємо результати (зворотній порядок щоб від найстарішого до останнього місяця)
-    result = {
-        "revenue_months": months[::-1] if months else [],
-        "revenue_values": revenue[::-1] if revenue else [],
-        "category_labels": cat_labels if cat_labels else [],
-        "category_sales": cat_values if cat_values else [],
-        "repair_labels": repair_labels if repair_labels else [],
-        "repair_counts": repair_counts if repair_counts else [],
-        "customer_labels": cust_labels[::-1] if cust_labels else [],
-        "customer_counts": cust_values[::-1] if cust_values else [],
+    rows = User.objects().filter(role='user', created_at__gte=months[0]).group_by(
+        {'month': _month_key('created_at')}, count=Count()
+    )
+    customers = {row['month']: row['count'] for row in rows}
+
+    return {
+        "revenue_months": month_labels,
+        "revenue_values": [float(totals.get(key) or 0) for key in month_keys],
+        "category_labels": [row['_id'] for row in sales['categories']],
+        "category_sales": [int(row['quantity'] or 0) for row in sales['categories']],
+        "repair_labels": REPAIR_LABELS,
+        "repair_counts": [by_status.get(status, 0) for status in REPAIR_STATUSES],
+        "customer_labels": month_labels,
+        "customer_counts": [customers.get(key, 0) for key in month_keys],
+    }
+
+
+def empty_analytics(now=None):
+    """Порожні графіки (нулі) - відповідь, якщо даних ще немає і рахунок не вдався"""
+    month_labels = [month.strftime("%b %Y") for month in _month_starts(now or timezone.now(), ANALYTICS_MONTHS)]
+    return {
+        "revenue_months": month_labels,
+        "revenue_values": [0.0] * len(month_labels),
+        "category_labels": [],
+        "category_sales": [],
+        "repair_labels": REPAIR_LABELS,
+        "repair_counts": [0] * len(REPAIR_STATUSES),
+        "customer_labels": month_labels,
+        "customer_counts": [0] * len(month_labels),
     }
-    
-    return JsonResponse(result)
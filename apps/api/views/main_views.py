@@ -11,6 +11,7 @@ from django.template.loader import render_to_string
 from django.conf import settings
 from datetime import datetime
 import re
+from bson import ObjectId
 
 from apps import api
 from apps.api.authentication.permissions import IsAdminOrReadOnly
@@ -76,6 +77,11 @@ def delete_product_category(request, pk):
 
 # ====== Product Views ======
 
+PRODUCT_SORT_FIELDS = ('price', 'created_at', 'name')
+PRODUCTS_PAGE_SIZE = 20
+PRODUCTS_MAX_PAGE_SIZE = 100
+
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def list_products(request):
@@ -89,8 +95,9 @@ def list_products(request):
     - search: Пошук по назві
     - in_stock: true/false (в наявності)
     - sort_by: price, -price, created_at, -created_at, name, -name
-    - limit: Кількість результатів
-    - skip: Пропустити N записів
+    - limit: Кількість результатів (за замовчуванням 20, максимум 100)
+    - cursor: Токен next/prev з попередньої відповіді (keyset пагінація)
+    - skip: Пропустити N записів (стара offset пагінація, без next/prev)
     """
     products = Product.objects()
     
@@ -123,29 +130,48 @@ def list_products(request):
     
     # Сортування
     sort_by = request.GET.get('sort_by', '-created_at')
-    products = products.order_by(sort_by)
+    if sort_by.lstrip('-') not in PRODUCT_SORT_FIELDS:
+        return Response({'error': f"sort_by має бути одним з: {', '.join(PRODUCT_SORT_FIELDS)}"}, status=400)
     
     # Пагінація
     limit = request.GET.get('limit')
-    if limit:
-        try:
-            products = products.limit(int(limit))
-        except ValueError:
-            return Response({'error': 'limit має бути числом'}, status=400)
-    
     skip = request.GET.get('skip')
+    
     if skip:
+        products = products.order_by(sort_by)
+        if limit:
+            try:
+                products = products.limit(int(limit))
+            except ValueError:
+                return Response({'error': 'limit має бути числом'}, status=400)
         try:
             products = products.skip(int(skip))
         except ValueError:
             return Response({'error': 'skip має бути числом'}, status=400)
+        
+        data = [ProductViewSerializer(p).data for p in products.all()]
+        return Response({
+            'count': len(data),
+            'results': data
+        })
     
-    # Отримуємо результати
-    product_list = products.all()
-    data = [ProductViewSerializer(p).data for p in product_list]
+    # Keyset пагінація по (sort_by, _id) - час сторінки не залежить від глибини
+    try:
+        limit = min(max(int(limit or PRODUCTS_PAGE_SIZE), 1), PRODUCTS_MAX_PAGE_SIZE)
+    except ValueError:
+        return Response({'error': 'limit має бути числом'}, status=400)
+    
+    try:
+        page = products.paginate_after([sort_by], request.GET.get('cursor'), limit=limit)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=400)
+    
+    data = [ProductViewSerializer(p).data for p in page]
     
     return Response({
         'count': len(data),
+        'next': page.next_cursor,
+        'prev': page.prev_cursor,
         'results': data
     })
 
@@ -342,6 +368,13 @@ def newsletter_subscribe(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+def _exists_other(queryset, own_id):
+    """Чи є документ, крім own_id (запис, що редагується) - exists() без завантаження документа"""
+    if own_id and ObjectId.is_valid(own_id):
+        queryset = queryset.filter(id__ne=own_id)
+    return queryset.exists()
+
+
 # ====== Supplier Validation ======
 
 @api_view(['POST'])
@@ -361,18 +394,12 @@ def check_supplier_email_unique(request):
         }, status=status.HTTP_400_BAD_REQUEST)
     
     # Перевіряємо чи існує постачальник з таким email
-    existing_supplier = Supplier.objects().filter(email=email).first()
-    
-    # Якщо редагуємо існуючого постачальника, ігноруємо його самого
-    if existing_supplier and supplier_id and str(existing_supplier.id) == supplier_id:
-        return Response({
-            'unique': True,
-            'message': 'Email is available'
-        })
+    # Редагований запис (якщо є) сам не враховується
+    email_taken = _exists_other(Supplier.objects().filter(email=email), supplier_id)
     
     return Response({
-        'unique': existing_supplier is None,
-        'message': 'Email already exists' if existing_supplier else 'Email is available'
+        'unique': not email_taken,
+        'message': 'Email already exists' if email_taken else 'Email is available'
     })
 
 
@@ -393,18 +420,12 @@ def check_supplier_phone_unique(request):
         }, status=status.HTTP_400_BAD_REQUEST)
     
     # Перевіряємо чи існує постачальник з таким phone
-    existing_supplier = Supplier.objects().filter(phone=phone).first()
-    
-    # Якщо редагуємо існуючого постачальника, ігноруємо його самого
-    if existing_supplier and supplier_id and str(existing_supplier.id) == supplier_id:
-        return Response({
-            'unique': True,
-            'message': 'Phone is available'
-        })
+    # Редагований запис (якщо є) сам не враховується
+    phone_taken = _exists_other(Supplier.objects().filter(phone=phone), supplier_id)
     
     return Response({
-        'unique': existing_supplier is None,
-        'message': 'Phone already exists' if existing_supplier else 'Phone is available'
+        'unique': not phone_taken,
+        'message': 'Phone already exists' if phone_taken else 'Phone is available'
     })
 
 
@@ -426,17 +447,12 @@ def check_category_name_unique(request):
             'message': 'Name is required'
         }, status=status.HTTP_400_BAD_REQUEST)
     
-    existing_category = ProductCategory.objects().filter(name=name).first()
-    
-    if existing_category and category_id and str(existing_category.id) == category_id:
-        return Response({
-            'unique': True,
-            'message': 'Name is available'
-        })
+    # Редагований запис (якщо є) сам не враховується
+    name_taken = _exists_other(ProductCategory.objects().filter(name=name), category_id)
     
     return Response({
-        'unique': existing_category is None,
-        'message': 'Name already exists' if existing_category else 'Name is available'
+        'unique': not name_taken,
+        'message': 'Name already exists' if name_taken else 'Name is available'
     })
 
 
@@ -456,17 +472,12 @@ def check_category_slug_unique(request):
             'message': 'Slug is required'
         }, status=status.HTTP_400_BAD_REQUEST)
     
-    existing_category = ProductCategory.objects().filter(slug=slug).first()
-    
-    if existing_category and category_id and str(existing_category.id) == category_id:
-        return Response({
-            'unique': True,
-            'message': 'Slug is available'
-        })
+    # Редагований запис (якщо є) сам не враховується
+    slug_taken = _exists_other(ProductCategory.objects().filter(slug=slug), category_id)
     
     return Response({
-        'unique': existing_category is None,
-        'message': 'Slug already exists' if existing_category else 'Slug is available'
+        'unique': not slug_taken,
+        'message': 'Slug already exists' if slug_taken else 'Slug is available'
     })
 
 
@@ -486,17 +497,12 @@ def check_category_image_url_unique(request):
             'message': 'Image URL is required'
         }, status=status.HTTP_400_BAD_REQUEST)
     
-    existing_category = ProductCategory.objects().filter(image_url=image_url).first()
-    
-    if existing_category and category_id and str(existing_category.id) == category_id:
-        return Response({
-            'unique': True,
-            'message': 'Image URL is available'
-        })
+    # Редагований запис (якщо є) сам не враховується
+    image_url_taken = _exists_other(ProductCategory.objects().filter(image_url=image_url), category_id)
     
     return Response({
-        'unique': existing_category is None,
-        'message': 'Image URL already exists' if existing_category else 'Image URL is available'
+        'unique': not image_url_taken,
+        'message': 'Image URL already exists' if image_url_taken else 'Image URL is available'
     })
 
 
@@ -518,17 +524,12 @@ def check_product_name_unique(request):
             'message': 'Name is required'
         }, status=status.HTTP_400_BAD_REQUEST)
     
-    existing_product = Product.objects().filter(name=name).first()
-    
-    if existing_product and product_id and str(existing_product.id) == product_id:
-        return Response({
-            'unique': True,
-            'message': 'Name is available'
-        })
+    # Редагований запис (якщо є) сам не враховується
+    name_taken = _exists_other(Product.objects().filter(name=name), product_id)
     
     return Response({
-        'unique': existing_product is None,
-        'message': 'Name already exists' if existing_product else 'Name is available'
+        'unique': not name_taken,
+        'message': 'Name already exists' if name_taken else 'Name is available'
     })
 
 
@@ -548,17 +549,12 @@ def check_product_image_url_unique(request):
             'message': 'Image URL is required'
         }, status=status.HTTP_400_BAD_REQUEST)
     
-    existing_product = Product.objects().filter(image_url=image_url).first()
-    
-    if existing_product and product_id and str(existing_product.id) == product_id:
-        return Response({
-            'unique': True,
-            'message': 'Image URL is available'
-        })
+    # Редагований запис (якщо є) сам не враховується
+    image_url_taken = _exists_other(Product.objects().filter(image_url=image_url), product_id)
     
     return Response({
-        'unique': existing_product is None,
-        'message': 'Image URL already exists' if existing_product else 'Image URL is available'
+        'unique': not image_url_taken,
+        'message': 'Image URL already exists' if image_url_taken else 'Image URL is available'
     })
 
 
@@ -580,17 +576,12 @@ def check_employee_email_unique(request):
             'message': 'Email is required'
         }, status=status.HTTP_400_BAD_REQUEST)
     
-    existing_employee = Employee.objects().filter(email=email).first()
-    
-    if existing_employee and employee_id and str(existing_employee.id) == employee_id:
-        return Response({
-            'unique': True,
-            'message': 'Email is available'
-        })
+    # Редагований запис (якщо є) сам не враховується
+    email_taken = _exists_other(Employee.objects().filter(email=email), employee_id)
     
     return Response({
-        'unique': existing_employee is None,
-        'message': 'Email already exists' if existing_employee else 'Email is available'
+        'unique': not email_taken,
+        'message': 'Email already exists' if email_taken else 'Email is available'
     })
 
 
@@ -610,15 +601,10 @@ def check_employee_phone_unique(request):
             'message': 'Phone is required'
         }, status=status.HTTP_400_BAD_REQUEST)
     
-    existing_employee = Employee.objects().filter(phone=phone).first()
-    
-    if existing_employee and employee_id and str(existing_employee.id) == employee_id:
-        return Response({
-            'unique': True,
-            'message': 'Phone is available'
-        })
+    # Редагований запис (якщо є) сам не враховується
+    phone_taken = _exists_other(Employee.objects().filter(phone=phone), employee_id)
     
     return Response({
-        'unique': existing_employee is None,
-        'message': 'Phone already exists' if existing_employee else 'Phone is available'
+        'unique': not phone_taken,
+        'message': 'Phone already exists' if phone_taken else 'Phone is available'
     })
@@ -0,0 +1,14 @@
+# apps/api/views/metrics_views.py
+from django.http import HttpResponse
+
+from core.metrics import metrics
+
+
+def metrics_view(request):
+    """
+    Метрики процесу в текстовому форматі Prometheus (тільки admin, див. RoleBasedAccessMiddleware)
+
+    Латентність команд MongoDB, очікування пулу з'єднань
+    та латентність HTTP запитів по маршрутах.
+    """
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
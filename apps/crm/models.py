@@ -29,6 +29,12 @@ class Supplier(orm.Model):
 class Contract(orm.Model):
     """Модель договору"""
     _collection_name = "contracts"
+    _indexes = [
+        ['supplier_id', '-signing_date'],
+        ['status', '-signing_date'],
+        '-signing_date',
+        'products.product_id',  # multikey
+    ]
 
     STATUS_CHOICES = [
         ('active', 'Активний'),
@@ -63,6 +69,12 @@ class Contract(orm.Model):
 class Supply(orm.Model):
     """Модель постачання товарів"""
     _collection_name = "supplies"
+    _indexes = [
+        '-created_at',
+        'delivery_date',
+        'contract_id',
+        'products.product_id',  # multikey
+    ]
 
     STATUS_CHOICES = [
         ('ordered', 'Замовлено'),
@@ -127,6 +139,14 @@ class Employee(orm.Model):
 class Sale(orm.Model):
     """Модель продажу"""
     _collection_name = 'sales'
+    _indexes = [
+        '-created_at',
+        ['status', '-sale_date'],
+        ['user_id', '-sale_date'],
+        ['employee_id', '-sale_date'],
+        '-sale_date',
+        'products.product_id',  # multikey
+    ]
 
     STATUS_CHOICES = [
         ('paid', 'Оплачено'),
@@ -151,6 +171,8 @@ class Sale(orm.Model):
     software_service = orm.EmbeddedField(SoftwareServiceConfig, default=None)
     warranty_end_date = orm.DateTimeField()
     notes = orm.StringField()
+    # {product_id: [category, product_type]} на момент продажу - ключі рядків sales_daily_rollups
+    rollup_products = orm.DictField()
     created_at = orm.DateTimeField(default=datetime.now)
     updated_at = orm.DateTimeField(default=datetime.now)
 
@@ -159,10 +181,73 @@ class Sale(orm.Model):
         self.updated_at = datetime.now()
         self.save()
 
+    # Підсумки в sales_daily_rollups оновлюються разом з продажем (див. apps/crm/rollups.py)
+    _rollup_before = None
+
+    def pre_save(self):
+        self.pre_save_batch([self])
+
+    def post_save(self):
+        self.post_save_batch([self])
+
+    @classmethod
+    def pre_save_batch(cls, instances):
+        from apps.crm import rollups
+        for sale, before in zip(instances, rollups.before_save(instances)):
+            sale._rollup_before = before
+
+    @classmethod
+    def post_save_batch(cls, instances):
+        from apps.crm import rollups
+        befores = [sale._rollup_before for sale in instances]
+        for sale in instances:
+            sale._rollup_before = None
+        rollups.after_save(instances, befores)
+
+    def delete(self):
+        from apps.crm import rollups
+        before = rollups.stored_contribution(self.id) if self.id else {}
+        deleted = super().delete()
+        if deleted:
+            rollups.after_delete(self.id, before)
+        return deleted
+
+
+class SaleDailyRollup(orm.Model):
+    """
+    Денні підсумки продажів (оновлюються хуками Sale, перерахунок - manage.py rebuild_rollups)
+
+    Рядок з category=None та product_type=None - підсумки продажів (revenue, sales),
+    інші - позиції за категорією та типом продукту (units, line_revenue).
+    """
+    _collection_name = 'sales_daily_rollups'
+    _indexes = [
+        {'fields': ['date', 'status', 'payment_method', 'category', 'product_type', 'employee_id'], 'unique': True},
+        ['status', 'date'],
+    ]
+
+    date = orm.DateTimeField(required=True)
+    status = orm.StringField()
+    payment_method = orm.StringField()
+    category = orm.StringField()
+    product_type = orm.StringField()
+    employee_id = orm.ReferenceField(Employee)
+    revenue = orm.FloatField(default=0.0)  # сума total_amount
+    sales = orm.IntegerField(default=0)  # кількість продажів
+    units = orm.IntegerField(default=0)  # кількість товарів у позиціях
+    line_revenue = orm.FloatField(default=0.0)  # сума quantity * unit_price позицій
+
 
 class Repair(orm.Model):
     """Модель ремонту"""
     _collection_name = 'repairs'
+    _indexes = [
+        '-created_at',
+        ['repair_type', 'status', 'start_date'],  # звіти по ремонтах (read_model)
+        'status',
+        'product_id',
+        'user_id',
+    ]
 
     TYPE_CHOICES = [
         ('paid', 'Платний ремонт'),
@@ -196,8 +281,31 @@ class Repair(orm.Model):
     created_at = orm.DateTimeField(default=datetime.now)
     updated_at = orm.DateTimeField(default=datetime.now)
 
+    # Пов'язані документи, які показують сторінки ремонтів
+    READ_MODEL_PATHS = ('user_id', 'product_id', 'products_used.product_id', 'employee_id', 'technician_id')
+
     def update_updated_at(self):
         """Оновити час останнього оновлення"""
         self.updated_at = datetime.now()
         self.save()
 
+    @classmethod
+    def read_model(cls, repair_type=None, status=None, order_by='start_date'):
+        """
+        Ремонти для сторінок та звітів з усіма пов'язаними документами
+
+        status - значення або список. Продукти, клієнти та працівники (разом
+        з техніками) завантажуються одним $in запитом на колекцію, тож сторінка
+        робить сталу кількість запитів; доступ - repair.get_related('user_id').
+        Фільтр по repair_type/status та сортування по start_date йдуть
+        індексом (repair_type, status, start_date).
+        """
+        filters = {}
+        if repair_type is not None:
+            filters['repair_type'] = repair_type
+        if isinstance(status, (list, tuple, set)):
+            filters['status__in'] = list(status)
+        elif status is not None:
+            filters['status'] = status
+        return cls.objects().filter(**filters).order_by(order_by).prefetch(*cls.READ_MODEL_PATHS)
+
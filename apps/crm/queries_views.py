@@ -5,11 +5,13 @@ from django.http import JsonResponse
 from datetime import datetime, timedelta
 from collections import defaultdict
 import json
+from bson import ObjectId
 
-from apps.crm.models import Supplier, Contract, Supply, Sale, Repair, Employee
+from apps.crm.models import Supplier, Contract, Supply, Sale, SaleDailyRollup, Repair, Employee
 from apps.crm.serializers.contract_serializer import ContractSerializer
 from apps.crm.serializers.sale_serializer import SaleSerializer
 from apps.main.models import Product, User, CustomBuildConfig
+from core.mongo_orm import Count, Push, Sum, as_object_id, reads_from
 
 # Import admin_required from views
 from apps.crm.views import admin_required
@@ -34,37 +36,47 @@ def queries_index(request):
 # ==================== QUERY 1 ====================
 @login_required
 @admin_required
+@reads_from('reporting')
 def query1_suppliers_with_products(request):
     """Query 1: Suppliers and their products"""
-    suppliers = Supplier.objects().all()
-    result = []
+    # Два запити: постачальники та один pipeline по контрактах - продукти
+    # кожного постачальника (перша позиція продукту в контрактах) з $lookup
+    rows = Contract.objects().aggregate([
+        {'$sort': {'_id': 1}},  # $first - позиція з найранішого контракту
+        {'$unwind': '$products'},
+        {'$group': {
+            '_id': {
+                'supplier_id': as_object_id('supplier_id'),
+                'product_id': as_object_id('products.product_id'),
+            },
+            'quantity': {'$first': {'$ifNull': ['$products.quantity', 0]}},
+            'unit_price': {'$first': {'$ifNull': ['$products.unit_price', 0]}},
+        }},
+        {'$match': {'_id.supplier_id': {'$ne': None}, '_id.product_id': {'$ne': None}}},
+        {'$lookup': {
+            'from': Product._collection_name,
+            'localField': '_id.product_id',
+            'foreignField': '_id',
+            'pipeline': [{'$project': {'name': 1, 'manufacturer': 1, 'product_type': 1}}],
+            'as': 'product',
+        }},
+        {'$unwind': '$product'},  # видалені продукти не показуються
+        {'$sort': {'product.name': 1}},
+        {'$group': {
+            '_id': '$_id.supplier_id',
+            'products': {'$push': {
+                'product': '$product',
+                'quantity': '$quantity',
+                'unit_price': '$unit_price',
+                'subtotal': {'$round': [{'$multiply': ['$quantity', '$unit_price']}, 2]},
+            }},
+        }},
+    ])
+    products_by_supplier = {row['_id']: row['products'] for row in rows}
     
-    for supplier in suppliers:
-        contracts = Contract.objects().filter(supplier_id=supplier.id).all()
-        products = []
-        seen_products = set()
-        
-        for contract in contracts:
-            if not contract.products:
-                continue
-            for product_item in contract.products:
-                product_id = get_product_item_field(product_item, 'product_id')
-                product_id_str = str(product_id) if product_id else None
-                if not product_id_str or product_id_str in seen_products:
-                    continue
-                seen_products.add(product_id_str)
-                
-                product = Product.find_by_id(product_id)
-                if product:
-                    quantity = get_product_item_field(product_item, 'quantity', 0) or 0
-                    unit_price = get_product_item_field(product_item, 'unit_price', 0) or 0
-                    products.append({
-                        'product': product,
-                        'quantity': quantity,
-                        'unit_price': unit_price,
-                        'subtotal': round(float(quantity) * float(unit_price), 2)
-                    })
-        
+    result = []
+    for supplier in Supplier.objects().all():
+        products = products_by_supplier.get(supplier.id, [])
         result.append({
             'supplier': supplier,
             'products': products,
@@ -78,39 +90,40 @@ def query1_suppliers_with_products(request):
 
 @login_required
 @admin_required
+@reads_from('reporting')
 def query1_components_multiple_suppliers(request):
     """Query 1b: Components supplied by 2+ suppliers"""
-    product_suppliers = defaultdict(set)
-    
-    contracts = Contract.objects().all()
-    for contract in contracts:
-        if not contract.products:
-            continue
-        for product_item in contract.products:
-            product_id = get_product_item_field(product_item, 'product_id')
-            product_id = str(product_id) if product_id else None
-            supplier_id = str(contract.supplier_id) if contract.supplier_id else None
-            if product_id and supplier_id:
-                product_suppliers[product_id].add(supplier_id)
-    
-    result = []
     component_types = [choice[0] for choice in Product.COMPONENT_CHOICES]
     
-    for product_id, supplier_ids in product_suppliers.items():
-        if len(supplier_ids) >= 2:
-            product = Product.find_by_id(product_id)
-            if product and product.product_type in component_types:
-                suppliers_info = []
-                for supplier_id in supplier_ids:
-                    supplier = Supplier.find_by_id(supplier_id)
-                    if supplier:
-                        suppliers_info.append(supplier)
-                
-                result.append({
-                    'product': product,
-                    'suppliers': suppliers_info,
-                    'suppliers_count': len(supplier_ids)
-                })
+    # Один pipeline: постачальники кожного продукту ($addToSet), відбір 2+,
+    # продукт і постачальники через $lookup - рядки готові для шаблону
+    result = Contract.objects().aggregate([
+        {'$match': {'supplier_id': {'$nin': [None, '']}}},
+        {'$unwind': '$products'},
+        {'$group': {
+            '_id': as_object_id('products.product_id'),
+            'supplier_ids': {'$addToSet': as_object_id('supplier_id')},
+        }},
+        {'$match': {'_id': {'$ne': None}, 'supplier_ids.1': {'$exists': True}}},
+        {'$lookup': {
+            'from': Product._collection_name,
+            'localField': '_id',
+            'foreignField': '_id',
+            'pipeline': [{'$project': {'name': 1, 'manufacturer': 1, 'product_type': 1}}],
+            'as': 'product',
+        }},
+        {'$unwind': '$product'},
+        {'$match': {'product.product_type': {'$in': component_types}}},
+        {'$lookup': {
+            'from': Supplier._collection_name,
+            'localField': 'supplier_ids',
+            'foreignField': '_id',
+            'pipeline': [{'$project': {'name': 1, 'contact_person': 1, 'phone': 1, 'email': 1}}],
+            'as': 'suppliers',
+        }},
+        {'$project': {'product': 1, 'suppliers': 1, 'suppliers_count': {'$size': '$supplier_ids'}}},
+        {'$sort': {'product.name': 1}},
+    ])
     
     return render(request, 'crm/queries/query1_components_multiple.html', {
         'results': result
@@ -120,6 +133,7 @@ def query1_components_multiple_suppliers(request):
 # ==================== QUERY 2 ====================
 @login_required
 @admin_required
+@reads_from('reporting')
 def query2_customers_by_manufacturer(request):
     """Query 2: Customers who bought products from specified manufacturer"""
     manufacturer = request.GET.get('manufacturer', '').strip()
@@ -131,43 +145,49 @@ def query2_customers_by_manufacturer(request):
             'error': 'Please specify manufacturer parameter'
         })
     
-    products = Product.objects().filter(manufacturer__icontains=manufacturer).all()
-    product_ids = [str(p.id) for p in products]
+    # Префікс виробника по індексу manufacturer_key - тільки id та назви
+    product_names = dict(
+        Product.objects().filter(**Product.manufacturer_filter(manufacturer)).values_list('id', 'name')
+    )
     
-    if not product_ids:
+    if not product_names:
         return render(request, 'crm/queries/query2_customers_manufacturer.html', {
             'results': [],
             'manufacturer': manufacturer,
             'error': f'No products found for manufacturer: {manufacturer}'
         })
     
-    sales = Sale.objects().all()
-    customer_ids = set()
-    customer_sales = defaultdict(list)
-    
-    for sale in sales:
-        if not sale.products:
-            continue
-        for product_item in sale.products:
-            product_id = get_product_item_field(product_item, 'product_id')
-            if product_id and str(product_id) in product_ids:
-                customer_ids.add(sale.user_id)
-                product = Product.find_by_id(product_id)
-                customer_sales[sale.user_id].append({
-                    'sale': sale,
-                    'product': product,
-                    'product_name': product.name if product else 'Unknown'
-                })
-    
-    result = []
-    for user_id in customer_ids:
-        user = User.find_by_id(user_id)
-        if user:
-            result.append({
-                'customer': user,
-                'purchases': customer_sales[user_id],
-                'total_purchases': len(customer_sales[user_id])
-            })
+    # product_id у продажах буває і ObjectId, і рядком
+    product_ids = list(product_names) + [str(product_id) for product_id in product_names]
+    
+    # Один pipeline: продажі через multikey індекс products.product_id,
+    # покупки по клієнтах ($group) та клієнт через $lookup
+    result = Sale.objects().aggregate([
+        {'$match': {'products.product_id': {'$in': product_ids}}},
+        {'$sort': {'sale_date': 1}},
+        {'$unwind': '$products'},
+        {'$match': {'products.product_id': {'$in': product_ids}}},
+        {'$group': {
+            '_id': as_object_id('user_id'),
+            'purchases': {'$push': {
+                'product_id': as_object_id('products.product_id'),
+                'sale': {'sale_date': '$sale_date', 'total_amount': '$total_amount'},
+            }},
+        }},
+        {'$lookup': {
+            'from': User._collection_name,
+            'localField': '_id',
+            'foreignField': '_id',
+            'pipeline': [{'$project': {'username': 1, 'email': 1}}],
+            'as': 'customer',
+        }},
+        {'$unwind': '$customer'},
+        {'$project': {'customer': 1, 'purchases': 1, 'total_purchases': {'$size': '$purchases'}}},
+        {'$sort': {'total_purchases': -1, 'customer.username': 1}},
+    ])
+    for row in result:
+        for purchase in row['purchases']:
+            purchase['product_name'] = product_names.get(purchase['product_id'], 'Unknown')
     
     return render(request, 'crm/queries/query2_customers_manufacturer.html', {
         'results': result,
@@ -178,23 +198,19 @@ def query2_customers_by_manufacturer(request):
 # ==================== QUERY 3 ====================
 @login_required
 @admin_required
+@reads_from('reporting')
 def query3_warranty_repairs_returned(request):
     """Query 3a: Products returned for warranty repair"""
-    repairs = Repair.objects().filter(
-        repair_type='warranty',
-        status='returned'
-    ).all()
+    repairs = Repair.read_model(repair_type='warranty', status='returned').all()
     
-    result = []
-    for repair in repairs:
-        product = Product.find_by_id(repair.product_id) if repair.product_id else None
-        user = User.find_by_id(repair.user_id) if repair.user_id else None
-        
-        result.append({
+    result = [
+        {
             'repair': repair,
-            'product': product,
-            'customer': user
-        })
+            'product': repair.get_related('product_id'),
+            'customer': repair.get_related('user_id')
+        }
+        for repair in repairs
+    ]
     
     return render(request, 'crm/queries/query3_warranty_returned.html', {
         'results': result
@@ -203,23 +219,19 @@ def query3_warranty_repairs_returned(request):
 
 @login_required
 @admin_required
+@reads_from('reporting')
 def query3_warranty_repairs_completed(request):
     """Query 3b: Products completed warranty repair"""
-    repairs = Repair.objects().filter(
-        repair_type='warranty',
-        status='completed'
-    ).all()
+    repairs = Repair.read_model(repair_type='warranty', status='completed').all()
     
-    result = []
-    for repair in repairs:
-        product = Product.find_by_id(repair.product_id) if repair.product_id else None
-        user = User.find_by_id(repair.user_id) if repair.user_id else None
-        
-        result.append({
+    result = [
+        {
             'repair': repair,
-            'product': product,
-            'customer': user
-        })
+            'product': repair.get_related('product_id'),
+            'customer': repair.get_related('user_id')
+        }
+        for repair in repairs
+    ]
     
     return render(request, 'crm/queries/query3_warranty_completed.html', {
         'results': result
@@ -228,25 +240,23 @@ def query3_warranty_repairs_completed(request):
 
 @login_required
 @admin_required
+@reads_from('reporting')
 def query3_warranty_repairs_in_progress(request):
     """Query 3c: Warranty repairs in progress"""
-    repairs = Repair.objects().filter(
+    repairs = Repair.read_model(
         repair_type='warranty',
-        status__in=['received', 'diagnosed', 'repairing']
+        status=['received', 'diagnosed', 'repairing']
     ).all()
     
-    result = []
-    for repair in repairs:
-        product = Product.find_by_id(repair.product_id) if repair.product_id else None
-        user = User.find_by_id(repair.user_id) if repair.user_id else None
-        employee = Employee.find_by_id(repair.employee_id) if repair.employee_id else None
-        
-        result.append({
+    result = [
+        {
             'repair': repair,
-            'product': product,
-            'customer': user,
-            'employee': employee
-        })
+            'product': repair.get_related('product_id'),
+            'customer': repair.get_related('user_id'),
+            'employee': repair.get_related('employee_id')
+        }
+        for repair in repairs
+    ]
     
     return render(request, 'crm/queries/query3_warranty_in_progress.html', {
         'results': result
@@ -256,6 +266,7 @@ def query3_warranty_repairs_in_progress(request):
 # ==================== QUERY 4 ====================
 @login_required
 @admin_required
+@reads_from('reporting')
 def query4_max_revenue_by_month(request):
     """Query 4a: Max revenue by month"""
     month_str = request.GET.get('month', '').strip()
@@ -279,18 +290,13 @@ def query4_max_revenue_by_month(request):
             'month': month_str
         })
     
-    sales = Sale.objects().filter(
+    # Сортування на сервері - передається тільки один документ
+    max_sale = Sale.objects().filter(
         sale_date__gte=month_start,
-        sale_date__lt=month_end
-    ).all()
-    
-    max_revenue = 0
-    max_sale = None
-    
-    for sale in sales:
-        if sale.total_amount and sale.total_amount > max_revenue:
-            max_revenue = sale.total_amount
-            max_sale = sale
+        sale_date__lt=month_end,
+        total_amount__gt=0
+    ).order_by('-total_amount').first()
+    max_revenue = max_sale.total_amount if max_sale else 0
     
     return render(request, 'crm/queries/query4_max_revenue.html', {
         'month': month_str,
@@ -301,30 +307,21 @@ def query4_max_revenue_by_month(request):
 
 @login_required
 @admin_required
+@reads_from('reporting')
 def query4_revenue_by_product_type_last_week(request):
     """Query 4b: Revenue by product type for last week"""
     now = datetime.now()
-    week_ago = now - timedelta(days=7)
+    # Денні підсумки - період починається з початку дня тиждень тому
+    week_ago = (now - timedelta(days=7)).replace(hour=0, minute=0, second=0, microsecond=0)
     
-    sales = Sale.objects().filter(
-        sale_date__gte=week_ago,
-        sale_date__lte=now
-    ).all()
+    # Виручка по типах продуктів з sales_daily_rollups (тип зафіксований на момент продажу)
+    rows = SaleDailyRollup.objects().filter(
+        date__gte=week_ago,
+        date__lte=now,
+        product_type__ne=None
+    ).group_by('product_type', revenue=Sum('line_revenue'))
     
-    revenue_by_type = defaultdict(float)
-    
-    for sale in sales:
-        if not sale.products:
-            continue
-        for product_item in sale.products:
-            product_id = get_product_item_field(product_item, 'product_id')
-            product = Product.find_by_id(product_id) if product_id else None
-            if product:
-                product_type = product.product_type
-                unit_price = get_product_item_field(product_item, 'unit_price', 0) or 0
-                quantity = get_product_item_field(product_item, 'quantity', 0) or 0
-                revenue = unit_price * quantity
-                revenue_by_type[product_type] += revenue
+    revenue_by_type = {row['product_type']: row['revenue'] or 0 for row in rows}
     
     result = [
         {
@@ -344,41 +341,31 @@ def query4_revenue_by_product_type_last_week(request):
 
 @login_required
 @admin_required
+@reads_from('reporting')
 def query4_sales_by_employee(request):
     """Query 4c: Sales per employee"""
-    sales = Sale.objects().all()
+    # Підсумки по працівниках з sales_daily_rollups одним $group
+    rows = SaleDailyRollup.objects().group_by(
+        'employee_id',
+        sales_count=Sum('sales'),
+        total_amount=Sum('revenue'),
+        total_products=Sum('units'),
+    )
+    employees = Employee.in_bulk(row['employee_id'] for row in rows)
     
-    employee_sales = defaultdict(lambda: {
-        'total_products': 0,
-        'total_amount': 0,
-        'sales_count': 0
-    })
-    
-    for sale in sales:
-        if not sale.employee_id:
-            continue
-        
-        employee = Employee.find_by_id(sale.employee_id)
+    result = []
+    for row in rows:
+        employee = employees.get(row['employee_id'])
         if not employee:
             continue
-        
-        employee_id = str(employee.id)
-        employee_sales[employee_id]['sales_count'] += 1
-        employee_sales[employee_id]['total_amount'] += sale.total_amount or 0
-        
-        if sale.products:
-            for product_item in sale.products:
-                quantity = get_product_item_field(product_item, 'quantity', 0) or 0
-                employee_sales[employee_id]['total_products'] += quantity
-    
-    result = []
-    for employee_id, stats in employee_sales.items():
-        employee = Employee.find_by_id(employee_id)
-        if employee:
-            result.append({
-                'employee': employee,
-                'statistics': stats
-            })
+        result.append({
+            'employee': employee,
+            'statistics': {
+                'total_products': row['total_products'],
+                'total_amount': row['total_amount'],
+                'sales_count': row['sales_count'],
+            }
+        })
     
     result.sort(key=lambda x: x['statistics']['total_products'], reverse=True)
     
@@ -390,6 +377,7 @@ def query4_sales_by_employee(request):
 # ==================== QUERY 5 ====================
 @login_required
 @admin_required
+@reads_from('reporting')
 def query5_components_by_price(request):
     """Query 5: Components with price <= max_price"""
     try:
@@ -420,12 +408,13 @@ def query5_components_by_price(request):
 # ==================== QUERY 6 ====================
 @login_required
 @admin_required
+@reads_from('reporting')
 def query6_suppliers_by_repair_frequency(request):
     """Query 6: Suppliers whose products most frequently need repair"""
-    repairs = Repair.objects().all()
+    repairs = Repair.objects().filter(product_id__exists=True).only('product_id')
     
     product_repair_count = defaultdict(int)
-    for repair in repairs:
+    for repair in repairs.iterator(batch_size=1000):
         if repair.product_id:
             product_repair_count[str(repair.product_id)] += 1
     
@@ -445,9 +434,11 @@ def query6_suppliers_by_repair_frequency(request):
                 if product_id in product_repair_count:
                     supplier_repair_count[supplier_id] += product_repair_count[product_id]
     
+    suppliers = Supplier.in_bulk(supplier_repair_count.keys())
+    
     result = []
     for supplier_id, repair_count in sorted(supplier_repair_count.items(), key=lambda x: x[1], reverse=True):
-        supplier = Supplier.find_by_id(supplier_id)
+        supplier = suppliers.get(ObjectId(supplier_id)) if ObjectId.is_valid(supplier_id) else None
         if supplier:
             result.append({
                 'supplier': supplier,
@@ -463,6 +454,7 @@ def query6_suppliers_by_repair_frequency(request):
 # ==================== QUERY 7 ====================
 @login_required
 @admin_required
+@reads_from('reporting')
 def query7_custom_build_components(request):
     """Query 7: Custom build components for customer"""
     user_id = request.GET.get('user_id')
@@ -580,6 +572,7 @@ def query7_custom_build_components(request):
 # ==================== QUERY 8 ====================
 @login_required
 @admin_required
+@reads_from('reporting')
 def query8_product_supplies_by_period(request):
     """Query 8: Product supplies by period"""
     product_id = request.GET.get('product_id')
@@ -624,7 +617,7 @@ def query8_product_supplies_by_period(request):
     supplies = Supply.objects().filter(
         delivery_date__gte=start_date,
         delivery_date__lte=end_date
-    ).all()
+    ).prefetch('supplier_id', 'contract_id').all()
     
     total_quantity = 0
     supplies_info = []
@@ -638,8 +631,8 @@ def query8_product_supplies_by_period(request):
                 quantity = get_product_item_field(product_item, 'quantity', 0) or 0
                 total_quantity += quantity
                 
-                supplier = Supplier.find_by_id(supply.supplier_id) if supply.supplier_id else None
-                contract = Contract.find_by_id(supply.contract_id) if supply.contract_id else None
+                supplier = supply.get_related('supplier_id')
+                contract = supply.get_related('contract_id')
                 
                 supplies_info.append({
                     'supply': supply,
@@ -661,6 +654,7 @@ def query8_product_supplies_by_period(request):
 # ==================== QUERY 9 ====================
 @login_required
 @admin_required
+@reads_from('reporting')
 def query9_contracts_by_period(request):
     """Query 9a: Contracts by period"""
     start_date_str = request.GET.get('start_date')
@@ -692,11 +686,11 @@ def query9_contracts_by_period(request):
     contracts_sorted = Contract.objects().filter(
         signing_date__gte=start_date,
         signing_date__lte=end_date
-    ).order_by('-signing_date').all()
+    ).order_by('-signing_date').prefetch('supplier_id', 'products.product_id').all()
     
     result = []
     for contract_obj in contracts_sorted:
-        supplier = Supplier.find_by_id(contract_obj.supplier_id) if contract_obj.supplier_id else None
+        supplier = contract_obj.get_related('supplier_id')
         # Serialize contract for template
         contract_data = ContractSerializer(contract_obj).data
         result.append({
@@ -713,34 +707,27 @@ def query9_contracts_by_period(request):
 
 @login_required
 @admin_required
+@reads_from('reporting')
 def query9_contracts_count_by_supplier(request):
     """Query 9b: Contract count by supplier"""
-    contracts = Contract.objects().all()
-    
-    supplier_contracts = defaultdict(lambda: {
-        'count': 0,
-        'total_amount': 0,
-        'contracts': []
-    })
-    
-    for contract in contracts:
-        supplier_id = str(contract.supplier_id) if contract.supplier_id else None
-        if supplier_id:
-            supplier_contracts[supplier_id]['count'] += 1
-            supplier_contracts[supplier_id]['total_amount'] += contract.total_amount or 0
-            supplier_contracts[supplier_id]['contracts'].append(contract)
+    # Групування на сервері; для шаблону потрібні лише номер, дата та статус контракту
+    rows = Contract.objects().group_by(
+        {'supplier_id': as_object_id('supplier_id')},
+        contracts_count=Count(),
+        total_amount=Sum('total_amount'),
+        contracts=Push({'number': '$number', 'signing_date': '$signing_date', 'status': '$status'}),
+    )
+    suppliers = Supplier.in_bulk(row['supplier_id'] for row in rows)
     
     result = []
-    for supplier_id, stats in supplier_contracts.items():
-        supplier = Supplier.find_by_id(supplier_id)
+    for row in rows:
+        supplier = suppliers.get(row['supplier_id'])
         if supplier:
-            # Serialize contracts for template
-            contracts_data = [ContractSerializer(c).data for c in stats['contracts']]
             result.append({
                 'supplier': supplier,
-                'contracts_count': stats['count'],
-                'total_amount': stats['total_amount'],
-                'contracts': contracts_data
+                'contracts_count': row['contracts_count'],
+                'total_amount': row['total_amount'],
+                'contracts': row['contracts']
             })
     
     result.sort(key=lambda x: x['contracts_count'], reverse=True)
@@ -753,6 +740,7 @@ def query9_contracts_count_by_supplier(request):
 # ==================== QUERY 10 ====================
 @login_required
 @admin_required
+@reads_from('reporting')
 def query10_supplier_by_contract_number(request):
     """Query 10: Supplier by contract number"""
     contract_number = request.GET.get('contract_number', '').strip()
@@ -762,14 +750,14 @@ def query10_supplier_by_contract_number(request):
             'error': 'Please specify contract_number parameter'
         })
     
-    contract = Contract.objects().filter(number=contract_number).first()
+    contract = Contract.objects().filter(number=contract_number).prefetch('supplier_id', 'products.product_id').first()
     
     if not contract:
         return render(request, 'crm/queries/query10_supplier_contract.html', {
             'error': f'Contract with number {contract_number} not found'
         })
     
-    supplier = Supplier.find_by_id(contract.supplier_id) if contract.supplier_id else None
+    supplier = contract.get_related('supplier_id')
     
     if not supplier:
         return render(request, 'crm/queries/query10_supplier_contract.html', {
@@ -780,7 +768,7 @@ def query10_supplier_by_contract_number(request):
     if contract.products:
         for product_item in contract.products:
             product_id = get_product_item_field(product_item, 'product_id')
-            product = Product.find_by_id(product_id) if product_id else None
+            product = contract.get_related('products.product_id', product_id) if product_id else None
             if product:
                 products_info.append({
                     'product': product,
@@ -801,6 +789,7 @@ def query10_supplier_by_contract_number(request):
 
 # ==================== CUSTOM AGGREGATION QUERY (ADMIN ONLY) ====================
 @login_required
+@reads_from('reporting')
 def execute_aggregation(request):
     """Execute custom MongoDB aggregation pipeline (ADMIN ONLY)"""
     # Перевірка, що користувач є адміном (не просто оператором)
@@ -839,13 +828,16 @@ def execute_aggregation(request):
                     if not isinstance(pipeline, list):
                         error = 'Pipeline must be a JSON array'
                     else:
-                        # Отримуємо колекцію та виконуємо aggregation
-                        from core.mongo_connection import get_db
-                        db = get_db()
-                        collection = db[collection_name]
+                        # Через ORM: ліміт часу, коментар з назвою view та read preference з reads_from
+                        from apps.main.models import ProductCategory, Delivery
+                        models = {
+                            model._collection_name: model
+                            for model in (Supplier, Contract, Supply, Sale, Repair, Employee,
+                                          Product, User, ProductCategory, Delivery)
+                        }
                         
                         # Виконуємо aggregation
-                        results_raw = list(collection.aggregate(pipeline))
+                        results_raw = list(models[collection_name].objects().aggregate(pipeline, allow_disk_use=True))
                         # Конвертуємо ObjectId в рядки для JSON серіалізації
                         results = json.loads(json.dumps(results_raw, default=str))
                         
@@ -0,0 +1,315 @@
+# apps/crm/rollups.py
+"""
+Денні підсумки продажів у колекції sales_daily_rollups (модель SaleDailyRollup)
+
+Рядок - (date, status, payment_method, category, product_type, employee_id):
+- рядок з category=None та product_type=None містить підсумки самих продажів:
+  revenue (сума total_amount) та sales (кількість)
+- рядки з category/product_type містять позиції: units (кількість товарів)
+  та line_revenue (quantity * unit_price)
+
+Категорія та тип продукту фіксуються в Sale.rollup_products при збереженні
+продажу, тож "до" та "після" рахуються з тими самими ключами, навіть якщо
+продукт потім змінився.
+
+Sale.save()/delete() додають різницю внеску продажу через $inc, а
+manage.py rebuild_rollups перераховує колекцію з нуля (backfill, розбіжності).
+"""
+import logging
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from pymongo import DeleteOne, UpdateOne
+
+from core.mongo_connection import get_db
+
+logger = logging.getLogger('api')
+
+KEY_FIELDS = ('date', 'status', 'payment_method', 'category', 'product_type', 'employee_id')
+VALUE_FIELDS = ('revenue', 'sales', 'units', 'line_revenue')
+
+# Поля Sale, від яких залежить внесок продажу
+SALE_FIELDS = ('sale_date', 'status', 'payment_method', 'employee_id', 'products', 'total_amount')
+SNAPSHOT_FIELD = 'rollup_products'
+
+
+def _object_id(value):
+    if isinstance(value, str) and ObjectId.is_valid(value):
+        return ObjectId(value)
+    return value or None
+
+
+def _day(value):
+    """Дата продажу -> початок дня (naive, як зберігає MongoDB)"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return datetime(value.year, value.month, value.day)
+
+
+def _item_value(item, name):
+    """Поле позиції products: словник з бази або ProductListItem"""
+    if isinstance(item, dict):
+        return item.get(name)
+    return getattr(item, name, None)
+
+
+def _sale_value(sale, name):
+    return sale.get(name) if isinstance(sale, dict) else getattr(sale, name, None)
+
+
+def product_info(product_ids):
+    """{product_id: (category, product_type)} одним запитом"""
+    from apps.main.models import Product
+
+    ids = {_object_id(product_id) for product_id in product_ids}
+    ids.discard(None)
+    if not ids:
+        return {}
+    rows = Product.objects().filter(id__in=list(ids)).values_list('id', 'category', 'product_type')
+    return {product_id: (category, product_type) for product_id, category, product_type in rows}
+
+
+def capture_products(sale, products=None):
+    """
+    Зафіксувати (category, product_type) позицій у sale.rollup_products
+
+    Вже зафіксовані продукти не змінюються; нові беруться з products
+    ({product_id: (category, product_type)}) або одним запитом до Product.
+    Повертає snapshot (для словника документа - не змінюючи його).
+    """
+    product_ids = [str(product_id) for product_id in _item_product_ids(sale)]
+    current = _sale_value(sale, SNAPSHOT_FIELD) or {}
+    snapshot = {product_id: list(current[product_id]) for product_id in product_ids if product_id in current}
+
+    missing = [product_id for product_id in product_ids if product_id not in snapshot]
+    if missing:
+        if products is None:
+            products = product_info(missing)
+        for product_id in missing:
+            # Видалений продукт теж фіксується - (None, None), без повторних запитів
+            snapshot[product_id] = list(products.get(_object_id(product_id), (None, None)))
+
+    if not isinstance(sale, dict):
+        setattr(sale, SNAPSHOT_FIELD, snapshot)
+    return snapshot
+
+
+def _item_product_ids(sale):
+    ids = (_item_value(item, 'product_id') for item in _sale_value(sale, 'products') or [])
+    return [product_id for product_id in ids if product_id]
+
+
+def sale_contribution(sale, products=None):
+    """
+    Внесок продажу в rollup: {ключ: {поле: значення}}
+
+    sale - Sale або словник документа. Категорія та тип беруться з
+    sale.rollup_products, для незафіксованих продуктів (старі продажі) -
+    з products ({product_id: (category, product_type)}) або з Product.
+    """
+    sale_date = _sale_value(sale, 'sale_date')
+    if not isinstance(sale_date, datetime):
+        return {}
+
+    items = _sale_value(sale, 'products') or []
+    snapshot = _sale_value(sale, SNAPSHOT_FIELD) or {}
+    if products is None:
+        products = product_info(
+            product_id for product_id in _item_product_ids(sale) if str(product_id) not in snapshot
+        )
+
+    prefix = (_day(sale_date), _sale_value(sale, 'status'), _sale_value(sale, 'payment_method'))
+    employee_id = _object_id(_sale_value(sale, 'employee_id'))
+
+    rows = {prefix + (None, None, employee_id): {
+        'revenue': float(_sale_value(sale, 'total_amount') or 0),
+        'sales': 1,
+    }}
+    for item in items:
+        quantity = _item_value(item, 'quantity') or 0
+        product_id = _item_value(item, 'product_id')
+        captured = snapshot.get(str(product_id))
+        # Позиції з видаленими продуктами потрапляють у рядок продажу (category=None)
+        category, product_type = captured if captured is not None else products.get(_object_id(product_id), (None, None))
+        values = rows.setdefault(prefix + (category, product_type, employee_id), {})
+        values['units'] = values.get('units', 0) + quantity
+        values['line_revenue'] = values.get('line_revenue', 0) + quantity * float(_item_value(item, 'unit_price') or 0)
+    return rows
+
+
+def _stored_docs(sale_ids):
+    """{sale_id: документ} у тому вигляді, в якому продажі зараз збережені в базі"""
+    from apps.crm.models import Sale
+
+    if not sale_ids:
+        return {}
+    # Тільки primary: різниця рахується відносно щойно записаного стану
+    docs = Sale.objects().using('primary').filter(id__in=list(sale_ids)).values('id', *SALE_FIELDS, SNAPSHOT_FIELD)
+    return {doc['id']: doc for doc in docs}
+
+
+def stored_contribution(sale_id):
+    """Внесок продажу в тому вигляді, в якому він зараз збережений у базі"""
+    doc = _stored_docs([sale_id]).get(sale_id)
+    return sale_contribution(doc) if doc else {}
+
+
+def _add(totals, contribution):
+    for key, values in contribution.items():
+        row = totals.setdefault(key, {})
+        for field, value in values.items():
+            row[field] = row.get(field, 0) + value
+    return totals
+
+
+def apply_delta(before, after):
+    """
+    Записати різницю внесків (after - before) одним bulk_write з $inc та upsert
+
+    Рядки, з яких продаж пішов повністю, видаляються в тому ж bulk_write,
+    якщо в них не залишилось інших продажів чи позицій.
+    """
+    from apps.crm.models import SaleDailyRollup
+
+    operations = []
+    for key in before.keys() | after.keys():
+        old, new = before.get(key, {}), after.get(key, {})
+        inc = {}
+        for field in VALUE_FIELDS:
+            diff = new.get(field, 0) - old.get(field, 0)
+            if diff:
+                inc[field] = diff
+        if inc:
+            operations.append(UpdateOne(dict(zip(KEY_FIELDS, key)), {'$inc': inc}, upsert=True))
+        if key not in after:
+            # None також відповідає відсутньому полю
+            operations.append(DeleteOne({**dict(zip(KEY_FIELDS, key)), 'sales': {'$in': [0, None]}, 'units': {'$in': [0, None]}}))
+
+    if operations:
+        # ordered: видалення порожнього рядка - після його $inc
+        SaleDailyRollup.objects().bulk_ops(operations)
+    return len(operations)
+
+
+def before_save(sales):
+    """
+    Sale.pre_save_batch: збережені внески продажів у тому ж порядку
+    ({} для нового продажу, None - поля rollup не змінились)
+
+    Заодно фіксує категорії нових позицій у rollup_products - вони пишуться
+    тим самим save()/bulk_update(). На всю пачку - один запит до Sale та
+    один до Product.
+    """
+    changed = [
+        sale.id for sale in sales
+        if sale.id and (sale._original is None or set(sale.get_dirty_fields()) & set(SALE_FIELDS))
+    ]
+    docs = _stored_docs(changed)
+    # Частково завантажений продаж без products/rollup_products - фіксувати нічого
+    capture = [
+        sale for sale in sales
+        if (not sale.id or sale.id in docs)
+        and (sale._loaded_fields is None or {'products', SNAPSHOT_FIELD} <= sale._loaded_fields)
+    ]
+
+    missing = set()
+    for sale in list(docs.values()) + capture:
+        snapshot = _sale_value(sale, SNAPSHOT_FIELD) or {}
+        missing.update(product_id for product_id in _item_product_ids(sale) if str(product_id) not in snapshot)
+    products = product_info(missing)
+
+    befores = []
+    for sale in sales:
+        if not sale.id:
+            befores.append({})
+        elif sale.id in docs:
+            befores.append(sale_contribution(docs[sale.id], products))
+        elif sale.id in changed:
+            befores.append({})  # Документа вже немає в базі
+        else:
+            befores.append(None)
+    for sale in capture:
+        capture_products(sale, products)
+    return befores
+
+
+def after_save(sales, befores):
+    """Sale.post_save_batch: записати сумарну різницю внесків пачки одним bulk_write"""
+    saved = [(sale, before) for sale, before in zip(sales, befores) if before is not None]
+    if not saved:
+        return
+    try:
+        # Частково завантажені продажі (only()/defer()) - актуальний стан читається з бази
+        docs = _stored_docs([sale.id for sale, _ in saved if sale._loaded_fields is not None])
+        before_total, after_total = {}, {}
+        for sale, before in saved:
+            _add(before_total, before)
+            if sale._loaded_fields is None:
+                _add(after_total, sale_contribution(sale))
+            elif sale.id in docs:
+                _add(after_total, sale_contribution(docs[sale.id]))
+        apply_delta(before_total, after_total)
+    except Exception as e:
+        ids = ', '.join(str(sale.id) for sale, _ in saved)
+        logger.error(f"Sale {ids}: sales_daily_rollups not updated ({e}); run manage.py rebuild_rollups")
+
+
+def after_delete(sale_id, before):
+    """Sale.delete: прибрати внесок видаленого продажу"""
+    try:
+        apply_delta(before, {})
+    except Exception as e:
+        logger.error(f"Sale {sale_id}: sales_daily_rollups not updated ({e}); run manage.py rebuild_rollups")
+
+
+def rebuild(batch_size=1000):
+    """
+    Перерахувати sales_daily_rollups з усіх продажів
+
+    Рядки збираються в тимчасову колекцію з тими ж індексами, яка потім
+    атомарно замінює робочу (renameCollection). Продажі, змінені під час
+    перерахунку, в нову колекцію можуть не потрапити - запускати в тихий час.
+    Зафіксовані в rollup_products категорії зберігаються; продажам без них
+    (створеним до появи поля) вони дописуються з поточних продуктів.
+    Повертає (кількість продажів, кількість рядків).
+    """
+    from apps.crm.models import Sale, SaleDailyRollup
+    from apps.main.models import Product
+
+    products = {
+        product_id: (category, product_type)
+        for product_id, category, product_type in Product.objects().values_list(
+            'id', 'category', 'product_type', batch_size=batch_size
+        )
+    }
+
+    totals = {}
+    sales = 0
+    snapshots = []
+    rows = Sale.objects().values('id', *SALE_FIELDS, SNAPSHOT_FIELD, batch_size=batch_size)
+    for sale in rows:
+        sales += 1
+        snapshot = capture_products(sale, products)
+        if snapshot != (sale.get(SNAPSHOT_FIELD) or {}):
+            snapshots.append(UpdateOne({'_id': sale['id']}, {'$set': {SNAPSHOT_FIELD: snapshot}}))
+            sale[SNAPSHOT_FIELD] = snapshot
+        if len(snapshots) >= batch_size:
+            Sale.objects().bulk_ops(snapshots, ordered=False)
+            snapshots = []
+
+        _add(totals, sale_contribution(sale, products))
+    Sale.objects().bulk_ops(snapshots, ordered=False)
+
+    db = get_db()
+    target = SaleDailyRollup._collection_name
+    staging = db[f"{target}_rebuild"]
+    staging.drop()
+    for keys, options in SaleDailyRollup.get_index_specs():
+        staging.create_index(keys, **options)
+    if totals:
+        staging.insert_many(
+            [{**dict(zip(KEY_FIELDS, key)), **values} for key, values in totals.items()],
+            ordered=False,
+        )
+    staging.rename(target, dropTarget=True)
+    return sales, len(totals)
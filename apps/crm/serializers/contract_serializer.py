@@ -103,12 +103,19 @@ class ContractSerializer(serializers.Serializer):
     # --------------------------
 
     def to_representation(self, instance):
+        # get_related бере дані з QuerySet.prefetch(), якщо вони є
+        supplier = instance.get_related("supplier_id")
+        products = [
+            (item, instance.get_related("products.product_id", item["product_id"]))
+            for item in instance.products
+        ]
+
         return {
             "id": str(instance.id),
             "number": instance.number,
             # "supplier": instance.supplier_id.to_dict() if hasattr(instance.supplier_id, "to_dict") else str(instance.supplier_id),
             "supplier_id": str(instance.supplier_id),
-            "supplier": Supplier.find_by_id(instance.supplier_id).to_dict() if Supplier.find_by_id(instance.supplier_id) else str(instance.supplier_id),    
+            "supplier": supplier.to_dict() if supplier else str(instance.supplier_id),
             "total_amount": instance.total_amount,
             "signing_date": instance.signing_date,
             "status": instance.status,
@@ -116,13 +123,13 @@ class ContractSerializer(serializers.Serializer):
 
             "products": [
                 {
-                    "product": Product.find_by_id(item["product_id"]).to_dict() if Product.find_by_id(item["product_id"]) else None,
+                    "product": product.to_dict() if product else None,
                     "product_id": str(item["product_id"]),
                     "quantity": item["quantity"],
                     "unit_price": item["unit_price"],
                     "subtotal": round(float(item.get("quantity", 0)) * float(item.get("unit_price", 0)), 2),
                 }
-                for item in instance.products
+                for item, product in products
             ],
 
             "created_at": instance.created_at,
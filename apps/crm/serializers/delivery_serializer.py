@@ -150,8 +150,13 @@ class DeliverySerializer(serializers.Serializer):
     # --------------------------
 
     def to_representation(self, instance):
-        sale = Sale.find_by_id(instance.sale_id) if instance.sale_id else None
-        user = User.find_by_id(instance.user_id) if instance.user_id else None
+        # get_related бере дані з QuerySet.prefetch(), якщо вони є
+        sale = instance.get_related("sale_id")
+        user = instance.get_related("user_id")
+        products = [
+            (item, instance.get_related("products.product_id", item["product_id"]))
+            for item in (instance.products if instance.products else [])
+        ]
         
         # Use SaleSerializer to get full sale data including custom_build_service and software_service
         sale_data = SaleSerializer(sale).data if sale else None
@@ -166,13 +171,13 @@ class DeliverySerializer(serializers.Serializer):
             
             "products": [
                 {
-                    "product": Product.find_by_id(item["product_id"]).to_dict() if Product.find_by_id(item["product_id"]) else None,
+                    "product": product.to_dict() if product else None,
                     "product_id": str(item["product_id"]),
                     "quantity": item["quantity"],
                     "unit_price": item["unit_price"],
                     "subtotal": round(float(item.get("quantity", 0)) * float(item.get("unit_price", 0)), 2),
                 }
-                for item in (instance.products if instance.products else [])
+                for item, product in products
             ],
 
             "total_cost": instance.total_cost,
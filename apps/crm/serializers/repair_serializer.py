@@ -25,14 +25,24 @@ class RepairSerializer(serializers.Serializer):
     updated_at = serializers.DateTimeField(read_only=True)
 
     def to_representation(self, instance):
+        # get_related бере дані з QuerySet.prefetch() (Repair.read_model), якщо вони є
+        user = instance.get_related("user_id")
+        product = instance.get_related("product_id")
+        employee = instance.get_related("employee_id")
+        used_products = {
+            str(item.get("product_id")): instance.get_related("products_used.product_id", item.get("product_id"))
+            for item in (instance.products_used or [])
+            if item.get("product_id")
+        }
+
         return {
             "id": str(instance.id),
-            "user": User.find_by_id(instance.user_id).to_dict() if User.find_by_id(instance.user_id) else str(instance.user_id),
-            "product": Product.find_by_id(instance.product_id).to_dict() if Product.find_by_id(instance.product_id) else str(instance.product_id),
+            "user": user.to_dict() if user else str(instance.user_id),
+            "product": product.to_dict() if product else str(instance.product_id),
             
             "products_used": [
                 {
-                    "product": (Product.find_by_id(item.get("product_id")).to_dict() if Product.find_by_id(item.get("product_id")) else None) if item.get("product_id") else None,
+                    "product": used_products[str(item.get("product_id"))].to_dict() if used_products.get(str(item.get("product_id"))) else None,
                     "product_id": str(item.get("product_id", "")),
                     "quantity": item.get("quantity", 0),
                     "unit_price": item.get("unit_price", 0),
@@ -41,7 +51,7 @@ class RepairSerializer(serializers.Serializer):
                 for item in (instance.products_used or [])
             ],
 
-            "employee": Employee.find_by_id(instance.employee_id).to_dict() if Employee.find_by_id(instance.employee_id) else str(instance.employee_id),
+            "employee": employee.to_dict() if employee else str(instance.employee_id),
             "description": instance.description,
             "repair_type": instance.repair_type,
             "status": instance.status,
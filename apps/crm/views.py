@@ -12,7 +12,7 @@ from datetime import datetime
 from django.utils import timezone
 
 # from apps.crm import models as crm_models  # якщо моделі у apps/crm/models.py
-from apps.crm.models import Supplier, Sale, Supply, Employee, Repair, Contract
+from apps.crm.models import Supplier, Sale, SaleDailyRollup, Supply, Employee, Repair, Contract
 from apps.main.models import User, Product, ProductCategory, Delivery
 from apps.api.serializers.main_serializers import ProductViewSerializer
 from apps.crm.serializers.supplier_serializers import SupplierSerializer
@@ -22,6 +22,18 @@ from apps.crm.serializers.sale_serializer import SaleSerializer
 from apps.crm.serializers.repair_serializer import RepairSerializer
 from apps.crm.serializers.delivery_serializer import DeliverySerializer
 import random
+from bson import ObjectId
+from pymongo import UpdateOne
+from core.mongo_orm import Sum, identity_map, reads_from
+
+# Поля, потрібні для <select> у формах (only() - без description/specifications тощо)
+PRODUCT_CHOICE_FIELDS = ('name', 'price', 'category')
+USER_CHOICE_FIELDS = ('username', 'email')
+EMPLOYEE_CHOICE_FIELDS = ('full_name', 'position')
+SUPPLIER_CHOICE_FIELDS = ('name',)
+
+# Скільки секунд dashboard може показувати закешовану кількість відкритих ремонтів
+DASHBOARD_COUNT_CACHE_SECONDS = 30
 
 
 # Custom login_required decorator that works with JWT middleware
@@ -47,24 +59,74 @@ def admin_required(view_func):
     return _wrapped
 
 
+def change_stock(product_items, direction):
+    """
+    Змінити quantity_in_stock для позицій [{product_id, quantity}] атомарно на сервері
+    
+    Один невпорядкований bulk_write, по одному update з pipeline на продукт:
+    direction=1 - повернути на склад, direction=-1 - списати, не нижче 0.
+    Відсутній або null залишок рахується як 0; помилка одного продукту
+    не зупиняє оновлення інших.
+    """
+    deltas = {}
+    for product_item in product_items or []:
+        # Обробляємо як dict, так і object формат
+        if isinstance(product_item, dict):
+            product_id = product_item.get('product_id')
+            quantity = product_item.get('quantity', 0) or 0
+        else:
+            product_id = getattr(product_item, 'product_id', None)
+            quantity = getattr(product_item, 'quantity', 0) or 0
+        
+        try:
+            quantity = int(quantity)
+        except (TypeError, ValueError):
+            continue
+        if product_id and quantity > 0 and ObjectId.is_valid(str(product_id)):
+            product_id = ObjectId(str(product_id))
+            deltas[product_id] = deltas.get(product_id, 0) + quantity
+    
+    if not deltas:
+        return
+    
+    now = datetime.now()
+    current = {'$ifNull': ['$quantity_in_stock', 0]}
+    operations = []
+    for product_id, quantity in deltas.items():
+        if direction > 0:
+            stock = {'$add': [current, quantity]}
+        else:
+            stock = {'$max': [0, {'$subtract': [current, quantity]}]}
+        operations.append(UpdateOne({'_id': product_id}, [{'$set': {'quantity_in_stock': stock, 'updated_at': now}}]))
+    
+    try:
+        Product.objects().bulk_ops(operations, ordered=False)
+    except Exception as e:
+        # Логуємо помилку, але не зриваємо збереження документа
+        print(f"Помилка при оновленні залишків на складі: {e}")
+
 @login_required
 @admin_required
+@identity_map()
 def dashboard(request):
-    # KPI
-    suppliers_count = Supplier.objects().count()
-    employees_count = Employee.objects().count()
-    sales_count = Sale.objects().count()
-    repairs_count = Repair.objects().filter(status__in=['received', 'diagnosed', 'repairing']).count()
-    products_count = Product.objects().count()
-    categories_count = ProductCategory.objects().count()
-    users_count = User.objects().count()
-    deliveries_count = Delivery.objects().count()
+    # KPI: повні колекції - з метаданих, відкриті ремонти - з коротким кешем
+    suppliers_count = Supplier.estimated_count()
+    employees_count = Employee.estimated_count()
+    sales_count = Sale.estimated_count()
+    repairs_count = Repair.objects().filter(
+        status__in=['received', 'diagnosed', 'repairing']
+    ).count(cache_ttl=DASHBOARD_COUNT_CACHE_SECONDS)
+    products_count = Product.estimated_count()
+    categories_count = ProductCategory.estimated_count()
+    users_count = User.estimated_count()
+    deliveries_count = Delivery.estimated_count()
 
     # Latest items
     last_sales_sorted = Sale.objects().order_by('-created_at').limit(10).all()
     last_sales = [SaleSerializer(s).data for s in last_sales_sorted]
 
-    last_repairs_sorted = Repair.objects().order_by('-created_at').limit(10).all()
+    # Клієнти, продукти та працівники - одним $in на колекцію (RepairSerializer бере їх з prefetch)
+    last_repairs_sorted = Repair.read_model(order_by='-created_at').limit(10).read_only().all()
     last_repairs = [RepairSerializer(r).data for r in last_repairs_sorted]
 
     recent_suppliers_sorted = Supplier.objects().order_by('-created_at').limit(8).all()
@@ -91,6 +153,7 @@ def dashboard(request):
 
 @login_required
 @admin_required
+@reads_from('reporting')
 def analytics(request):
     from datetime import datetime, timedelta
     from django.utils import timezone
@@ -99,14 +162,13 @@ def analytics(request):
     current_month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
     
     # Місячний прибуток (сума всіх продажів за поточний місяць)
-    monthly_sales = Sale.objects().filter(
-        sale_date__gte=current_month_start,
+    # Сума та кількість продажів за місяць - з денних підсумків (sales_daily_rollups)
+    monthly_totals = SaleDailyRollup.objects().filter(
+        date__gte=current_month_start,
         status__in=['paid', 'pending']
-    ).all()
-    monthly_revenue = sum(float(sale.total_amount or 0) for sale in monthly_sales)
-    
-    # Кількість продажів за місяць
-    monthly_sales_count = len(monthly_sales)
+    ).aggregate(revenue=Sum('revenue'), count=Sum('sales'))
+    monthly_revenue = float(monthly_totals['revenue'] or 0)
+    monthly_sales_count = int(monthly_totals['count'] or 0)
     
     # Нові клієнти за місяць (користувачі з role='user')
     new_customers = User.objects().filter(
@@ -198,8 +260,9 @@ def suppliers_delete(request, pk):
 # ---------- Contracts ----------
 @login_required
 @admin_required
+@identity_map()
 def contracts_list(request):
-    contracts_sorted = Contract.objects().order_by('-created_at').all()
+    contracts_sorted = Contract.objects().order_by('-created_at').prefetch('supplier_id', 'products.product_id').read_only().all()
     contracts = [ContractSerializer(c).data for c in contracts_sorted]
     return render(request, 'crm/contracts_list.html', {'contracts': contracts})
 
@@ -256,8 +319,8 @@ def contracts_create(request):
             ('completed', 'Completed'),
             ('cancelled', 'Cancelled')
         ]
-        suppliers = Supplier.objects().all()
-        products_qs = Product.objects().all()
+        suppliers = Supplier.objects().only(*SUPPLIER_CHOICE_FIELDS).all()
+        products_qs = Product.objects().only(*PRODUCT_CHOICE_FIELDS).all()
 
         return render(request, "crm/contract_form.html", {
             "action": "create",
@@ -275,8 +338,8 @@ def contracts_create(request):
         ('completed', 'Completed'),
         ('cancelled', 'Cancelled')
     ]
-    suppliers = Supplier.objects().all()
-    products = Product.objects().all()
+    suppliers = Supplier.objects().only(*SUPPLIER_CHOICE_FIELDS).all()
+    products = Product.objects().only(*PRODUCT_CHOICE_FIELDS).all()
     context = {
         'suppliers': suppliers,
         'products': products,
@@ -339,8 +402,8 @@ def contracts_edit(request, pk):
         ('completed', 'Completed'),
         ('cancelled', 'Cancelled')
     ]
-    suppliers = Supplier.objects().all()
-    products = Product.objects().all()
+    suppliers = Supplier.objects().only(*SUPPLIER_CHOICE_FIELDS).all()
+    products = Product.objects().only(*PRODUCT_CHOICE_FIELDS).all()
     
     # Normalize contract products for template (convert dict/ObjectId to simple format)
     contract_products = []
@@ -385,8 +448,9 @@ def contracts_delete(request, pk):
 # ---------- Supplies ----------
 @login_required
 @admin_required
+@identity_map()
 def supplies_list(request):
-    supplies_sorted = Supply.objects().order_by('-created_at').all()
+    supplies_sorted = Supply.objects().order_by('-created_at').read_only().all()
     supplies = [SupplySerializer(s).data for s in supplies_sorted]
     return render(request, 'crm/supplies_list.html', {'supplies': supplies})
 
@@ -455,8 +519,8 @@ def supplies_create(request):
     
     # Filter contracts: only active and completed (not cancelled)
     contracts = Contract.objects().filter(status__in=['active']).all()
-    suppliers = Supplier.objects().all()
-    products = Product.objects().all()
+    suppliers = Supplier.objects().only(*SUPPLIER_CHOICE_FIELDS).all()
+    products = Product.objects().only(*PRODUCT_CHOICE_FIELDS).all()
     
     # Prepare contracts data with products for JavaScript
     contracts_data = []
@@ -551,31 +615,7 @@ def supplies_edit(request, pk):
             
             # Оновлюємо кількість продуктів на складі
             if hasattr(supply, 'products') and supply.products:
-                for product_item in supply.products:
-                    # Обробляємо як dict, так і object формат
-                    if isinstance(product_item, dict):
-                        product_id = product_item.get('product_id')
-                        quantity = product_item.get('quantity', 0) or 0
-                    else:
-                        product_id = getattr(product_item, 'product_id', None)
-                        quantity = getattr(product_item, 'quantity', 0) or 0
-                    
-                    if product_id:
-                        try:
-                            # Конвертуємо product_id в рядок якщо потрібно (find_by_id приймає рядок або ObjectId)
-                            product_id_str = str(product_id) if product_id else None
-                            if product_id_str:
-                                # Знаходимо продукт
-                                product = Product.find_by_id(product_id_str)
-                                if product:
-                                    # Додаємо кількість з поставки до наявної кількості
-                                    current_quantity = getattr(product, 'quantity_in_stock', 0) or 0
-                                    product.quantity_in_stock = current_quantity + int(quantity)
-                                    product.updated_at = datetime.now()
-                                    product.save()
-                        except Exception as e:
-                            # Логуємо помилку, але продовжуємо обробку інших продуктів
-                            print(f"Помилка при оновленні продукту {product_id}: {e}")
+                change_stock(supply.products, 1)
         
         supply.notes = request.POST.get('notes') or None
         supply.updated_at = datetime.now()
@@ -585,8 +625,8 @@ def supplies_edit(request, pk):
     
     # Filter contracts: only active and completed (not cancelled)
     contracts = Contract.objects().filter(status__in=['active', 'completed']).all()
-    suppliers = Supplier.objects().all()
-    products = Product.objects().all()
+    suppliers = Supplier.objects().only(*SUPPLIER_CHOICE_FIELDS).all()
+    products = Product.objects().only(*PRODUCT_CHOICE_FIELDS).all()
     
     # Get contract data for selected contract
     contracts_data = []
@@ -685,14 +725,12 @@ def employees_create(request):
                 errors['email'] = 'Please enter a valid email address'
             else:
                 # Перевірка унікальності email
-                existing_email = Employee.objects().filter(email=email).first()
-                if existing_email:
+                if Employee.objects().filter(email=email).exists():
                     errors['email'] = 'Employee with this email already exists'
         
         if phone:
             # Перевірка унікальності phone
-            existing_phone = Employee.objects().filter(phone=phone).first()
-            if existing_phone:
+            if Employee.objects().filter(phone=phone).exists():
                 errors['phone'] = 'Employee with this phone number already exists'
         
         if salary:
@@ -781,14 +819,12 @@ def employees_edit(request, pk):
                 errors['email'] = 'Please enter a valid email address'
             else:
                 # Перевірка унікальності email (ігноруємо поточного працівника)
-                existing_email = Employee.objects().filter(email=email).first()
-                if existing_email and str(existing_email.id) != str(pk):
+                if Employee.objects().filter(email=email, id__ne=pk).exists():
                     errors['email'] = 'Employee with this email already exists'
         
         if phone:
             # Перевірка унікальності phone (ігноруємо поточного працівника)
-            existing_phone = Employee.objects().filter(phone=phone).first()
-            if existing_phone and str(existing_phone.id) != str(pk):
+            if Employee.objects().filter(phone=phone, id__ne=pk).exists():
                 errors['phone'] = 'Employee with this phone number already exists'
         
         if salary:
@@ -847,8 +883,9 @@ def employees_delete(request, pk):
 # ---------- Sales ----------
 @login_required
 @admin_required
+@identity_map()
 def sales_list(request):
-    sales_sorted = Sale.objects().order_by('-created_at').all()
+    sales_sorted = Sale.objects().order_by('-created_at').read_only().all()
     sales = [SaleSerializer(s).data for s in sales_sorted]
     return render(request, 'crm/sales_list.html', {'sales': sales})
 
@@ -969,55 +1006,19 @@ def sales_create(request):
         
         # Віднімаємо кількість продуктів, які продалися
         if products:
-            for product_item in products:
-                product_id = product_item.get('product_id')
-                quantity = product_item.get('quantity', 0) or 0
-                
-                if product_id and quantity > 0:
-                    try:
-                        product_id_str = str(product_id) if product_id else None
-                        if product_id_str:
-                            product = Product.find_by_id(product_id_str)
-                            if product:
-                                current_quantity = getattr(product, 'quantity_in_stock', 0) or 0
-                                # Віднімаємо кількість, але не дозволяємо від'ємні значення
-                                new_quantity = max(0, current_quantity - int(quantity))
-                                product.quantity_in_stock = new_quantity
-                                product.updated_at = datetime.now()
-                                product.save()
-                    except Exception as e:
-                        # Логуємо помилку, але продовжуємо обробку інших продуктів
-                        print(f"Помилка при оновленні продукту {product_id}: {e}")
+            change_stock(products, -1)
         
         # Віднімаємо кількість продуктів, які використалися для збірки (custom build)
         if custom_build_config and custom_build_config.get('data') and custom_build_config['data'].get('products'):
             custom_build_products = custom_build_config['data']['products']
-            for product_item in custom_build_products:
-                product_id = product_item.get('product_id')
-                quantity = product_item.get('quantity', 0) or 0
-                
-                if product_id and quantity > 0:
-                    try:
-                        product_id_str = str(product_id) if product_id else None
-                        if product_id_str:
-                            product = Product.find_by_id(product_id_str)
-                            if product:
-                                current_quantity = getattr(product, 'quantity_in_stock', 0) or 0
-                                # Віднімаємо кількість, але не дозволяємо від'ємні значення
-                                new_quantity = max(0, current_quantity - int(quantity))
-                                product.quantity_in_stock = new_quantity
-                                product.updated_at = datetime.now()
-                                product.save()
-                    except Exception as e:
-                        # Логуємо помилку, але продовжуємо обробку інших продуктів
-                        print(f"Помилка при оновленні продукту з custom build {product_id}: {e}")
+            change_stock(custom_build_products, -1)
         
         messages.success(request, 'Sale created successfully')
         return redirect('crm:sales_list')
     
-    users = User.objects().all()
-    employees = Employee.objects().all()
-    products = Product.objects().filter(quantity_in_stock__gt=0).all()
+    users = User.objects().only(*USER_CHOICE_FIELDS).all()
+    employees = Employee.objects().only(*EMPLOYEE_CHOICE_FIELDS).all()
+    products = Product.objects().filter(quantity_in_stock__gt=0).only(*PRODUCT_CHOICE_FIELDS).all()
     return render(request, 'crm/sale_form.html', {
         'users': users,
         'employees': employees,
@@ -1163,28 +1164,7 @@ def sales_edit(request, pk):
         if new_status == 'cancelled' and old_status != 'cancelled':
             # Повертаємо кількість проданих продуктів на склад
             if hasattr(sale, 'products') and sale.products:
-                for product_item in sale.products:
-                    # Обробляємо як dict, так і object формат
-                    if isinstance(product_item, dict):
-                        product_id = product_item.get('product_id')
-                        quantity = product_item.get('quantity', 0) or 0
-                    else:
-                        product_id = getattr(product_item, 'product_id', None)
-                        quantity = getattr(product_item, 'quantity', 0) or 0
-                    
-                    if product_id and quantity > 0:
-                        try:
-                            product_id_str = str(product_id) if product_id else None
-                            if product_id_str:
-                                product = Product.find_by_id(product_id_str)
-                                if product:
-                                    # Додаємо кількість назад на склад
-                                    current_quantity = getattr(product, 'quantity_in_stock', 0) or 0
-                                    product.quantity_in_stock = current_quantity + int(quantity)
-                                    product.updated_at = datetime.now()
-                                    product.save()
-                        except Exception as e:
-                            print(f"Помилка при поверненні продукту {product_id} на склад: {e}")
+                change_stock(sale.products, 1)
             
             # Повертаємо кількість продуктів зі збірки на склад
             if hasattr(sale, 'custom_build_service') and sale.custom_build_service:
@@ -1197,55 +1177,13 @@ def sales_edit(request, pk):
                 else:
                     custom_build_products = []
                 
-                for product_item in custom_build_products:
-                    if isinstance(product_item, dict):
-                        product_id = product_item.get('product_id')
-                        quantity = product_item.get('quantity', 0) or 0
-                    else:
-                        product_id = getattr(product_item, 'product_id', None)
-                        quantity = getattr(product_item, 'quantity', 0) or 0
-                    
-                    if product_id and quantity > 0:
-                        try:
-                            product_id_str = str(product_id) if product_id else None
-                            if product_id_str:
-                                product = Product.find_by_id(product_id_str)
-                                if product:
-                                    # Додаємо кількість назад на склад
-                                    current_quantity = getattr(product, 'quantity_in_stock', 0) or 0
-                                    product.quantity_in_stock = current_quantity + int(quantity)
-                                    product.updated_at = datetime.now()
-                                    product.save()
-                        except Exception as e:
-                            print(f"Помилка при поверненні продукту з custom build {product_id} на склад: {e}")
+                change_stock(custom_build_products, 1)
         
         # Обробка зміни статусу з 'cancelled' на інший - знову віднімаємо продукти
         elif old_status == 'cancelled' and new_status != 'cancelled':
             # Віднімаємо кількість проданих продуктів зі складу
             if hasattr(sale, 'products') and sale.products:
-                for product_item in sale.products:
-                    # Обробляємо як dict, так і object формат
-                    if isinstance(product_item, dict):
-                        product_id = product_item.get('product_id')
-                        quantity = product_item.get('quantity', 0) or 0
-                    else:
-                        product_id = getattr(product_item, 'product_id', None)
-                        quantity = getattr(product_item, 'quantity', 0) or 0
-                    
-                    if product_id and quantity > 0:
-                        try:
-                            product_id_str = str(product_id) if product_id else None
-                            if product_id_str:
-                                product = Product.find_by_id(product_id_str)
-                                if product:
-                                    # Віднімаємо кількість, але не дозволяємо від'ємні значення
-                                    current_quantity = getattr(product, 'quantity_in_stock', 0) or 0
-                                    new_quantity = max(0, current_quantity - int(quantity))
-                                    product.quantity_in_stock = new_quantity
-                                    product.updated_at = datetime.now()
-                                    product.save()
-                        except Exception as e:
-                            print(f"Помилка при відніманні продукту {product_id} зі складу: {e}")
+                change_stock(sale.products, -1)
             
             # Віднімаємо кількість продуктів зі збірки зі складу
             if hasattr(sale, 'custom_build_service') and sale.custom_build_service:
@@ -1258,36 +1196,15 @@ def sales_edit(request, pk):
                 else:
                     custom_build_products = []
                 
-                for product_item in custom_build_products:
-                    if isinstance(product_item, dict):
-                        product_id = product_item.get('product_id')
-                        quantity = product_item.get('quantity', 0) or 0
-                    else:
-                        product_id = getattr(product_item, 'product_id', None)
-                        quantity = getattr(product_item, 'quantity', 0) or 0
-                    
-                    if product_id and quantity > 0:
-                        try:
-                            product_id_str = str(product_id) if product_id else None
-                            if product_id_str:
-                                product = Product.find_by_id(product_id_str)
-                                if product:
-                                    # Віднімаємо кількість, але не дозволяємо від'ємні значення
-                                    current_quantity = getattr(product, 'quantity_in_stock', 0) or 0
-                                    new_quantity = max(0, current_quantity - int(quantity))
-                                    product.quantity_in_stock = new_quantity
-                                    product.updated_at = datetime.now()
-                                    product.save()
-                        except Exception as e:
-                            print(f"Помилка при відніманні продукту з custom build {product_id} зі складу: {e}")
+                change_stock(custom_build_products, -1)
         
         sale.save()
         messages.success(request, 'Sale updated successfully')
         return redirect('crm:sales_list')
     
-    users = User.objects().all()
-    employees = Employee.objects().all()
-    products = Product.objects().all()
+    users = User.objects().only(*USER_CHOICE_FIELDS).all()
+    employees = Employee.objects().only(*EMPLOYEE_CHOICE_FIELDS).all()
+    products = Product.objects().only(*PRODUCT_CHOICE_FIELDS).all()
     return render(request, 'crm/sale_form.html', {
         'sale': sale,
         'users': users,
@@ -1311,8 +1228,9 @@ def sales_delete(request, pk):
 # ---------- Repairs ----------
 @login_required
 @admin_required
+@identity_map()
 def repairs_list(request):
-    repairs_sorted = Repair.objects().order_by('-created_at').all()
+    repairs_sorted = Repair.read_model(order_by='-created_at').read_only().all()
     repairs = [RepairSerializer(r).data for r in repairs_sorted]
     return render(request, 'crm/repairs_list.html', {'repairs': repairs})
 
@@ -1330,9 +1248,9 @@ def repairs_create(request):
         # Validate required fields
         if not user_id:
             messages.error(request, 'Customer is required')
-            users = User.objects().all()
-            products = Product.objects().filter(quantity_in_stock__gt=0).all()
-            employees = Employee.objects().all()
+            users = User.objects().only(*USER_CHOICE_FIELDS).all()
+            products = Product.objects().filter(quantity_in_stock__gt=0).only(*PRODUCT_CHOICE_FIELDS).all()
+            employees = Employee.objects().only(*EMPLOYEE_CHOICE_FIELDS).all()
             return render(request, 'crm/repair_form.html', {
                 'users': users,
                 'products': products,
@@ -1342,9 +1260,9 @@ def repairs_create(request):
         
         if not employee_id:
             messages.error(request, 'Employee is required')
-            users = User.objects().all()
-            products = Product.objects().filter(quantity_in_stock__gt=0).all()
-            employees = Employee.objects().all()
+            users = User.objects().only(*USER_CHOICE_FIELDS).all()
+            products = Product.objects().filter(quantity_in_stock__gt=0).only(*PRODUCT_CHOICE_FIELDS).all()
+            employees = Employee.objects().only(*EMPLOYEE_CHOICE_FIELDS).all()
             return render(request, 'crm/repair_form.html', {
                 'users': users,
                 'products': products,
@@ -1354,9 +1272,9 @@ def repairs_create(request):
         
         if not description:
             messages.error(request, 'Description is required')
-            users = User.objects().all()
-            products = Product.objects().filter(quantity_in_stock__gt=0).all()
-            employees = Employee.objects().all()
+            users = User.objects().only(*USER_CHOICE_FIELDS).all()
+            products = Product.objects().filter(quantity_in_stock__gt=0).only(*PRODUCT_CHOICE_FIELDS).all()
+            employees = Employee.objects().only(*EMPLOYEE_CHOICE_FIELDS).all()
             return render(request, 'crm/repair_form.html', {
                 'users': users,
                 'products': products,
@@ -1471,9 +1389,9 @@ def repairs_create(request):
         
         if missing_fields:
             messages.error(request, f'Missing required fields: {", ".join(missing_fields)}')
-            users = User.objects().all()
-            products = Product.objects().filter(quantity_in_stock__gt=0).all()
-            employees = Employee.objects().all()
+            users = User.objects().only(*USER_CHOICE_FIELDS).all()
+            products = Product.objects().filter(quantity_in_stock__gt=0).only(*PRODUCT_CHOICE_FIELDS).all()
+            employees = Employee.objects().only(*EMPLOYEE_CHOICE_FIELDS).all()
             return render(request, 'crm/repair_form.html', {
                 'users': users,
                 'products': products,
@@ -1486,25 +1404,7 @@ def repairs_create(request):
             
             # Віднімаємо кількість використаних продуктів зі складу
             if products_used:
-                for product_item in products_used:
-                    product_id = product_item.get('product_id')
-                    quantity = product_item.get('quantity', 0) or 0
-                    
-                    if product_id and quantity > 0:
-                        try:
-                            product_id_str = str(product_id) if product_id else None
-                            if product_id_str:
-                                product = Product.find_by_id(product_id_str)
-                                if product:
-                                    # Віднімаємо кількість, але не дозволяємо від'ємні значення
-                                    current_quantity = getattr(product, 'quantity_in_stock', 0) or 0
-                                    new_quantity = max(0, current_quantity - int(quantity))
-                                    product.quantity_in_stock = new_quantity
-                                    product.updated_at = datetime.now()
-                                    product.save()
-                        except Exception as e:
-                            # Логуємо помилку, але продовжуємо обробку інших продуктів
-                            print(f"Помилка при відніманні продукту {product_id} зі складу: {e}")
+                change_stock(products_used, -1)
             
             messages.success(request, 'Repair created successfully')
             return redirect('crm:repairs_list')
@@ -1515,18 +1415,18 @@ def repairs_create(request):
             print(error_details, file=sys.stderr)
             print("===========================", file=sys.stderr)
             messages.error(request, f'Validation error: {str(e)}. Please check all required fields are filled.')
-            users = User.objects().all()
-            products = Product.objects().filter(quantity_in_stock__gt=0).all()
-            employees = Employee.objects().all()
+            users = User.objects().only(*USER_CHOICE_FIELDS).all()
+            products = Product.objects().filter(quantity_in_stock__gt=0).only(*PRODUCT_CHOICE_FIELDS).all()
+            employees = Employee.objects().only(*EMPLOYEE_CHOICE_FIELDS).all()
             return render(request, 'crm/repair_form.html', {
                 'users': users,
                 'products': products,
                 'employees': employees,
                 'form': request.POST
             })
-    users = User.objects().all()
-    products = Product.objects().filter(quantity_in_stock__gt=0).all()
-    employees = Employee.objects().all()
+    users = User.objects().only(*USER_CHOICE_FIELDS).all()
+    products = Product.objects().filter(quantity_in_stock__gt=0).only(*PRODUCT_CHOICE_FIELDS).all()
+    employees = Employee.objects().only(*EMPLOYEE_CHOICE_FIELDS).all()
     return render(request, 'crm/repair_form.html', {
         'users': users,
         'products': products,
@@ -1582,56 +1482,18 @@ def repairs_edit(request, pk):
         
         # Повертаємо кількість старих продуктів на склад
         if old_products_used:
-            for product_item in old_products_used:
-                # Обробляємо як dict, так і object формат
-                if isinstance(product_item, dict):
-                    product_id = product_item.get('product_id')
-                    quantity = product_item.get('quantity', 0) or 0
-                else:
-                    product_id = getattr(product_item, 'product_id', None)
-                    quantity = getattr(product_item, 'quantity', 0) or 0
-                
-                if product_id and quantity > 0:
-                    try:
-                        product_id_str = str(product_id) if product_id else None
-                        if product_id_str:
-                            product = Product.find_by_id(product_id_str)
-                            if product:
-                                # Повертаємо кількість на склад
-                                current_quantity = getattr(product, 'quantity_in_stock', 0) or 0
-                                product.quantity_in_stock = current_quantity + int(quantity)
-                                product.updated_at = datetime.now()
-                                product.save()
-                    except Exception as e:
-                        print(f"Помилка при поверненні продукту {product_id} на склад: {e}")
+            change_stock(old_products_used, 1)
         
         # Віднімаємо кількість нових продуктів зі складу
         if products_used:
-            for product_item in products_used:
-                product_id = product_item.get('product_id')
-                quantity = product_item.get('quantity', 0) or 0
-                
-                if product_id and quantity > 0:
-                    try:
-                        product_id_str = str(product_id) if product_id else None
-                        if product_id_str:
-                            product = Product.find_by_id(product_id_str)
-                            if product:
-                                # Віднімаємо кількість, але не дозволяємо від'ємні значення
-                                current_quantity = getattr(product, 'quantity_in_stock', 0) or 0
-                                new_quantity = max(0, current_quantity - int(quantity))
-                                product.quantity_in_stock = new_quantity
-                                product.updated_at = datetime.now()
-                                product.save()
-                    except Exception as e:
-                        print(f"Помилка при відніманні продукту {product_id} зі складу: {e}")
+            change_stock(products_used, -1)
         
         messages.success(request, 'Repair updated successfully')
         return redirect('crm:repairs_list')
     
-    users = User.objects().all()
-    products = Product.objects().all()
-    employees = Employee.objects().all()
+    users = User.objects().only(*USER_CHOICE_FIELDS).all()
+    products = Product.objects().only(*PRODUCT_CHOICE_FIELDS).all()
+    employees = Employee.objects().only(*EMPLOYEE_CHOICE_FIELDS).all()
     
     # Normalize products_used for template rendering
     repair_products_used = []
@@ -1669,8 +1531,9 @@ def repairs_delete(request, pk):
 # ---------- Deliveries ----------
 @login_required
 @admin_required
+@identity_map()
 def deliveries_list(request):
-    deliveries_sorted = Delivery.objects().order_by('-created_at').all()
+    deliveries_sorted = Delivery.objects().order_by('-created_at').prefetch('sale_id', 'user_id', 'products.product_id').all()
     deliveries = [DeliverySerializer(d).data for d in deliveries_sorted]
     return render(request, 'crm/deliveries_list.html', {'deliveries': deliveries})
 
@@ -1680,8 +1543,8 @@ def deliveries_create(request):
     # Get all sales with status 'paid' (оплачено), products, users for dropdowns
     sales_sorted = Sale.objects().filter(status='paid').order_by('-sale_date').all()
     sales = [SaleSerializer(s).data for s in sales_sorted]
-    products_qs = Product.objects().all()
-    users = User.objects().all()
+    products_qs = Product.objects().only(*PRODUCT_CHOICE_FIELDS).all()
+    users = User.objects().only(*USER_CHOICE_FIELDS).all()
     
     if request.method == 'POST':
         data = request.POST.copy()
@@ -1805,8 +1668,8 @@ def deliveries_edit(request, pk):
     # Get all sales with status 'paid' (оплачено), products, users for dropdowns
     sales_sorted = Sale.objects().order_by('-sale_date').all()
     sales = [SaleSerializer(s).data for s in sales_sorted]
-    products = Product.objects().all()
-    users = User.objects().all()
+    products = Product.objects().only(*PRODUCT_CHOICE_FIELDS).all()
+    users = User.objects().only(*USER_CHOICE_FIELDS).all()
     
     if request.method == 'POST':
         data = request.POST.copy()
@@ -1934,8 +1797,9 @@ def deliveries_edit(request, pk):
     if delivery.products:
         for item in delivery.products:
             if isinstance(item, dict):
+                product = delivery.get_related("products.product_id", item["product_id"])
                 delivery_products.append({
-                    "product": Product.find_by_id(item["product_id"]).to_dict() if Product.find_by_id(item["product_id"]) else None,
+                    "product": product.to_dict() if product else None,
                     'product_id': str(item.get('product_id', '')),
                     'quantity': item.get('quantity', 0) or 0,
                     'unit_price': item.get('unit_price', 0) or 0,
@@ -2022,12 +1886,12 @@ def users_create(request):
         
         if not username or len(username) < 3:
             errors['username'] = 'Username must be at least 3 characters'
-        elif User.objects().filter(username=username).first():
+        elif User.objects().filter(username=username).exists():
             errors['username'] = 'Username already exists'
         
         if not email or '@' not in email:
             errors['email'] = 'Valid email is required'
-        elif User.objects().filter(email=email).first():
+        elif User.objects().filter(email=email).exists():
             errors['email'] = 'Email already exists'
         
         if not password or len(password) < 6:
@@ -2118,12 +1982,12 @@ def users_edit(request, pk):
         
         if not username or len(username) < 3:
             errors['username'] = 'Username must be at least 3 characters'
-        elif username != user.username and User.objects().filter(username=username).first():
+        elif username != user.username and User.objects().filter(username=username).exists():
             errors['username'] = 'Username already exists'
         
         if not email or '@' not in email:
             errors['email'] = 'Valid email is required'
-        elif email != user.email and User.objects().filter(email=email).first():
+        elif email != user.email and User.objects().filter(email=email).exists():
             errors['email'] = 'Email already exists'
         
         # Пароль не обов'язковий при редагуванні
@@ -2237,16 +2101,13 @@ def product_categories_create(request):
         # Валідація унікальності
         errors = {}
         
-        existing_name = ProductCategory.objects().filter(name=name).first()
-        if existing_name:
+        if ProductCategory.objects().filter(name=name).exists():
             errors['name'] = 'Category with this name already exists'
         
-        existing_slug = ProductCategory.objects().filter(slug=slug).first()
-        if existing_slug:
+        if ProductCategory.objects().filter(slug=slug).exists():
             errors['slug'] = 'Category with this slug already exists'
         
-        existing_image_url = ProductCategory.objects().filter(image_url=image_url).first()
-        if existing_image_url:
+        if ProductCategory.objects().filter(image_url=image_url).exists():
             errors['image_url'] = 'Category with this image URL already exists'
         
         if errors:
@@ -2295,16 +2156,13 @@ def product_categories_edit(request, pk):
         # Валідація унікальності
         errors = {}
         
-        existing_name = ProductCategory.objects().filter(name=name).first()
-        if existing_name and str(existing_name.id) != str(pk):
+        if ProductCategory.objects().filter(name=name, id__ne=pk).exists():
             errors['name'] = 'Category with this name already exists'
         
-        existing_slug = ProductCategory.objects().filter(slug=slug).first()
-        if existing_slug and str(existing_slug.id) != str(pk):
+        if ProductCategory.objects().filter(slug=slug, id__ne=pk).exists():
             errors['slug'] = 'Category with this slug already exists'
         
-        existing_image_url = ProductCategory.objects().filter(image_url=image_url).first()
-        if existing_image_url and str(existing_image_url.id) != str(pk):
+        if ProductCategory.objects().filter(image_url=image_url, id__ne=pk).exists():
             errors['image_url'] = 'Category with this image URL already exists'
         
         if errors:
@@ -2346,7 +2204,7 @@ def product_categories_delete(request, pk):
 @login_required
 @admin_required
 def products_list(request):
-    products = Product.objects().order_by('-created_at').all()
+    products = Product.objects().order_by('-created_at').read_only().all()
     categories = ProductCategory.objects().all()
     return render(request, 'crm/products_list.html', {
         'products': products,
@@ -2394,12 +2252,10 @@ def products_create(request):
         # Валідація унікальності
         errors = {}
         
-        existing_name = Product.objects().filter(name=name).first()
-        if existing_name:
+        if Product.objects().filter(name=name).exists():
             errors['name'] = 'Product with this name already exists'
         
-        existing_image_url = Product.objects().filter(image_url=image_url).first()
-        if existing_image_url:
+        if Product.objects().filter(image_url=image_url).exists():
             errors['image_url'] = 'Product with this image URL already exists'
         
         if errors:
@@ -2510,12 +2366,10 @@ def products_edit(request, pk):
         # Валідація унікальності
         errors = {}
         
-        existing_name = Product.objects().filter(name=name).first()
-        if existing_name and str(existing_name.id) != str(pk):
+        if Product.objects().filter(name=name, id__ne=pk).exists():
             errors['name'] = 'Product with this name already exists'
         
-        existing_image_url = Product.objects().filter(image_url=image_url).first()
-        if existing_image_url and str(existing_image_url.id) != str(pk):
+        if Product.objects().filter(image_url=image_url, id__ne=pk).exists():
             errors['image_url'] = 'Product with this image URL already exists'
         
         if errors:
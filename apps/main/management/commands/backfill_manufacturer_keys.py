@@ -0,0 +1,36 @@
+# apps/main/management/commands/backfill_manufacturer_keys.py
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+
+from apps.main.models import Product, normalize_manufacturer
+
+
+class Command(BaseCommand):
+    help = (
+        "Заповнити Product.manufacturer_key для продуктів, збережених до його появи "
+        "або змінених в обхід pre_save() (QuerySet.update, bulk_ops, запис напряму в колекцію)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Розмір пачки курсора та bulk_write")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        products = Product.objects().only('manufacturer', 'manufacturer_key')
+
+        operations = []
+        updated = 0
+        for product in products.iterator(batch_size=batch_size):
+            key = normalize_manufacturer(product.manufacturer)
+            if product.manufacturer_key != key:
+                operations.append(UpdateOne({'_id': product.id}, {'$set': {'manufacturer_key': key}}))
+            if len(operations) >= batch_size:
+                Product.objects().bulk_ops(operations, ordered=False)
+                updated += len(operations)
+                operations = []
+
+        if operations:
+            Product.objects().bulk_ops(operations, ordered=False)
+            updated += len(operations)
+
+        self.stdout.write(self.style.SUCCESS(f"manufacturer_key оновлено для {updated} продуктів"))
@@ -0,0 +1,43 @@
+# apps/main/management/commands/ensure_indexes.py
+from django.core.management.base import BaseCommand, CommandError
+
+from core.mongo_orm import ModelMeta
+
+
+class Command(BaseCommand):
+    help = "Створити відсутні індекси MongoDB для всіх моделей та показати зайві"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', action='append', help="Тільки вказані моделі (напр. --model Sale)")
+        parser.add_argument('--dry-run', action='store_true', help="Показати, що буде створено, без змін у базі")
+
+    def handle(self, *args, **options):
+        models = sorted(ModelMeta._registry.items())
+        if options['model']:
+            unknown = set(options['model']) - {name for name, _ in models}
+            if unknown:
+                raise CommandError(f"Невідомі моделі: {', '.join(sorted(unknown))}")
+            models = [(name, model) for name, model in models if name in options['model']]
+
+        has_errors = False
+        for name, model in models:
+            # Вбудовані моделі (ProductListItem тощо) не мають власних колекцій та індексів
+            if not model.get_index_specs():
+                continue
+
+            report = model.ensure_indexes(dry_run=options['dry_run'])
+            self.stdout.write(f"{name} ({model._collection_name})")
+
+            for index_name in report['created']:
+                verb = "буде створено" if options['dry_run'] else "створено"
+                self.stdout.write(self.style.SUCCESS(f"  + {index_name} ({verb})"))
+            for index_name in report['existing']:
+                self.stdout.write(f"  = {index_name}")
+            for index_name in report['extra']:
+                self.stdout.write(self.style.WARNING(f"  ? {index_name} (немає в _indexes)"))
+            for index_name, message in report['errors'].items():
+                has_errors = True
+                self.stdout.write(self.style.ERROR(f"  ! {index_name}: {message}"))
+
+        if has_errors:
+            raise CommandError("Деякі індекси не вдалося синхронізувати")
@@ -0,0 +1,98 @@
+# apps/main/management/commands/index_report.py
+from bson import json_util
+from django.core.management.base import BaseCommand
+
+from core.mongo_connection import get_db
+from core.mongo_orm import ModelMeta, _normalize_index
+from core.query_profiler import SHAPES_COLLECTION, example_value, plan_stages, query_profiler, suggest_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Звіт по формах запитів, зібраних з MONGO_QUERY_PROFILING=True: "
+        "explain() для найважчих, COLLSCAN, сортування в пам'яті та пропозиції для _indexes"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=20, help="Скільки форм аналізувати (за сумарним часом)")
+        parser.add_argument('--collection', help="Тільки одна колекція")
+        parser.add_argument('--reset', action='store_true', help="Очистити зібрану статистику")
+
+    def handle(self, *args, **options):
+        db = get_db()
+        shapes = db[SHAPES_COLLECTION]
+
+        if options['reset']:
+            deleted = shapes.delete_many({}).deleted_count
+            self.stdout.write(self.style.SUCCESS(f"Видалено форм запитів: {deleted}"))
+            return
+
+        # Дописати те, що накопичилось у поточному процесі
+        query_profiler.flush()
+
+        query = {'collection': options['collection']} if options['collection'] else {}
+        top = list(shapes.find(query).sort('total_ms', -1).limit(options['top']))
+        if not top:
+            self.stdout.write(self.style.WARNING(
+                "Немає даних. Увімкніть MONGO_QUERY_PROFILING=True та попрацюйте з сайтом."
+            ))
+            return
+
+        models = {model._collection_name: name for name, model in ModelMeta._registry.items()}
+        suggestions = {}
+
+        for shape in top:
+            query_filter = json_util.loads(shape['filter'])
+            sort = [tuple(item) for item in shape['sort']]
+            avg_ms = shape['total_ms'] / shape['count'] if shape['count'] else 0
+
+            self.stdout.write(
+                f"\n{shape['collection']}.{shape['operation']}  "
+                f"x{shape['count']}  avg {avg_ms:.1f}ms  max {shape['max_ms']:.1f}ms"
+            )
+            self.stdout.write(f"  filter: {shape['filter']}")
+            if sort:
+                self.stdout.write(f"  sort:   {sort}")
+
+            try:
+                cursor = db[shape['collection']].find(example_value(query_filter))
+                if sort:
+                    cursor = cursor.sort(sort)
+                plan = cursor.explain().get('queryPlanner', {}).get('winningPlan', {})
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f"  explain() не вдався: {e}"))
+                continue
+
+            stages = plan_stages(plan)
+            stage_names = {stage['stage'] for stage in stages}
+            index_names = sorted({stage['indexName'] for stage in stages if stage.get('indexName')})
+
+            problems = []
+            if 'COLLSCAN' in stage_names:
+                problems.append('COLLSCAN')
+            if 'SORT' in stage_names:
+                problems.append("сортування в пам'яті")
+
+            if not problems:
+                self.stdout.write(self.style.SUCCESS(f"  OK: {', '.join(index_names) or ', '.join(sorted(stage_names))}"))
+                continue
+
+            self.stdout.write(self.style.ERROR(f"  {', '.join(problems)}"))
+            suggestion = suggest_index(query_filter, sort)
+            if suggestion:
+                model_name = models.get(shape['collection'], shape['collection'])
+                suggestions.setdefault(model_name, [])
+                if suggestion not in suggestions[model_name]:
+                    suggestions[model_name].append(suggestion)
+                self.stdout.write(f"  пропозиція: {model_name}._indexes += [{suggestion!r}]")
+
+        if suggestions:
+            self.stdout.write("\nПропоновані індекси:")
+            for model_name, entries in sorted(suggestions.items()):
+                model = ModelMeta._registry.get(model_name)
+                declared = {index_options['name'] for _, index_options in model.get_index_specs()} if model else set()
+                self.stdout.write(f"  {model_name}:")
+                for entry in entries:
+                    name = _normalize_index(entry)[1]['name']
+                    note = "  (вже оголошено - запустіть ensure_indexes)" if name in declared else ""
+                    self.stdout.write(f"    {entry!r},{note}")
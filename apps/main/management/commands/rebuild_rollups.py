@@ -0,0 +1,23 @@
+# apps/main/management/commands/rebuild_rollups.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.crm import rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Перерахувати sales_daily_rollups з усіх продажів: початкове заповнення "
+        "та виправлення розбіжностей (запускати в тихий час)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Розмір пачки курсора продажів")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        sales, rows = rollups.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"sales_daily_rollups: {rows} рядків з {sales} продажів за {time.perf_counter() - started:.1f}s"
+        ))
@@ -9,6 +9,9 @@ from datetime import datetime
 class User(orm.Model):
     """Модель користувача"""
     _collection_name = "users"
+    _indexes = [
+        ['role', 'created_at'],  # нові клієнти по місяцях (analytics)
+    ]
     
     ROLE_CHOICES = [
         ("user", "User"),
@@ -80,9 +83,26 @@ class ProductSpecification(orm.Model):
     value = orm.StringField(required=True)
 
 
+def normalize_manufacturer(value):
+    """Ключ виробника для пошуку по індексу: '  ASUS  Tek ' -> 'asus tek'"""
+    return ' '.join((value or '').split()).casefold()
+
+
 class Product(orm.Model):
     """Модель товару/комплектуючого"""
     _collection_name = 'products'
+    _indexes = [
+        ['category', 'product_type', 'manufacturer', 'price'],  # фільтри каталогу
+        ['product_type', 'price'],  # комплектуючі до ціни (query5)
+        'manufacturer',
+        'manufacturer_key',  # пошук виробника за префіксом (query2)
+        # Keyset пагінація /api/products/ (sort_by + _id)
+        ['created_at', '_id'],
+        ['price', '_id'],
+        ['name', '_id'],
+        # Випадаючі списки "в наявності"
+        {'fields': 'quantity_in_stock', 'partial': {'quantity_in_stock': {'$gt': 0}}},
+    ]
 
     COMPONENT_CHOICES = [
         ('cpu', 'Процесор'),
@@ -123,6 +143,7 @@ class Product(orm.Model):
     category = orm.StringField(required=True)
     product_type = orm.StringField(required=True, choices=PRODUCT_TYPE_CHOICES)
     manufacturer = orm.StringField(required=True, max_length=150)
+    manufacturer_key = orm.StringField()  # normalize_manufacturer(manufacturer), заповнюється в pre_save
     # model = orm.StringField(max_length=100)
     specifications = orm.ListField(orm.EmbeddedField(ProductSpecification), default=list)
     price = orm.FloatField(required=True, default=0.0)  # Додано default
@@ -138,6 +159,23 @@ class Product(orm.Model):
         self.updated_at = datetime.now()
         self.save()
 
+    def pre_save(self):
+        # Частково завантажений продукт (only()/defer()) може не мати manufacturer
+        manufacturer = getattr(self, 'manufacturer', None)
+        if manufacturer is not None:
+            self.manufacturer_key = normalize_manufacturer(manufacturer)
+
+    @classmethod
+    def manufacturer_filter(cls, manufacturer):
+        """
+        Умова filter() для продуктів, чий виробник починається з manufacturer
+
+        Діапазон по manufacturer_key замість regex - пошук іде межами індексу
+        і не залежить від регістру та зайвих пробілів.
+        """
+        key = normalize_manufacturer(manufacturer)
+        return {'manufacturer_key__gte': key, 'manufacturer_key__lt': key + '\U0010ffff'}
+
 
 class ProductListItem(orm.Model):
     """Модель товарів у списку покупки"""
@@ -213,6 +251,10 @@ class CustomBuildConfig(orm.Model):
 class PasswordResetToken(orm.Model):
     """Модель токену для скидання пароля"""
     _collection_name = "password_reset_tokens"
+    _indexes = [
+        ['user_id', 'used'],
+        {'fields': 'expires_at', 'ttl': 0},  # MongoDB сам видаляє прострочені токени
+    ]
     
     user_id = orm.ReferenceField(User, required=True)
     token = orm.StringField(required=True, unique=True)
@@ -229,11 +271,9 @@ class PasswordResetToken(orm.Model):
         # Генеруємо унікальний токен
         token = secrets.token_urlsafe(32)
         
-        # Видаляємо старі невикористані токени для цього користувача
+        # Видаляємо старі невикористані токени для цього користувача (одним delete_many)
         try:
-            old_tokens = cls.objects().filter(user_id=user.id, used=False).all()
-            for old_token in old_tokens:
-                old_token.delete()
+            cls.objects().filter(user_id=user.id, used=False).delete()
         except:
             pass  # Якщо помилка, продовжуємо
         
@@ -287,6 +327,10 @@ class PasswordResetToken(orm.Model):
 class Delivery(orm.Model):
     """Модель доставок"""
     _collection_name = "deliveries"
+    _indexes = [
+        '-created_at',
+        'sale_id',
+    ]
 
     STATUS_CHOICES = [
         ('ordered', 'Замовлено'),
@@ -90,15 +90,15 @@ def categories(request):
         products_queryset = products_queryset.filter(category=category_filter)
 
     # Усі продукти всередині категорії (для вибору типів)
-    products_in_category = products_queryset.all()
+    products_in_category = products_queryset.read_only().all()
 
     # === 2️⃣ Тип ===
     product_type_filter = request.GET.get('product_type')
     if product_type_filter and product_type_filter != 'all':
         products_queryset = products_queryset.filter(product_type=product_type_filter)
 
-    # Усі продукти всередині типу (для вибору брендів)
-    products_in_type = products_queryset.all()
+    # Бренди всередині типу (для вибору брендів) - тільки поле manufacturer
+    brands_in_type = products_queryset.values_list('manufacturer', flat=True)
 
     # === 3️⃣ Бренд ===
     brand_filter = request.GET.get('brand')
@@ -140,7 +140,7 @@ def categories(request):
     per_page = 15
     skip = (page - 1) * per_page
     products_queryset = products_queryset.skip(skip).limit(per_page)
-    products_list = [ProductViewSerializer(p).data for p in products_queryset.all()]
+    products_list = [ProductViewSerializer(p).data for p in products_queryset.read_only().all()]
     total_pages = (total_count + per_page - 1) // per_page
     
 
@@ -167,7 +167,7 @@ def categories(request):
     types = sorted(types_set)
     
     # === 9️⃣ Бренди (залежать від типу) ===
-    brands_set = set(p.manufacturer for p in products_in_type if p.manufacturer)
+    brands_set = set(manufacturer for manufacturer in brands_in_type if manufacturer)
     brands = sorted(brands_set)
     
 
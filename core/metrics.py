@@ -0,0 +1,258 @@
+import threading
+from bisect import bisect_left
+
+from pymongo import monitoring
+
+# Межі бакетів у секундах (від 1 мс до 10 с)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """
+    Гістограма у форматі Prometheus (кумулятивні бакети, _sum, _count)
+
+    Значення групуються за набором міток:
+        histogram.observe(0.012, collection='sales', command='find')
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # [лічильники по бакетах (останній - +Inf), сума]
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def samples(self):
+        with self._lock:
+            series = {key: (list(counts), total) for key, (counts, total) in self._series.items()}
+
+        lines = []
+        for key, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = f'le="{_format_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total!r}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+class Gauge:
+    """Поточне значення (наприклад, кількість зайнятих з'єднань пулу)"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in sorted(values.items())]
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class MetricsRegistry:
+    """
+    Метрики процесу для endpoint /api/metrics/ (текстовий формат Prometheus)
+
+    Кожен gunicorn worker має власний реєстр: Prometheus збирає їх окремо
+    (або через балансувальник), перцентилі рахуються histogram_quantile().
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def render(self):
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.clear()
+
+
+metrics = MetricsRegistry()
+
+mongo_command_seconds = metrics.histogram(
+    'mongo_command_duration_seconds',
+    "Latency of MongoDB commands by collection and command",
+    ('collection', 'command', 'outcome'),
+)
+mongo_pool_wait_seconds = metrics.histogram(
+    'mongo_pool_checkout_wait_seconds',
+    "Time spent waiting for a connection from the MongoDB pool",
+    ('address', 'outcome'),
+)
+mongo_pool_checked_out = metrics.gauge(
+    'mongo_pool_checked_out_connections',
+    "Connections currently checked out of the MongoDB pool",
+    ('address',),
+)
+http_request_seconds = metrics.histogram(
+    'http_request_duration_seconds',
+    "HTTP request latency by route, method and status",
+    ('method', 'route', 'status'),
+)
+
+
+class CommandMetricsListener(monitoring.CommandListener):
+    """
+    pymongo CommandListener: латентність кожної команди в mongo_command_duration_seconds
+
+    Ім'я колекції є тільки в started подіях, тому воно запам'ятовується
+    до відповідної succeeded/failed події (ключ - з'єднання та request_id).
+    """
+
+    def __init__(self):
+        self._pending = {}
+
+    @staticmethod
+    def _collection(event):
+        command = event.command
+        target = command.get('collection') if event.command_name == 'getMore' else command.get(event.command_name)
+        return target if isinstance(target, str) else ''
+
+    def started(self, event):
+        self._pending[(event.connection_id, event.request_id)] = self._collection(event)
+
+    def _observe(self, event, outcome):
+        collection = self._pending.pop((event.connection_id, event.request_id), '')
+        mongo_command_seconds.observe(
+            event.duration_micros / 1e6,
+            collection=collection,
+            command=event.command_name,
+            outcome=outcome,
+        )
+
+    def succeeded(self, event):
+        self._observe(event, 'success')
+
+    def failed(self, event):
+        self._observe(event, 'error')
+
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    """pymongo ConnectionPoolListener: час очікування з'єднання та кількість зайнятих з'єднань"""
+
+    @staticmethod
+    def _address(event):
+        host, port = event.address
+        return f"{host}:{port}"
+
+    def connection_checked_out(self, event):
+        address = self._address(event)
+        if event.duration is not None:
+            mongo_pool_wait_seconds.observe(event.duration, address=address, outcome='success')
+        mongo_pool_checked_out.inc(address=address)
+
+    def connection_check_out_failed(self, event):
+        if event.duration is not None:
+            mongo_pool_wait_seconds.observe(event.duration, address=self._address(event), outcome=event.reason)
+
+    def connection_checked_in(self, event):
+        mongo_pool_checked_out.dec(address=self._address(event))
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+
+def mongo_event_listeners():
+    """Слухачі для MongoClient(event_listeners=...)"""
+    return [CommandMetricsListener(), PoolMetricsListener()]
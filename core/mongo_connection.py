@@ -1,15 +1,105 @@
 from pymongo import MongoClient
 from pymongo.errors import ConnectionFailure
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
 import os
+import threading
 from dotenv import load_dotenv
 
+from core.metrics import mongo_event_listeners
+
 load_dotenv()
 
 
+# Налаштування пулу з .env: (змінна оточення, опція MongoClient, тип).
+# Не задані змінні не передаються - діють значення pymongo за замовчуванням.
+POOL_SETTINGS = (
+    ('MONGODB_MAX_POOL_SIZE', 'maxPoolSize', int),
+    ('MONGODB_MIN_POOL_SIZE', 'minPoolSize', int),
+    ('MONGODB_MAX_IDLE_TIME_MS', 'maxIdleTimeMS', int),
+    ('MONGODB_WAIT_QUEUE_TIMEOUT_MS', 'waitQueueTimeoutMS', int),
+    ('MONGODB_COMPRESSORS', 'compressors', str),
+    ('MONGODB_READ_PREFERENCE', 'readPreference', str),
+)
+
+
+# Маршрути читання: назва -> (режим readPreference, maxStalenessSeconds або None).
+# reporting - важкі звіти та аналітика, щоб не забирати ресурси primary
+# у запису замовлень. На одновузловому replica set secondaryPreferred
+# просто читає з primary.
+READ_ROUTES = {
+    'primary': ('primary', None),
+    'reporting': (
+        os.getenv('MONGODB_REPORTING_READ_PREFERENCE', 'secondaryPreferred'),
+        int(os.getenv('MONGODB_REPORTING_MAX_STALENESS_SECONDS', '120')),
+    ),
+}
+
+READ_PREFERENCE_MODES = {
+    'primary': Primary,
+    'primaryPreferred': PrimaryPreferred,
+    'secondary': Secondary,
+    'secondaryPreferred': SecondaryPreferred,
+    'nearest': Nearest,
+}
+
+
+def read_preference(value):
+    """
+    Перетворити маршрут ('reporting'), назву режиму ('secondaryPreferred')
+    або готовий pymongo ReadPreference на об'єкт для with_options()
+    
+    maxStalenessSeconds (мінімум 90 с) застосовується лише до режимів, крім primary.
+    """
+    if not isinstance(value, str):
+        return value
+    
+    mode, max_staleness = READ_ROUTES.get(value, (value, None))
+    if mode not in READ_PREFERENCE_MODES:
+        raise ValueError(
+            f"Unknown read preference '{value}'. "
+            f"Use one of {sorted(READ_ROUTES)} or {sorted(READ_PREFERENCE_MODES)}"
+        )
+    if mode == 'primary':
+        return Primary()
+    return READ_PREFERENCE_MODES[mode](max_staleness=-1 if max_staleness is None else max_staleness)
+
+
+# Серверний ліміт часу (maxTimeMS) для читань ORM за замовчуванням: трохи менше
+# за socketTimeoutMS, щоб сервер сам зупинив запит, на який клієнт вже не чекає.
+# 0 - без ліміту; окремий QuerySet може змінити його через max_time_ms().
+DEFAULT_MAX_TIME_MS = int(os.getenv('MONGODB_DEFAULT_MAX_TIME_MS', '9000'))
+
+
+def client_options():
+    """Опції MongoClient: таймаути, налаштування пулу з .env та слухачі метрик"""
+    options = {
+        'serverSelectionTimeoutMS': 5000,
+        'connectTimeoutMS': 10000,
+        'socketTimeoutMS': 10000,
+        # Латентність команд та очікування пулу для /api/metrics/
+        'event_listeners': mongo_event_listeners(),
+    }
+    for env_name, option, cast in POOL_SETTINGS:
+        value = os.getenv(env_name)
+        if value not in (None, ''):
+            options[option] = cast(value)
+    return options
+
+
 class MongoConnection:
+    """
+    Singleton з'єднання з MongoDB
+
+    Клієнт створюється ліниво при першому get_database(), без ping:
+    pymongo встановлює з'єднання у фоні, а помилка сервера проявиться
+    на першому запиті. Після fork (gunicorn workers) PID відрізняється,
+    тож кожен процес створює власний клієнт і власний пул.
+    """
     _instance = None
     _client = None
     _db = None
+    _pid = None
+    _lock = threading.Lock()
 
     def __new__(cls):
         if cls._instance is None:
@@ -17,45 +107,49 @@ class MongoConnection:
         return cls._instance
 
     def connect(self):
-        if self._client is None:
-            try:
-                mongodb_uri = os.getenv('MONGODB_URI')
-                db_name = os.getenv('MONGODB_DB_NAME', 'pc_management')
-
-                self._client = MongoClient(
-                    mongodb_uri,
-                    serverSelectionTimeoutMS=5000,
-                    connectTimeoutMS=10000,
-                    socketTimeoutMS=10000
-                )
-
-                # Перевіряємо з'єднання
-                self._client.admin.command('ping')
-
-                # Отримуємо або створюємо базу даних
-                self._db = self._client[db_name]
-
-                print(f"✓ MongoDB Atlas з'єднання встановлено: {db_name}")
-
-            except ConnectionFailure as e:
-                print(f"✗ Помилка з'єднання з MongoDB: {e}")
-                raise
-            except Exception as e:
-                print(f"✗ Неочікувана помилка: {e}")
-                raise
+        with self._lock:
+            if self._client is not None and self._pid != os.getpid():
+                # Клієнт успадкований від батьківського процесу - його сокети
+                # та фонові потоки не можна використовувати після fork
+                self._client = None
+                self._db = None
+
+            if self._client is None:
+                try:
+                    mongodb_uri = os.getenv('MONGODB_URI')
+                    db_name = os.getenv('MONGODB_DB_NAME', 'pc_management')
+
+                    self._client = MongoClient(mongodb_uri, **client_options())
+
+                    # Отримуємо або створюємо базу даних
+                    self._db = self._client[db_name]
+                    self._pid = os.getpid()
+
+                except ConnectionFailure as e:
+                    print(f"✗ Помилка з'єднання з MongoDB: {e}")
+                    raise
+                except Exception as e:
+                    print(f"✗ Неочікувана помилка: {e}")
+                    raise
 
         return self._db
 
     def get_database(self):
-        if self._db is None:
+        if self._db is None or self._pid != os.getpid():
             return self.connect()
         return self._db
 
+    def ping(self):
+        """Перевірити доступність сервера (для health check)"""
+        self.get_database().client.admin.command('ping')
+
     def close(self):
-        if self._client:
-            self._client.close()
+        with self._lock:
+            if self._client and self._pid == os.getpid():
+                self._client.close()
             self._client = None
             self._db = None
+            self._pid = None
 
 
 # Singleton інстанс
@@ -63,5 +157,5 @@ mongo_connection = MongoConnection()
 
 
 def get_db():
-    """Отримати підключення до бази даних"""
+    """Отримати підключення до бази даних (створюється при першому виклику в процесі)"""
     return mongo_connection.get_database()
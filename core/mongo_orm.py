@@ -1,7 +1,165 @@
-from bson import ObjectId
+import base64
+import re
+import threading
+import time
+from copy import deepcopy
+from bson import ObjectId, json_util
+from pymongo import ReturnDocument, UpdateOne
+from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import datetime
 from typing import Any, Dict, List, Optional
-from core.mongo_connection import get_db
+from core.mongo_connection import DEFAULT_MAX_TIME_MS, get_db, read_preference as _resolve_read_preference
+from core.query_profiler import observe_query, observing, record_query
+
+
+# ==================== IDENTITY MAP ====================
+
+# {(collection_name, _id): instance} - активна тільки всередині identity_map()
+_identity_map = ContextVar('mongo_identity_map', default=None)
+
+
+@contextmanager
+def identity_map():
+    """
+    Identity map на час запиту: один екземпляр моделі на (колекція, _id)
+    
+    Повторні find_by_id / in_bulk всередині блоку не йдуть в базу.
+    Вкладені виклики використовують вже активну карту.
+    
+    Вмикається явно (opt-in) для сторінок, що лише читають: filter()/all()
+    всередині блоку теж віддають вже завантажені екземпляри, тож незбережені
+    зміни екземпляра видно в наступних запитах.
+    
+    Приклад:
+        with identity_map():
+            Product.find_by_id(pid)  # запит в базу
+            Product.find_by_id(pid)  # той самий екземпляр, без запиту
+        
+        @identity_map()  # або декоратором view
+        def contracts_list(request): ...
+    """
+    if _identity_map.get() is not None:
+        yield
+        return
+    
+    token = _identity_map.set({})
+    try:
+        yield
+    finally:
+        _identity_map.reset(token)
+
+
+def _identity_forget_collection(collection_name):
+    """Скинути закешовані екземпляри колекції (після масових update/delete)"""
+    cache = _identity_map.get()
+    if cache:
+        for key in [key for key in cache if key[0] == collection_name]:
+            del cache[key]
+
+
+# ==================== READ PREFERENCE ====================
+
+# Маршрут читання для Model.get_collection() - активний тільки всередині reads_from()
+_read_route = ContextVar('mongo_read_route', default=None)
+
+
+@contextmanager
+def reads_from(route):
+    """
+    Читати всі колекції всередині блоку з read preference маршруту - НОВА ФУНКЦІЯ
+    
+    route - назва з READ_ROUTES ('reporting'), режим ('secondaryPreferred')
+    або pymongo ReadPreference. Діє на objects(), find_by_id, in_bulk та prefetch;
+    запис завжди йде на primary. Працює і як декоратор view.
+    
+    Приклад:
+        @reads_from('reporting')
+        def sales_report(request):
+            ...
+    """
+    token = _read_route.set(_resolve_read_preference(route))
+    try:
+        yield
+    finally:
+        _read_route.reset(token)
+
+
+# ==================== ОПЦІЇ ЗАПИТІВ ====================
+
+# Коментар для всіх запитів (видно в profiler та currentOp MongoDB) - зазвичай
+# назва view, встановлюється MongoQueryStatsMiddleware
+_query_comment = ContextVar('mongo_query_comment', default=None)
+
+
+@contextmanager
+def query_comment(comment):
+    """
+    Позначити всі запити всередині блоку коментарем - НОВА ФУНКЦІЯ
+    
+    Приклад:
+        with query_comment('rebuild_rollups'):
+            ...
+    """
+    token = _query_comment.set(comment)
+    try:
+        yield
+    finally:
+        _query_comment.reset(token)
+
+
+def set_query_comment(comment):
+    """Змінити коментар до кінця поточного блоку query_comment() (для process_view middleware)"""
+    _query_comment.set(comment)
+
+
+def _query_options(options=None, style='find', streaming=False):
+    """
+    Keyword-аргументи pymongo для hint / maxTimeMS / comment / collation / batch_size
+    
+    style: 'find' - find/find_one (max_time_ms, batch_size), 'aggregate'
+    (maxTimeMS, batchSize), 'command' - count_documents/distinct (maxTimeMS),
+    'write' - запис (без ліміту часу). Ліміт часу за замовчуванням -
+    DEFAULT_MAX_TIME_MS, коментар за замовчуванням - з query_comment().
+    streaming=True (iterator(), values(batch_size=...)) - без ліміту за
+    замовчуванням: maxTimeMS рахується по всіх getMore курсора і обірвав би
+    прохід по всій колекції; явний max_time_ms() діє і тут.
+    """
+    options = options or {}
+    kwargs = {}
+    
+    if options.get('hint') is not None:
+        kwargs['hint'] = options['hint']
+    if options.get('collation') is not None:
+        kwargs['collation'] = options['collation']
+    comment = options.get('comment') or _query_comment.get()
+    if comment is not None:
+        kwargs['comment'] = comment
+    
+    if style != 'write':
+        max_time = options.get('max_time_ms', None if streaming else DEFAULT_MAX_TIME_MS)
+        if max_time:
+            kwargs['max_time_ms' if style == 'find' else 'maxTimeMS'] = max_time
+    if style in ('find', 'aggregate') and options.get('batch_size'):
+        kwargs['batch_size' if style == 'find' else 'batchSize'] = options['batch_size']
+    return kwargs
+
+
+# ==================== КЕШ КІЛЬКОСТІ ====================
+
+# {(collection_name, filter + collation/hint у json): (expires_at, count)} - для count(cache_ttl=...)
+_count_cache = {}
+_count_cache_lock = threading.Lock()
+COUNT_CACHE_MAX_ENTRIES = 1000
+
+
+def _forget_counts(collection_name):
+    """Скинути закешовані count() колекції після запису з цього процесу"""
+    if not _count_cache:
+        return
+    with _count_cache_lock:
+        for key in [key for key in _count_cache if key[0] == collection_name]:
+            del _count_cache[key]
 
 
 # ==================== БАЗОВІ КЛАСИ ПОЛІВ ====================
@@ -19,24 +177,51 @@ class Field:
         self.help_text = help_text  # НОВЕ (опціонально)
     
     def validate(self, value):
-        """Валідація значення"""
-        # СТАРИЙ КОД
-        if self.required and value is None:
-            raise ValueError(f"Поле є обов'язковим")
-        
-        # НОВИЙ КОД - choices
-        if value is not None and self.choices:
-            valid_choices = [choice[0] if isinstance(choice, tuple) else choice 
-                           for choice in self.choices]
-            if value not in valid_choices:
-                raise ValueError(f"Значення має бути одним з: {valid_choices}")
-        
-        # НОВИЙ КОД - кастомні валідатори
-        if value is not None and self.validators:
-            for validator in self.validators:
+        """Валідація значення (ОНОВЛЕНИЙ МЕТОД - через compile_validator())"""
+        validator = self.__dict__.get('_validator')
+        if validator is None:
+            validator = self._validator = self.compile_validator()
+        validator(value)
+        return True
+    
+    def compile_validator(self):
+        """
+        Побудувати функцію перевірки значення - НОВИЙ МЕТОД
+        
+        Все, що не залежить від значення (choices, regex, межі), готується
+        тут один раз. Функція кидає ValueError, як і раніше validate().
+        Підкласи доповнюють перевірку через super().compile_validator().
+        """
+        required = self.required
+        validators = tuple(self.validators)
+        valid_choices = None
+        choice_set = None
+        if self.choices:
+            valid_choices = [choice[0] if isinstance(choice, tuple) else choice
+                             for choice in self.choices]
+            try:
+                choice_set = frozenset(valid_choices)
+            except TypeError:
+                choice_set = tuple(valid_choices)
+        
+        def check(value):
+            if value is None:
+                if required:
+                    raise ValueError(f"Поле є обов'язковим")
+                return
+            
+            if choice_set is not None:
+                try:
+                    is_valid = value in choice_set
+                except TypeError:  # нехешоване значення (list, dict)
+                    is_valid = False
+                if not is_valid:
+                    raise ValueError(f"Значення має бути одним з: {valid_choices}")
+            
+            for validator in validators:
                 validator(value)
         
-        return True
+        return check
     
     def to_python(self, value):
         return value
@@ -67,25 +252,49 @@ class StringField(Field):
         self.min_length = min_length  # НОВЕ (опціонально)
         self.regex = regex  # НОВЕ (опціонально)
     
-    def validate(self, value):
-        super().validate(value)
+    def compile_validator(self):
+        base_check = super().compile_validator()
+        max_length = self.max_length
+        min_length = self.min_length
+        regex = self.regex
+        pattern = re.compile(regex) if regex else None
         
-        # СТАРИЙ КОД
-        if value and not isinstance(value, str):
-            raise ValueError("Значення має бути рядком")
-        if self.max_length and value and len(value) > self.max_length:
-            raise ValueError(f"Максимальна довжина {self.max_length}")
-        
-        # НОВИЙ КОД
-        if self.min_length and value and len(value) < self.min_length:
-            raise ValueError(f"Мінімальна довжина {self.min_length}")
+        def check(value):
+            base_check(value)
+            if not value:
+                return
+            
+            if not isinstance(value, str):
+                raise ValueError("Значення має бути рядком")
+            if max_length and len(value) > max_length:
+                raise ValueError(f"Максимальна довжина {max_length}")
+            if min_length and len(value) < min_length:
+                raise ValueError(f"Мінімальна довжина {min_length}")
+            if pattern is not None and not pattern.match(value):
+                raise ValueError(f"Значення не відповідає шаблону {regex}")
         
-        if self.regex and value:
-            import re
-            if not re.match(self.regex, value):
-                raise ValueError(f"Значення не відповідає шаблону {self.regex}")
+        return check
+
+
+def _compile_number_check(field, types, type_error):
+    """Спільна перевірка для IntegerField та FloatField: тип та межі min/max"""
+    base_check = Field.compile_validator(field)
+    min_value = field.min_value
+    max_value = field.max_value
+    
+    def check(value):
+        base_check(value)
+        if value is None:
+            return
         
-        return True
+        if not isinstance(value, types):
+            raise ValueError(type_error)
+        if min_value is not None and value < min_value:
+            raise ValueError(f"Мінімальне значення {min_value}")
+        if max_value is not None and value > max_value:
+            raise ValueError(f"Максимальне значення {max_value}")
+    
+    return check
 
 
 class IntegerField(Field):
@@ -96,21 +305,8 @@ class IntegerField(Field):
         self.min_value = min_value  # НОВЕ (опціонально)
         self.max_value = max_value  # НОВЕ (опціонально)
     
-    def validate(self, value):
-        super().validate(value)
-        
-        # СТАРИЙ КОД
-        if value is not None and not isinstance(value, int):
-            raise ValueError("Значення має бути цілим числом")
-        
-        # НОВИЙ КОД
-        if self.min_value is not None and value is not None and value < self.min_value:
-            raise ValueError(f"Мінімальне значення {self.min_value}")
-        
-        if self.max_value is not None and value is not None and value > self.max_value:
-            raise ValueError(f"Максимальне значення {self.max_value}")
-        
-        return True
+    def compile_validator(self):
+        return _compile_number_check(self, int, "Значення має бути цілим числом")
 
 
 class FloatField(Field):
@@ -121,21 +317,8 @@ class FloatField(Field):
         self.min_value = min_value  # НОВЕ (опціонально)
         self.max_value = max_value  # НОВЕ (опціонально)
     
-    def validate(self, value):
-        super().validate(value)
-        
-        # СТАРИЙ КОД
-        if value is not None and not isinstance(value, (int, float)):
-            raise ValueError("Значення має бути числом")
-        
-        # НОВИЙ КОД
-        if self.min_value is not None and value is not None and value < self.min_value:
-            raise ValueError(f"Мінімальне значення {self.min_value}")
-        
-        if self.max_value is not None and value is not None and value > self.max_value:
-            raise ValueError(f"Максимальне значення {self.max_value}")
-        
-        return True
+    def compile_validator(self):
+        return _compile_number_check(self, (int, float), "Значення має бути числом")
     
     def to_python(self, value):
         return float(value) if value is not None else None
@@ -167,24 +350,34 @@ class DateTimeField(Field):
         return value
 
 
+def _compile_type_check(field, value_type, type_error):
+    """Спільна перевірка для ListField та DictField: базова + тип значення"""
+    base_check = Field.compile_validator(field)
+    
+    def check(value):
+        base_check(value)
+        if value is not None and not isinstance(value, value_type):
+            raise ValueError(type_error)
+    
+    return check
+
+
 class ListField(Field):
     """Поле для списків"""
     
-    def validate(self, value):
-        super().validate(value)
-        if value is not None and not isinstance(value, list):
-            raise ValueError("Значення має бути списком")
-        return True
+    def __init__(self, field=None, **kwargs):
+        super().__init__(**kwargs)
+        self.field = field  # Тип елементів списку (опціонально)
+    
+    def compile_validator(self):
+        return _compile_type_check(self, list, "Значення має бути списком")
 
 
 class DictField(Field):
     """Поле для словників"""
     
-    def validate(self, value):
-        super().validate(value)
-        if value is not None and not isinstance(value, dict):
-            raise ValueError("Значення має бути словником")
-        return True
+    def compile_validator(self):
+        return _compile_type_check(self, dict, "Значення має бути словником")
 
 
 class ReferenceField(Field):
@@ -194,14 +387,25 @@ class ReferenceField(Field):
         super().__init__(**kwargs)
         self.reference_to = reference_to
     
-    def validate(self, value):
-        # Convert empty string to None for required fields
-        if isinstance(value, str) and value.strip() == '':
-            value = None
+    def get_model(self):
+        """Отримати клас моделі, на яку посилається поле (підтримує назву рядком)"""
+        if isinstance(self.reference_to, str):
+            model_class = ModelMeta._registry.get(self.reference_to)
+            if model_class is None:
+                raise ValueError(f"Модель {self.reference_to} не зареєстрована")
+            return model_class
+        return self.reference_to
+    
+    def compile_validator(self):
+        base_check = super().compile_validator()
         
-        # Call parent validation
-        super().validate(value)
-        return True
+        def check(value):
+            # Convert empty string to None for required fields
+            if isinstance(value, str) and value.strip() == '':
+                value = None
+            base_check(value)
+        
+        return check
     
     def to_mongo(self, value):
         # Convert empty string to None
@@ -225,44 +429,27 @@ class EmbeddedField(Field):
         super().__init__(**kwargs)
         self.model_class = model_class
 
-    def validate(self, value):
-        # Якщо значення None і поле не обов'язкове, пропускаємо валідацію
-        if value is None:
-            if not self.required:
-                return True
-            else:
-                raise ValueError(f"Поле є обов'язковим для {self.model_class.__name__}")
+    def compile_validator(self):
+        """
+        Перевірка без створення екземпляра вкладеної моделі
         
-        # Перевірка що це словник або вже модель
-        # Якщо це вже екземпляр моделі, конвертуємо в словник
-        if not isinstance(value, dict):
-            if hasattr(value, 'to_dict'):
-                value = value.to_dict()
-            else:
-                # Якщо це об'єкт моделі, спробуємо отримати атрибути
-                if isinstance(value, self.model_class):
-                    # Це вже правильний тип, пропускаємо перетворення
-                    return True
-                raise ValueError(f"Значення має бути словником для {self.model_class.__name__}")
-
-        # Спроба створити модель (оцінка валідності)
-        try:
-            model_instance = self.model_class(**value)
-            # Викликаємо validate() тільки якщо метод існує
-            if hasattr(model_instance, 'validate'):
-                try:
-                    model_instance.validate()
-                except AttributeError:
-                    # Ігноруємо якщо метод validate не працює
-                    pass
-        except AttributeError:
-            # Ігноруємо помилки AttributeError (наприклад, якщо validate не існує)
-            pass
-        except Exception as e:
-            # Тільки для інших помилок викидаємо ValueError
-            raise ValueError(f"Невірні дані для {self.model_class.__name__}: {e}")
-
-        return True
+        Приймається словник, екземпляр model_class або об'єкт з to_dict().
+        Раніше тут створювалась тимчасова модель, але методу validate() у
+        моделей немає, тож вона нічого не перевіряла.
+        """
+        required = self.required
+        model_class = self.model_class
+        
+        def check(value):
+            if value is None:
+                if required:
+                    raise ValueError(f"Поле є обов'язковим для {model_class.__name__}")
+                return
+            if isinstance(value, (dict, model_class)) or hasattr(value, 'to_dict'):
+                return
+            raise ValueError(f"Значення має бути словником для {model_class.__name__}")
+        
+        return check
 
     def to_mongo(self, value):
         # Якщо значення None, повертаємо None
@@ -340,9 +527,90 @@ class PhoneField(StringField):
 
 # ==================== МЕТАКЛАС ====================
 
+def _compile_hydrator(fields, row_class=None):
+    """
+    Згенерувати функцію заповнення полів з документа для конкретної моделі
+    
+    default кожного поля обчислюється один раз тут, тож у згенерованому коді
+    немає циклу по _fields та перевірок callable(). Поля з default=None
+    просто копіюються з документа.
+    
+    row_class=None - hydrate(instance, doc) пише в instance.__dict__ (Model),
+    інакше - hydrate(doc) створює екземпляр row_class з __slots__ (ModelRow).
+    """
+    namespace = {'_known': frozenset(fields) | {'_id', 'id'}}
+    if row_class is None:
+        lines = ['def hydrate(instance, doc):', '    state = instance.__dict__']
+        target = 'state[{!r}]'.format
+    else:
+        namespace.update(_new=object.__new__, _row_class=row_class)
+        lines = ['def hydrate(doc):', '    row = _new(_row_class)', '    row._prefetched = None']
+        target = 'row.{}'.format
+    
+    lines.append('    get = doc.get')
+    lines.append(f"    {target('id')} = doc['_id'] if '_id' in doc else get('id')")
+    for index, (name, field) in enumerate(fields.items()):
+        if field.default is None:
+            lines.append(f"    {target(name)} = get({name!r})")
+            continue
+        
+        namespace[f'_default_{index}'] = field.default
+        default = f'_default_{index}()' if callable(field.default) else f'_default_{index}'
+        lines.append(f"    value = get({name!r})")
+        lines.append(f"    {target(name)} = {default} if value is None else value")
+    
+    if row_class is None:
+        # Додаткові ключі документа стають атрибутами (як у старому __init__)
+        lines.append('    if not _known.issuperset(doc):')
+        lines.append('        for key in doc.keys() - _known:')
+        lines.append('            state[key] = doc[key]')
+    else:
+        lines.append('    return row')
+    
+    exec('\n'.join(lines), namespace)
+    return namespace['hydrate']
+
+
+def _compile_prepare(fields):
+    """
+    Зібрати валідацію та to_mongo всіх полів моделі в одну функцію
+    
+    Перевірки полів компілюються один раз (Field.compile_validator()),
+    to_mongo викликається тільки для полів, які його перевизначають.
+    """
+    steps = {}
+    for name, field in fields.items():
+        to_mongo = field.to_mongo if type(field).to_mongo is not Field.to_mongo else None
+        steps[name] = (field.compile_validator(), to_mongo, field)
+    
+    def prepare(instance, field_names):
+        data = {}
+        for field_name in field_names:
+            check, to_mongo, field = steps[field_name]
+            value = getattr(instance, field_name, None)
+            
+            # Debug: print field info if validation fails
+            try:
+                check(value)
+            except ValueError as e:
+                import sys
+                print(f"VALIDATION ERROR for field '{field_name}': value={value}, type={type(value)}, required={field.required}, default={field.default}", file=sys.stderr)
+                raise ValueError(f"Field '{field_name}': {str(e)}")
+            
+            # Перетворення для MongoDB
+            if value is not None:
+                data[field_name] = to_mongo(value) if to_mongo is not None else value
+        
+        return data
+    
+    return prepare
+
+
 class ModelMeta(type):
     """Метаклас для моделей"""
     
+    _registry = {}  # Назва моделі -> клас (для ReferenceField('Sale') тощо)
+    
     def __new__(mcs, name, bases, attrs):
         fields = {}
         for key, value in list(attrs.items()):
@@ -353,14 +621,320 @@ class ModelMeta(type):
         attrs['_fields'] = fields
         attrs['_collection_name'] = attrs.get('_collection_name', 
                                                name.lower() + 's')
+        attrs['_hydrate_fields'] = staticmethod(_compile_hydrator(fields))
+        attrs['_prepare_fields'] = staticmethod(_compile_prepare(fields))
+        attrs['_row_class'] = None  # ModelRow для read_only() - створюється при першому запиті
         
-        return super().__new__(mcs, name, bases, attrs)
+        cls = super().__new__(mcs, name, bases, attrs)
+        if bases:
+            mcs._registry[name] = cls
+        return cls
 
 
+def _unwrap_list_field(field):
+    """Повернути поле елементів для ListField (рекурсивно)"""
+    while isinstance(field, ListField) and field.field is not None:
+        field = field.field
+    return field
+
+
+def _resolve_reference_path(model_class, path):
+    """
+    Знайти ReferenceField за шляхом типу 'supplier_id' або 'products.product_id'
+    (проходить через ListField та EmbeddedField)
+    """
+    parts = path.split('.')
+    current = model_class
+    
+    for index, part in enumerate(parts):
+        field = _unwrap_list_field(current._fields.get(part))
+        if field is None:
+            raise ValueError(f"Поле '{part}' не знайдено в {current.__name__} (шлях '{path}')")
+        
+        is_last = index == len(parts) - 1
+        if is_last:
+            if not isinstance(field, ReferenceField):
+                raise ValueError(f"Шлях '{path}' не веде до ReferenceField")
+            return field
+        
+        if not isinstance(field, EmbeddedField):
+            raise ValueError(f"Поле '{part}' не є вкладеною моделлю (шлях '{path}')")
+        current = field.model_class
+    
+    raise ValueError(f"Некоректний шлях '{path}'")
+
+
+def _collect_path_values(value, parts):
+    """Зібрати всі значення за шляхом (працює зі словниками, моделями та списками)"""
+    if value is None:
+        return
+    if isinstance(value, (list, tuple)):
+        for item in value:
+            yield from _collect_path_values(item, parts)
+        return
+    if not parts:
+        yield value
+        return
+    
+    if isinstance(value, dict):
+        next_value = value.get(parts[0])
+    else:
+        next_value = getattr(value, parts[0], None)
+    yield from _collect_path_values(next_value, parts[1:])
+
+
+def _document_path_value(doc, parts):
+    """Значення за шляхом в сирому документі; через списки повертає список значень"""
+    value = doc
+    for index, part in enumerate(parts):
+        if isinstance(value, list):
+            return [_document_path_value(item, parts[index:]) for item in value]
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def _normalize_id(value):
+    """Привести id до ObjectId (рядки з валідним ObjectId конвертуються)"""
+    if isinstance(value, str) and ObjectId.is_valid(value):
+        return ObjectId(value)
+    if hasattr(value, 'id') and not isinstance(value, ObjectId):
+        return value.id
+    return value
+
+
+
+# Маркер "поля не було в документі" для snapshot (відрізняється від None)
+_MISSING = object()
+
+
+def _snapshot_value(value):
+    """Копія значення для dirty tracking: списки/словники копіюються глибоко"""
+    if isinstance(value, (list, dict)):
+        return deepcopy(value)
+    return value
+
+
+# Опції індексу, які мають збігатися з оголошеними (інакше - помилка в ensure_indexes)
+_COMPARED_INDEX_OPTIONS = ('unique', 'sparse', 'expireAfterSeconds', 'partialFilterExpression')
+
+
+def _index_option_mismatches(existing, options):
+    """Опції існуючого індексу (index_information()), що відрізняються від оголошених"""
+    mismatches = []
+    for option in _COMPARED_INDEX_OPTIONS:
+        actual, declared = existing.get(option), options.get(option)
+        if option in ('unique', 'sparse'):
+            actual, declared = bool(actual), bool(declared)
+        if actual != declared:
+            mismatches.append(f"{option}={actual!r} (declared {declared!r})")
+    return mismatches
+
+
+def _normalize_index(spec):
+    """Опис індексу з Model._indexes -> ([(field, direction)], options для create_index)"""
+    options = {}
+    if isinstance(spec, dict):
+        options = dict(spec)
+        fields = options.pop('fields')
+        if 'partial' in options:
+            options['partialFilterExpression'] = options.pop('partial')
+        if 'ttl' in options:
+            options['expireAfterSeconds'] = options.pop('ttl')
+    else:
+        fields = spec
+    
+    if isinstance(fields, str) or (isinstance(fields, tuple) and len(fields) == 2 and not isinstance(fields[1], (str, tuple))):
+        fields = [fields]
+    
+    keys = []
+    for field in fields:
+        if isinstance(field, str):
+            keys.append((field[1:], -1) if field.startswith('-') else (field, 1))
+        else:
+            keys.append(tuple(field))
+    
+    # Така ж назва, як генерує pymongo за замовчуванням
+    options.setdefault('name', '_'.join(f"{name}_{direction}" for name, direction in keys))
+    return keys, options
+
+
+class CursorPage:
+    """Сторінка keyset-пагінації: елементи та непрозорі токени сусідніх сторінок"""
+    
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+    
+    def __iter__(self):
+        return iter(self.items)
+    
+    def __len__(self):
+        return len(self.items)
+
+
+def _encode_cursor(values, backward=False):
+    """Значення ключів сортування -> непрозорий токен (base64 від Extended JSON)"""
+    payload = json_util.dumps({'k': values, 'b': backward})
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def _decode_cursor(token):
+    """Токен -> (значення ключів, backward). ValueError для пошкодженого токена"""
+    try:
+        payload = json_util.loads(base64.urlsafe_b64decode(token.encode()).decode())
+        return list(payload['k']), bool(payload.get('b'))
+    except Exception:
+        raise ValueError("Invalid pagination cursor")
+
+
+
+# ==================== АГРЕГАЦІЯ ====================
+
+def _field_ref(expression):
+    """'total_amount' -> '$total_amount' (id -> $_id); вирази Mongo лишаються як є"""
+    if isinstance(expression, str) and not expression.startswith('$'):
+        return '$_id' if expression == 'id' else f'${expression}'
+    return expression
+
+
+def as_object_id(expression):
+    """
+    Вираз $convert у ObjectId (рядкові id з бази теж), некоректні значення -> None
+    
+    Приклад:
+        .group_by({'product_id': as_object_id('products.product_id')}, qty=Sum('products.quantity'))
+    """
+    return {'$convert': {'input': _field_ref(expression), 'to': 'objectId', 'onError': None, 'onNull': None}}
+
+
+class Aggregate:
+    """
+    Акумулятор для $group - НОВИЙ КЛАС
+    
+    Аргумент - шлях поля ('total_amount', 'products.quantity') або вираз
+    Mongo ({'$multiply': ['$products.quantity', '$products.unit_price']}).
+    """
+    operator = None
+    empty = None  # значення, якщо документів немає
+    
+    def __init__(self, expression):
+        self.expression = expression
+    
+    def to_mongo(self):
+        return {self.operator: _field_ref(self.expression)}
+
+
+class Sum(Aggregate):
+    operator = '$sum'
+    empty = 0
+
+
+class Avg(Aggregate):
+    operator = '$avg'
+
+
+class Min(Aggregate):
+    operator = '$min'
+
+
+class Max(Aggregate):
+    operator = '$max'
+
+
+class Count(Aggregate):
+    operator = '$sum'
+    empty = 0
+    
+    def __init__(self):
+        super().__init__(1)
+
+
+class Push(Aggregate):
+    """Список значень групи: Push('number') або Push({'number': '$number', 'status': '$status'})"""
+    operator = '$push'
+    
+    @property
+    def empty(self):
+        return []
+
+
+class GroupBy:
+    """
+    Опис групування для QuerySet.group_by() та facet() - НОВИЙ КЛАС
+    
+    Ключі - шляхи полів (в результаті - остання частина шляху:
+    'products.product_id' -> 'product_id') або словник {назва: вираз Mongo}.
+    
+    Приклад:
+        GroupBy('employee_id', total=Sum('total_amount'), sales=Count())
+    """
+    
+    def __init__(self, *keys, **aggregations):
+        self.keys = {}
+        for key in keys:
+            if isinstance(key, dict):
+                self.keys.update(key)
+            else:
+                self.keys[key.rsplit('.', 1)[-1]] = _field_ref(key)
+        self.aggregations = _check_aggregations(aggregations)
+        
+        clash = set(self.keys) & set(self.aggregations)
+        if clash:
+            raise ValueError(f"Назви ключів та агрегатів збігаються: {sorted(clash)}")
+    
+    def stages(self):
+        if not self.keys:
+            group_id = None
+        elif len(self.keys) == 1:
+            group_id = next(iter(self.keys.values()))
+        else:
+            group_id = dict(self.keys)
+        
+        group = {'_id': group_id}
+        for name, aggregate in self.aggregations.items():
+            group[name] = aggregate.to_mongo()
+        return [{'$group': group}]
+    
+    def parse(self, rows):
+        results = []
+        for row in rows:
+            item = {}
+            if len(self.keys) == 1:
+                item[next(iter(self.keys))] = row['_id']
+            elif self.keys:
+                group_id = row['_id'] or {}
+                for name in self.keys:
+                    item[name] = group_id.get(name)
+            for name in self.aggregations:
+                item[name] = row.get(name)
+            results.append(item)
+        return results
+
+
+def _check_aggregations(aggregations):
+    for name, aggregate in aggregations.items():
+        if name == '_id' or not isinstance(aggregate, Aggregate):
+            raise ValueError(f"'{name}' має бути агрегатом (Sum, Avg, Min, Max, Count, Push)")
+    return aggregations
+
+
+def _totals(aggregations, rows):
+    """Результат групування без ключів -> словник (з empty, якщо документів немає)"""
+    row = rows[0] if rows else {}
+    return {
+        name: row[name] if name in row else aggregate.empty
+        for name, aggregate in aggregations.items()
+    }
+
 
 class QuerySet:
     """Клас для роботи з запитами"""
     
+    PREFETCH_CHUNK_SIZE = 500  # iterator() з prefetch без batch_size
+    
     def __init__(self, model_class, collection):
         self.model_class = model_class
         self.collection = collection
@@ -368,6 +942,28 @@ class QuerySet:
         self._sort = None
         self._limit_value = None
         self._skip_value = 0
+        self._prefetch = ()
+        self._only = ()
+        self._defer = ()
+        self._read_only = False
+        self._unwind = ()
+        self._options = {}  # hint, max_time_ms, batch_size, comment, collation
+        self._result_cache = None  # результати all() після len()/bool() - див. _fetch_all()
+    
+    def _clone(self):
+        """Копія QuerySet з тими ж параметрами запиту"""
+        query = QuerySet(self.model_class, self.collection)
+        query._filter = self._filter
+        query._sort = self._sort
+        query._limit_value = self._limit_value
+        query._skip_value = self._skip_value
+        query._prefetch = self._prefetch
+        query._only = self._only
+        query._defer = self._defer
+        query._read_only = self._read_only
+        query._unwind = self._unwind
+        query._options = self._options
+        return query
     
     def filter(self, **kwargs):
         """
@@ -379,12 +975,9 @@ class QuerySet:
             .filter(price__lte=1000)
             .filter(name='Intel')  # звичайна фільтрація
         """
-        query = QuerySet(self.model_class, self.collection)
+        query = self._clone()
         mongo_query = self._parse_filter_kwargs(kwargs)
         query._filter = {**self._filter, **mongo_query}
-        query._sort = self._sort
-        query._limit_value = self._limit_value
-        query._skip_value = self._skip_value
         return query
     
     def _parse_filter_kwargs(self, kwargs):
@@ -472,7 +1065,7 @@ class QuerySet:
         """Виключення документів (протилежність filter) - НОВИЙ МЕТОД"""
         mongo_query = self._parse_filter_kwargs(kwargs)
         
-        query = QuerySet(self.model_class, self.collection)
+        query = self._clone()
         
         # Додаємо $not до кожного поля
         not_query = {}
@@ -483,18 +1076,12 @@ class QuerySet:
                 not_query[key] = {'$ne': value}
         
         query._filter = {**self._filter, **not_query}
-        query._sort = self._sort
-        query._limit_value = self._limit_value
-        query._skip_value = self._skip_value
         return query
     
     def sort(self, field, direction=1):
         """Сортування (-1 DESC, 1 ASC) - СТАРИЙ МЕТОД"""
-        query = QuerySet(self.model_class, self.collection)
-        query._filter = self._filter
+        query = self._clone()
         query._sort = (field, direction)
-        query._limit_value = self._limit_value
-        query._skip_value = self._skip_value
         return query
     
     def order_by(self, *fields):
@@ -506,10 +1093,7 @@ class QuerySet:
             .order_by('-price')         # сортування по price (DESC)
             .order_by('-price', 'name') # спочатку по price DESC, потім по name ASC
         """
-        query = QuerySet(self.model_class, self.collection)
-        query._filter = self._filter
-        query._limit_value = self._limit_value
-        query._skip_value = self._skip_value
+        query = self._clone()
         
         sort_list = []
         for field in fields:
@@ -523,48 +1107,575 @@ class QuerySet:
     
     def limit(self, limit):
         """Обмеження кількості результатів - СТАРИЙ МЕТОД"""
-        query = QuerySet(self.model_class, self.collection)
-        query._filter = self._filter
-        query._sort = self._sort
+        query = self._clone()
         query._limit_value = limit
-        query._skip_value = self._skip_value
         return query
     
     def skip(self, skip):
         """Пропустити N документів - СТАРИЙ МЕТОД"""
-        query = QuerySet(self.model_class, self.collection)
-        query._filter = self._filter
-        query._sort = self._sort
-        query._limit_value = self._limit_value
+        query = self._clone()
         query._skip_value = skip
         return query
     
-    def count(self):
-        """Підрахунок документів - СТАРИЙ МЕТОД"""
-        return self.collection.count_documents(self._filter)
-    
-    def all(self):
-        """Отримати всі документи - СТАРИЙ МЕТОД (оновлений для order_by)"""
-        cursor = self.collection.find(self._filter)
-        
-        if self._sort:
-            # Підтримка як старого sort(), так і нового order_by()
-            if isinstance(self._sort, list):
-                cursor = cursor.sort(self._sort)
-            else:
-                cursor = cursor.sort(*self._sort if isinstance(self._sort, tuple) else [self._sort])
+    def prefetch(self, *paths):
+        """
+        Пакетне завантаження пов'язаних документів (ReferenceField) - НОВИЙ МЕТОД
         
-        if self._skip_value:
-            cursor = cursor.skip(self._skip_value)
-        if self._limit_value:
-            cursor = cursor.limit(self._limit_value)
+        Для кожної пов'язаної моделі робиться один запит з $in замість find_by_id на кожен елемент.
+        Результат доступний через instance.get_related(path, value).
         
-        return [self.model_class(**doc) for doc in cursor]
+        Приклади:
+            .prefetch('supplier_id')
+            .prefetch('user_id', 'employee_id', 'products.product_id')
+        """
+        for path in paths:
+            _resolve_reference_path(self.model_class, path)
+        
+        query = self._clone()
+        query._prefetch = tuple(dict.fromkeys(self._prefetch + paths))
+        return query
+    
+    def only(self, *fields):
+        """
+        Завантажувати тільки вказані поля (projection) - НОВИЙ МЕТОД
+        
+        _id завантажується завжди. Результати - частково завантажені моделі,
+        save() для них потребує save(allow_partial=True).
+        
+        Приклади:
+            .only('name', 'price')
+            .only('number', 'products.product_id')
+        """
+        query = self._clone()
+        query._only = tuple(dict.fromkeys(self._only + self._projection_names(fields)))
+        return query
+    
+    def defer(self, *fields):
+        """
+        Не завантажувати вказані поля (projection) - НОВИЙ МЕТОД
+        
+        Приклади:
+            .defer('description', 'specifications')
+        """
+        query = self._clone()
+        query._defer = tuple(dict.fromkeys(self._defer + self._projection_names(fields)))
+        return query
+    
+    def read_only(self):
+        """
+        Результати як ModelRow замість моделей - НОВИЙ МЕТОД
+        
+        Швидке створення та менше пам'яті для списків, що лише відображаються:
+        поля в __slots__, без snapshot для dirty tracking та identity map.
+        З only()/defer() невибрані поля отримують default.
+        
+        Приклад:
+            products = Product.objects().order_by('-created_at').read_only().all()
+        """
+        query = self._clone()
+        query._read_only = True
+        return query
+    
+    def using(self, read_preference):
+        """
+        Виконувати читання цього QuerySet з іншим read preference - НОВИЙ МЕТОД
+        
+        read_preference - маршрут з READ_ROUTES ('reporting', 'primary'),
+        режим ('secondaryPreferred') або pymongo ReadPreference.
+        Операції запису (update, delete, bulk_*) все одно йдуть на primary.
+        
+        Приклад:
+            Sale.objects().using('reporting').group_by('status', total=Sum('total_amount'))
+        """
+        query = self._clone()
+        query.collection = self.collection.with_options(read_preference=_resolve_read_preference(read_preference))
+        return query
+    
+    def _with_option(self, name, value):
+        query = self._clone()
+        query._options = {**self._options, name: value}
+        return query
+    
+    def hint(self, index):
+        """
+        Примусово використати індекс - НОВИЙ МЕТОД
+        
+        index - назва індексу ('status_1_created_at_-1') або поля у форматі
+        _indexes (['status', '-created_at']).
+        """
+        if not isinstance(index, str):
+            index = _normalize_index(list(index))[0]
+        return self._with_option('hint', index)
+    
+    def max_time_ms(self, milliseconds):
+        """
+        Серверний ліміт часу для читань - НОВИЙ МЕТОД
+        
+        За замовчуванням діє MONGODB_DEFAULT_MAX_TIME_MS; None або 0 - без ліміту.
+        Ліміт рахується на весь курсор (разом з getMore), тому iterator() та
+        values()/values_list() з batch_size за замовчуванням його не мають -
+        для них max_time_ms() задає ліміт явно.
+        Перевищення - pymongo.errors.ExecutionTimeout.
+        """
+        return self._with_option('max_time_ms', milliseconds)
+    
+    def batch_size(self, size):
+        """Кількість документів в одній відповіді сервера (find та aggregate) - НОВИЙ МЕТОД"""
+        return self._with_option('batch_size', size)
+    
+    def comment(self, text):
+        """Коментар запиту для profiler та currentOp (замість назви view) - НОВИЙ МЕТОД"""
+        return self._with_option('comment', text)
+    
+    def collation(self, collation):
+        """
+        Правила порівняння рядків - НОВИЙ МЕТОД
+        
+        Приклад:
+            User.objects().filter(username='ivan').collation({'locale': 'uk', 'strength': 2})
+        """
+        return self._with_option('collation', collation)
+    
+    def _projection_names(self, fields):
+        """Перевірити імена полів для only()/defer(), id -> _id не потрібен (завжди є)"""
+        names = []
+        for name in fields:
+            if name in ('id', '_id'):
+                continue
+            if name.split('.', 1)[0] not in self.model_class._fields:
+                raise ValueError(f"{self.model_class.__name__} has no field '{name}'")
+            names.append(name)
+        return tuple(names)
+    
+    def _get_projection(self):
+        """Projection для pymongo або None, якщо завантажується весь документ"""
+        if self._only:
+            return {name: 1 for name in self._only if name not in self._defer}
+        if self._defer:
+            return {name: 0 for name in self._defer}
+        return None
+    
+    def _loaded_field_names(self):
+        """Поля моделі, які завантажуються повністю (вкладені шляхи - лише частково)"""
+        if self._only:
+            names = set(self._only) - set(self._defer)
+            return frozenset(name for name in names if '.' not in name)
+        deferred = {name.split('.', 1)[0] for name in self._defer}
+        return frozenset(self.model_class._fields) - deferred
+    
+    def _selected_field_names(self):
+        """Поля моделі, які присутні в екземплярі (повністю або частково)"""
+        deferred = {name for name in self._defer if '.' not in name}
+        if self._only:
+            return frozenset(name.split('.', 1)[0] for name in self._only) - deferred
+        return frozenset(self.model_class._fields) - deferred
+    
+    def _build(self, doc, remember=True):
+        """
+        Створити екземпляр моделі з документа (з урахуванням only()/defer())
+        
+        remember=False - не додавати новий екземпляр в identity map (iterator()).
+        """
+        if self._read_only:
+            return self.model_class._get_row_class()._hydrate(doc)
+        if self._only or self._defer:
+            return self.model_class._from_partial(
+                doc, self._loaded_field_names(), self._selected_field_names()
+            )
+        if remember:
+            return self.model_class._from_identity_map(doc)
+        
+        cache = _identity_map.get()
+        instance = cache.get((self.model_class._collection_name, doc.get('_id'))) if cache is not None else None
+        return instance if instance is not None else self.model_class._from_document(doc)
+    
+    def paginate_after(self, sort_fields, cursor_token=None, limit=20):
+        """
+        Keyset (cursor) пагінація без skip - НОВИЙ МЕТОД
+        
+        Замість skip використовується умова "після останнього елемента" по
+        ключах сортування, тож кожна сторінка коштує однаково незалежно від глибини.
+        _id додається в кінець як унікальний tie-breaker. Поля сортування
+        мають бути непорожніми та покриті індексом, напр. (created_at, _id).
+        
+        Повертає CursorPage(items, next_cursor, prev_cursor).
+        
+        Приклади:
+            page = Product.objects().paginate_after(['-created_at'], limit=20)
+            page = Product.objects().paginate_after(['-created_at'], page.next_cursor, limit=20)
+        """
+        if isinstance(sort_fields, str):
+            sort_fields = [sort_fields]
+        
+        keys = []
+        for field in sort_fields:
+            direction = -1 if field.startswith('-') else 1
+            name = field.lstrip('-')
+            keys.append(('_id' if name == 'id' else name, direction))
+        if not any(name == '_id' for name, _ in keys):
+            keys.append(('_id', keys[-1][1] if keys else 1))
+        
+        backward = False
+        query_filter = self._filter
+        if cursor_token:
+            values, backward = _decode_cursor(cursor_token)
+            if len(values) != len(keys):
+                raise ValueError("Invalid pagination cursor")
+            
+            # (a > x) OR (a == x AND b > y) ... з урахуванням напрямку кожного ключа
+            branches = []
+            for i, (name, direction) in enumerate(keys):
+                if backward:
+                    direction = -direction
+                branch = {keys[j][0]: values[j] for j in range(i)}
+                branch[name] = {'$gt' if direction == 1 else '$lt': values[i]}
+                branches.append(branch)
+            keyset = {'$or': branches}
+            query_filter = {'$and': [self._filter, keyset]} if self._filter else keyset
+        
+        sort = [(name, -direction if backward else direction) for name, direction in keys]
+        query = self._clone()
+        query._filter = query_filter
+        query._sort = sort
+        query._skip_value = 0
+        query._limit_value = limit + 1
+        
+        items = query.all()
+        has_more = len(items) > limit
+        items = items[:limit]
+        if backward:
+            items.reverse()
+        
+        def token(instance, backward=False):
+            values = [instance.id if name == '_id' else getattr(instance, name, None) for name, _ in keys]
+            return _encode_cursor(values, backward)
+        
+        next_cursor = prev_cursor = None
+        if items:
+            if has_more or backward:
+                next_cursor = token(items[-1])
+            if (has_more and backward) or (cursor_token and not backward):
+                prev_cursor = token(items[0], backward=True)
+        
+        return CursorPage(items, next_cursor, prev_cursor)
+    
+    def _profiled(self, operation, query_filter=None):
+        """
+        Заміряти запит (query_profiler та збирач HTTP запиту, див. observe_query())
+        
+        Тільки якщо MONGO_QUERY_PROFILING увімкнено або запит обробляє
+        MongoQueryStatsMiddleware.
+        """
+        return observe_query(
+            self.model_class._collection_name,
+            operation,
+            self._filter if query_filter is None else query_filter,
+            self._sort
+        )
+    
+    def _documents(self, batch_size=None, projection=None, streaming=False):
+        """Документи з курсора; при замірах рахується лише час очікування на курсор"""
+        cursor = self._cursor(projection, streaming)
+        if batch_size:
+            cursor = cursor.batch_size(batch_size)  # має пріоритет над batch_size()
+        if not observing():
+            return cursor
+        return self._timed_documents(cursor)
+    
+    def _timed_documents(self, cursor):
+        elapsed = 0.0
+        docs = 0
+        documents = iter(cursor)
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    doc = next(documents)
+                except StopIteration:
+                    return
+                finally:
+                    elapsed += time.perf_counter() - started
+                docs += 1
+                yield doc
+        finally:
+            record_query(self.model_class._collection_name, 'find', self._filter, self._sort, elapsed, docs)
+    
+    def count(self, cache_ttl=None):
+        """
+        Підрахунок документів - СТАРИЙ МЕТОД (ОНОВЛЕНИЙ)
+        
+        cache_ttl - секунди, протягом яких результат для того ж фільтра (та тих
+        же collation()/hint()) береться з кешу процесу. Записи через ORM в цьому процесі скидають кеш колекції,
+        зміни з інших процесів видно не пізніше ніж через cache_ttl.
+        
+        Приклад:
+            Repair.objects().filter(status='received').count(cache_ttl=30)
+        """
+        if not cache_ttl:
+            with self._profiled('count'):
+                return self.collection.count_documents(self._filter, **_query_options(self._options, 'command'))
+        
+        # collation змінює результат (регістр), тому входить у ключ разом з hint
+        key = (self.model_class._collection_name, json_util.dumps({
+            'filter': self._filter,
+            'collation': self._options.get('collation'),
+            'hint': self._options.get('hint'),
+        }, sort_keys=True))
+        now = time.monotonic()
+        entry = _count_cache.get(key)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+        
+        with self._profiled('count'):
+            value = self.collection.count_documents(self._filter, **_query_options(self._options, 'command'))
+        with _count_cache_lock:
+            if len(_count_cache) >= COUNT_CACHE_MAX_ENTRIES:
+                _count_cache.clear()
+            _count_cache[key] = (now + cache_ttl, value)
+        return value
+    
+    def exists(self):
+        """
+        Чи є хоча б один документ - НОВИЙ МЕТОД
+        
+        find_one з projection тільки _id: документ не передається повністю
+        і модель не створюється. Для перевірок унікальності замість .first().
+        
+        Приклад:
+            if User.objects().filter(email=email).exists(): ...
+        """
+        with self._profiled('exists') as stats:
+            doc = self.collection.find_one(
+                self._filter, {'_id': 1}, skip=self._skip_value, **_query_options(self._options)
+            )
+            stats['docs'] = int(doc is not None)
+        return doc is not None
+    
+    def _cursor(self, projection=None, streaming=False):
+        """pymongo курсор з урахуванням projection, сортування, skip та limit"""
+        if projection is None:
+            projection = self._get_projection()
+        cursor = self.collection.find(self._filter, projection, **_query_options(self._options, streaming=streaming))
+        
+        if self._sort:
+            # Підтримка як старого sort(), так і нового order_by()
+            if isinstance(self._sort, list):
+                cursor = cursor.sort(self._sort)
+            else:
+                cursor = cursor.sort(*self._sort if isinstance(self._sort, tuple) else [self._sort])
+        
+        if self._skip_value:
+            cursor = cursor.skip(self._skip_value)
+        if self._limit_value:
+            cursor = cursor.limit(self._limit_value)
+        
+        return cursor
+    
+    def all(self):
+        """Отримати всі документи - СТАРИЙ МЕТОД (оновлений для order_by)"""
+        results = [self._build(doc) for doc in self._documents()]
+        self._apply_prefetch(results)
+        return results
+    
+    def iterator(self, batch_size=None):
+        """
+        Потокова ітерація: моделі створюються по одній з курсора - НОВИЙ МЕТОД
+        
+        batch_size передається в pymongo курсор і задає розмір пачки для prefetch.
+        Ліміт часу за замовчуванням (MONGODB_DEFAULT_MAX_TIME_MS) не діє -
+        прохід по великій колекції не обривається; явний max_time_ms() діє.
+        Нові екземпляри не додаються в identity map, тому пам'ять не росте
+        разом з колекцією.
+        
+        Приклад:
+            for sale in Sale.objects().filter(status='paid').iterator(batch_size=500):
+                total += sale.total_amount
+        """
+        cursor = self._documents(batch_size, streaming=True)
+        
+        if not self._prefetch:
+            for doc in cursor:
+                yield self._build(doc, remember=False)
+            return
+        
+        chunk_size = batch_size or self.PREFETCH_CHUNK_SIZE
+        chunk = []
+        for doc in cursor:
+            chunk.append(self._build(doc, remember=False))
+            if len(chunk) >= chunk_size:
+                yield from self._apply_prefetch(chunk)
+                chunk = []
+        if chunk:
+            yield from self._apply_prefetch(chunk)
+    
+    def _values_fields(self, fields):
+        """Імена полів для values()/values_list() та projection для них"""
+        if not fields:
+            fields = ('id',) + (tuple(name for name in self._only if name not in self._defer)
+                                or tuple(name for name in self.model_class._fields if name not in self._defer))
+        self._projection_names(fields)
+        
+        projection = {('_id' if name == 'id' else name): 1 for name in fields}
+        if '_id' not in projection:
+            projection['_id'] = 0
+        return fields, projection
+    
+    def values(self, *fields, batch_size=None):
+        """
+        Потокова ітерація по словниках замість моделей - НОВИЙ МЕТОД
+        
+        Модель не створюється: значення повертаються так, як лежать в базі
+        (без default та to_python), відсутні поля - None. 'id' - це _id.
+        Вкладені шляхи ('products.quantity') дають значення зі списку як список.
+        Без полів - всі поля моделі (з урахуванням only()/defer()) та id.
+        З batch_size - потоковий прохід без ліміту часу за замовчуванням (як iterator()).
+        
+        Приклад:
+            for row in Sale.objects().filter(status='paid').values('id', 'total_amount'):
+                totals[row['id']] = row['total_amount']
+        """
+        fields, projection = self._values_fields(fields)
+        paths = [['_id'] if name == 'id' else name.split('.') for name in fields]
+        rows = self._rows(paths, projection, batch_size)
+        return (dict(zip(fields, row)) for row in rows)
+    
+    def values_list(self, *fields, flat=False, batch_size=None):
+        """
+        Потокова ітерація по кортежах (flat=True - по значеннях одного поля) - НОВИЙ МЕТОД
+        
+        Правила ті ж, що й у values().
+        
+        Приклади:
+            revenue = sum(Sale.objects().filter(...).values_list('total_amount', flat=True))
+            for number, supplier_id in Contract.objects().values_list('number', 'supplier_id'):
+                ...
+        """
+        if flat and len(fields) != 1:
+            raise ValueError("values_list(flat=True) потребує рівно одного поля")
+        
+        fields, projection = self._values_fields(fields)
+        paths = [['_id'] if name == 'id' else name.split('.') for name in fields]
+        rows = self._rows(paths, projection, batch_size)
+        return (row[0] for row in rows) if flat else rows
+    
+    def _rows(self, paths, projection, batch_size):
+        for doc in self._documents(batch_size, projection, streaming=bool(batch_size)):
+            yield tuple(_document_path_value(doc, parts) for parts in paths)
+    
+    def _fetch_all(self):
+        """Результати all(), завантажені один раз для len()/bool() та наступної ітерації"""
+        if self._result_cache is None:
+            self._result_cache = self.all()
+        return self._result_cache
+    
+    def __iter__(self):
+        """
+        for obj in Model.objects().filter(...) - потокова ітерація без списку в пам'яті
+        
+        Якщо результати вже завантажені через len()/bool() (list(qs),
+        {% for %} у шаблоні), ітерація йде по них без повторного запиту.
+        Перевірка - на першому next(): list() викликає len() вже після iter().
+        """
+        if self._result_cache is not None:
+            yield from self._result_cache
+        else:
+            yield from self.iterator()
+    
+    def __len__(self):
+        """
+        Кількість результатів - ОНОВЛЕНИЙ МЕТОД
+        
+        Як у Django: завантажує та кешує результати, тож list(qs) і {% for %}
+        (які викликають len()) роблять один find замість count + find.
+        Лише кількість - count(), перевірка наявності - exists().
+        """
+        return len(self._fetch_all())
+    
+    def __bool__(self):
+        """Чи є результати - ОНОВЛЕНИЙ МЕТОД (завантажує їх, як __len__; без завантаження - exists())"""
+        return bool(self._fetch_all())
+    
+    def __getitem__(self, key):
+        """
+        Зрізи перетворюються на skip/limit на сервері
+        
+        Приклади:
+            Sale.objects().order_by('-sale_date')[:10]   # QuerySet з limit(10)
+            Sale.objects().order_by('-sale_date')[20:40] # skip(20).limit(20)
+            Sale.objects().order_by('-sale_date')[0]     # один екземпляр
+        """
+        if isinstance(key, slice):
+            if key.step not in (None, 1):
+                raise ValueError("QuerySet slicing does not support step")
+            start = key.start or 0
+            if start < 0 or (key.stop is not None and key.stop < 0):
+                raise ValueError("Negative indexing is not supported")
+            
+            limit = None if key.stop is None else max(key.stop - start, 0)
+            if self._limit_value:
+                remaining = max(self._limit_value - start, 0)
+                limit = remaining if limit is None else min(limit, remaining)
+            
+            query = self._clone()
+            query._skip_value = self._skip_value + start
+            query._limit_value = limit
+            if limit == 0:
+                # limit(0) в pymongo означає "без обмеження" - порожній зріз робимо явно
+                query._filter = {**self._filter, '_id': {'$in': []}}
+            return query
+        
+        if not isinstance(key, int):
+            raise TypeError(f"QuerySet indices must be integers or slices, not {type(key).__name__}")
+        if key < 0:
+            raise ValueError("Negative indexing is not supported")
+        
+        results = self[key:key + 1].all()
+        if not results:
+            raise IndexError("QuerySet index out of range")
+        return results[0]
+    
+    def _apply_prefetch(self, instances):
+        """
+        Завантажити пов'язані документи для prefetch-шляхів - ОНОВЛЕНИЙ МЕТОД
+        
+        Один $in запит на модель: шляхи на ту саму колекцію (employee_id
+        та technician_id) завантажуються разом.
+        """
+        if not self._prefetch or not instances:
+            return instances
+        
+        paths_by_model = {}
+        for path in self._prefetch:
+            target_model = _resolve_reference_path(self.model_class, path).get_model()
+            paths_by_model.setdefault(target_model, []).append(path)
+        
+        for target_model, paths in paths_by_model.items():
+            ids = set()
+            for path in paths:
+                parts = path.split('.')
+                for instance in instances:
+                    for value in _collect_path_values(instance, parts):
+                        ids.add(_normalize_id(value))
+            
+            related = target_model.in_bulk(ids)
+            
+            # Один словник на всі результати - спільний для всіх екземплярів
+            for instance in instances:
+                if instance._prefetched is None:
+                    instance._prefetched = {}
+                for path in paths:
+                    instance._prefetched[path] = related
+        
+        return instances
     
     def first(self):
         """Отримати перший документ - СТАРИЙ МЕТОД"""
-        doc = self.collection.find_one(self._filter)
-        return self.model_class(**doc) if doc else None
+        with self._profiled('find_one') as stats:
+            doc = self.collection.find_one(self._filter, self._get_projection(), **_query_options(self._options))
+            stats['docs'] = int(doc is not None)
+        if not doc:
+            return None
+        return self._apply_prefetch([self._build(doc)])[0]
     
     def get(self, **kwargs):
         """Отримати один документ за критеріями - СТАРИЙ МЕТОД"""
@@ -576,36 +1687,327 @@ class QuerySet:
                 mongo_kwargs[key] = value
         
         filter_query = {**self._filter, **mongo_kwargs}
-        doc = self.collection.find_one(filter_query)
+        with self._profiled('find_one', filter_query) as stats:
+            doc = self.collection.find_one(filter_query, self._get_projection(), **_query_options(self._options))
+            stats['docs'] = int(doc is not None)
         if not doc:
             raise Exception(f"Документ не знайдено: {filter_query}")
-        return self.model_class(**doc)
+        return self._apply_prefetch([self._build(doc)])[0]
     
     def delete(self):
         """Видалити документи - СТАРИЙ МЕТОД"""
-        result = self.collection.delete_many(self._filter)
+        with self._profiled('delete'):
+            result = self.collection.delete_many(self._filter, **_query_options(self._options, 'write'))
+        _identity_forget_collection(self.model_class._collection_name)
+        _forget_counts(self.model_class._collection_name)
         return result.deleted_count
     
-    def update(self, **kwargs):
-        """Масове оновлення документів - НОВИЙ МЕТОД"""
-        update_data = {}
+    # Префікси операторів оновлення: inc__quantity_in_stock=-2 -> {'$inc': {'quantity_in_stock': -2}}
+    UPDATE_OPERATORS = {
+        'set': '$set',
+        'unset': '$unset',
+        'inc': '$inc',
+        'mul': '$mul',
+        'max': '$max',
+        'min': '$min',
+        'push': '$push',
+        'pull': '$pull',
+        'add_to_set': '$addToSet',
+        'set_on_insert': '$setOnInsert',
+    }
+    
+    def _parse_update_kwargs(self, kwargs):
+        """
+        kwargs з операторами -> документ оновлення MongoDB
+        
+        Ключ без оператора означає $set. Решта "__" у назві поля - вкладений шлях:
+            set__software_service__status='done' -> {'$set': {'software_service.status': 'done'}}
+        """
+        update = {}
         for key, value in kwargs.items():
-            if key != 'id' and key != '_id':
-                update_data[key] = value
+            operator, _, field = key.partition('__')
+            if operator not in self.UPDATE_OPERATORS or not field:
+                operator, field = 'set', key
+            
+            if field in ('id', '_id'):
+                continue
+            field = field.replace('__', '.')
+            if operator == 'unset':
+                value = ''
+            
+            update.setdefault(self.UPDATE_OPERATORS[operator], {})[field] = value
         
-        result = self.collection.update_many(
-            self._filter,
-            {'$set': update_data}
-        )
+        if not update:
+            raise ValueError("update() requires at least one field")
+        return update
+    
+    def update(self, upsert=False, **kwargs):
+        """
+        Масове оновлення документів - НОВИЙ МЕТОД (з операторами)
+        
+        Виконується атомарно на сервері, умови з filter() працюють як guard.
+        Повертає кількість змінених документів.
+        
+        Приклади:
+            .update(status='paid')                              # $set
+            .update(inc__quantity_in_stock=-2)                  # $inc
+            .update(push__products={'product_id': pid, ...})    # $push
+            .filter(quantity_in_stock__gte=2).update(inc__quantity_in_stock=-2)
+            .update(upsert=True, set__count=1, set_on_insert__created_at=now)
+        """
+        update = self._parse_update_kwargs(kwargs)
+        with self._profiled('update'):
+            result = self.collection.update_many(
+                self._filter, update, upsert=upsert, **_query_options(self._options, 'write')
+            )
+        _identity_forget_collection(self.model_class._collection_name)
+        _forget_counts(self.model_class._collection_name)
+        return result.modified_count
+    
+    def update_one(self, upsert=False, **kwargs):
+        """Оновити перший документ, що підходить під фільтр - НОВИЙ МЕТОД (оператори як в update())"""
+        update = self._parse_update_kwargs(kwargs)
+        with self._profiled('update'):
+            result = self.collection.update_one(
+                self._filter, update, upsert=upsert, **_query_options(self._options, 'write')
+            )
+        _identity_forget_collection(self.model_class._collection_name)
+        _forget_counts(self.model_class._collection_name)
         return result.modified_count
     
+    def find_one_and_update(self, new=True, upsert=False, **kwargs):
+        """
+        Атомарно оновити один документ і повернути його - НОВИЙ МЕТОД
+        
+        new=True - повертається документ після оновлення, інакше - до.
+        Повертає None, якщо жоден документ не підійшов під фільтр.
+        Враховує order_by() (який саме документ) та only()/defer() (що повернути).
+        
+        Приклад:
+            product = Product.objects().filter(id=pid, quantity_in_stock__gte=2) \
+                .find_one_and_update(inc__quantity_in_stock=-2)
+        """
+        sort = self._sort
+        if isinstance(sort, tuple):
+            sort = [sort]
+        
+        update = self._parse_update_kwargs(kwargs)
+        with self._profiled('find_one_and_update'):
+            doc = self.collection.find_one_and_update(
+                self._filter,
+                update,
+                projection=self._get_projection(),
+                sort=sort or None,
+                upsert=upsert,
+                return_document=ReturnDocument.AFTER if new else ReturnDocument.BEFORE,
+                **_query_options(self._options, 'write')
+            )
+        _forget_counts(self.model_class._collection_name)
+        if doc is None:
+            return None
+        
+        # Закешований в identity map екземпляр вже застарів
+        cache = _identity_map.get()
+        if cache is not None:
+            cache.pop((self.model_class._collection_name, doc.get('_id')), None)
+        return self._build(doc)
+    
+    def bulk_update(self, instances, fields=None, ordered=True):
+        """
+        Оновити багато документів одним bulk_write - НОВИЙ МЕТОД
+        
+        fields - поля для $set; без fields пишуться змінені поля (dirty tracking).
+        pre_save (через pre_save_batch) і валідація виконуються для всієї
+        пачки до запису, post_save_batch - після.
+        Повертає кількість змінених документів.
+        
+        Приклад:
+            Product.objects().bulk_update(products, ['quantity_in_stock', 'updated_at'])
+        """
+        instances = list(instances)
+        for instance in instances:
+            if not instance.id:
+                raise ValueError(f"{type(instance).__name__} has no id; use bulk_create()")
+        self.model_class.pre_save_batch(instances)
+        
+        operations = []
+        written = []
+        
+        for instance in instances:
+            field_names = list(fields) if fields is not None else instance.get_dirty_fields()
+            if instance._loaded_fields is not None:
+                unloaded = [name for name in field_names if name not in instance._loaded_fields]
+                if fields is not None and unloaded:
+                    raise ValueError(
+                        f"{type(instance).__name__} {instance.id}: fields {unloaded} were not loaded"
+                    )
+                field_names = [name for name in field_names if name in instance._loaded_fields]
+            
+            data = instance._prepare_data(field_names)
+            if data:
+                operations.append(UpdateOne({'_id': instance.id}, {'$set': data}))
+                written.append((instance, field_names))
+        
+        if not operations:
+            return 0
+        
+        with self._profiled('bulk_write', {}):
+            result = self.collection.bulk_write(operations, ordered=ordered, **_query_options(style='write'))
+        _forget_counts(self.model_class._collection_name)
+        
+        for instance, field_names in written:
+            instance._remember_saved(field_names)
+        self.model_class.post_save_batch([instance for instance, _ in written])
+        
+        return result.modified_count
+    
+    def bulk_ops(self, operations, ordered=True):
+        """
+        Виконати довільні pymongo операції (InsertOne, UpdateOne, DeleteMany...) одним bulk_write - НОВИЙ МЕТОД
+        
+        ordered=False дозволяє серверу виконувати операції паралельно
+        і не зупинятись на першій помилці. Хуки моделі не викликаються.
+        """
+        operations = list(operations)
+        if not operations:
+            return None
+        
+        with self._profiled('bulk_write', {}):
+            result = self.collection.bulk_write(operations, ordered=ordered, **_query_options(style='write'))
+        _identity_forget_collection(self.model_class._collection_name)
+        _forget_counts(self.model_class._collection_name)
+        return result
+    
     def distinct(self, field):
         """Отримати унікальні значення поля - НОВИЙ МЕТОД"""
-        return self.collection.distinct(field, self._filter)
+        with self._profiled('distinct'):
+            return self.collection.distinct(field, self._filter, **_query_options(self._options, 'command'))
+    
+    def unwind(self, *paths, preserve_empty=False):
+        """
+        Розгорнути масиви перед агрегацією ($unwind) - НОВИЙ МЕТОД
+        
+        Впливає тільки на aggregate()/group_by()/facet()/sum() тощо.
+        
+        Приклад:
+            Sale.objects().unwind('products').group_by('products.product_id', qty=Sum('products.quantity'))
+        """
+        for path in paths:
+            if path.split('.', 1)[0] not in self.model_class._fields:
+                raise ValueError(f"{self.model_class.__name__} has no field '{path}'")
+        
+        query = self._clone()
+        query._unwind = self._unwind + tuple((path, preserve_empty) for path in paths)
+        return query
+    
+    def _pipeline_prefix(self):
+        """$match/$sort/$skip/$limit з QuerySet та $unwind - початок pipeline"""
+        stages = []
+        if self._filter:
+            stages.append({'$match': self._filter})
+        if self._sort:
+            sort = self._sort if isinstance(self._sort, list) else [self._sort]
+            stages.append({'$sort': dict(sort)})
+        if self._skip_value:
+            stages.append({'$skip': self._skip_value})
+        if self._limit_value:
+            stages.append({'$limit': self._limit_value})
+        for path, preserve_empty in self._unwind:
+            stages.append({'$unwind': {'path': f'${path}', 'preserveNullAndEmptyArrays': preserve_empty}})
+        return stages
+    
+    def _run_pipeline(self, stages, allow_disk_use=False, raw=False):
+        """Виконати stages після $match/$unwind цього QuerySet (raw=True - pipeline як є)"""
+        pipeline = stages if raw else self._pipeline_prefix() + stages
+        options = _query_options(self._options, 'aggregate')
+        if allow_disk_use:
+            options['allowDiskUse'] = True
+        with self._profiled('aggregate', {} if raw else None) as stats:
+            rows = list(self.collection.aggregate(pipeline, **options))
+            stats['docs'] = len(rows)
+        return rows
+    
+    def aggregate(self, pipeline=None, allow_disk_use=False, **aggregations):
+        """
+        Виконати aggregation pipeline - СТАРИЙ МЕТОД (ОНОВЛЕНИЙ)
+        
+        aggregate(pipeline) - як раніше, pipeline виконується як є.
+        aggregate(**aggregations) - підсумки по відфільтрованих документах
+        одним $group на сервері, результат - словник.
+        
+        Приклад:
+            Sale.objects().filter(status='paid').aggregate(total=Sum('total_amount'), count=Count())
+            # {'total': 1520.0, 'count': 12}
+        
+        allow_disk_use=True дозволяє великим $group/$sort використовувати
+        тимчасові файли на сервері замість помилки ліміту пам'яті (100 МБ).
+        """
+        if pipeline is not None:
+            return self._run_pipeline(pipeline, allow_disk_use, raw=True)
+        
+        group = GroupBy(**aggregations)
+        return _totals(group.aggregations, self._run_pipeline(group.stages(), allow_disk_use))
+    
+    def group_by(self, *keys, **aggregations):
+        """
+        Групування на сервері ($match + $group) - НОВИЙ МЕТОД
+        
+        Повертає список словників: ключі групи та агрегати (див. GroupBy).
+        
+        Приклад:
+            Sale.objects().filter(status='paid').group_by('employee_id', total=Sum('total_amount'), n=Count())
+            # [{'employee_id': ObjectId(...), 'total': 300.0, 'n': 2}, ...]
+        """
+        group = GroupBy(*keys, **aggregations)
+        return group.parse(self._run_pipeline(group.stages()))
+    
+    def facet(self, **branches):
+        """
+        Кілька агрегацій за один запит ($facet) - НОВИЙ МЕТОД
+        
+        Гілка - словник агрегатів (результат - словник), GroupBy (список
+        словників) або список stage Mongo (сирий результат).
+        
+        Приклад:
+            Repair.objects().facet(
+                totals={'count': Count()},
+                by_status=GroupBy('status', count=Count()),
+            )
+        """
+        facet = {}
+        parsers = {}
+        for name, branch in branches.items():
+            if isinstance(branch, dict):
+                group = GroupBy(**branch)
+                parsers[name] = lambda rows, group=group: _totals(group.aggregations, rows)
+            elif isinstance(branch, GroupBy):
+                group = branch
+                parsers[name] = group.parse
+            else:
+                facet[name] = list(branch)
+                parsers[name] = list
+                continue
+            facet[name] = group.stages()
+        
+        rows = self._run_pipeline([{'$facet': facet}])
+        row = rows[0] if rows else {}
+        return {name: parse(row.get(name, [])) for name, parse in parsers.items()}
+    
+    def sum(self, field):
+        """Сума поля на сервері - НОВИЙ МЕТОД"""
+        return self.aggregate(value=Sum(field))['value']
     
-    def aggregate(self, pipeline):
-        """Виконати aggregation pipeline - СТАРИЙ МЕТОД"""
-        return list(self.collection.aggregate(pipeline))
+    def avg(self, field):
+        """Середнє значення поля на сервері (None, якщо документів немає) - НОВИЙ МЕТОД"""
+        return self.aggregate(value=Avg(field))['value']
+    
+    def min(self, field):
+        """Мінімальне значення поля на сервері - НОВИЙ МЕТОД"""
+        return self.aggregate(value=Min(field))['value']
+    
+    def max(self, field):
+        """Максимальне значення поля на сервері - НОВИЙ МЕТОД"""
+        return self.aggregate(value=Max(field))['value']
 
 
 
@@ -614,39 +2016,40 @@ class Model(metaclass=ModelMeta):
     """Базова модель для MongoDB"""
     _collection_name = None
     _fields = {}
-    _indexes = []  # ← НОВЕ: індекси
+    _indexes = []  # ← НОВЕ: індекси (формати - див. get_index_specs())
+    _prefetched = None  # {path: {id: instance}} - заповнюється QuerySet.prefetch()
+    _loaded_fields = None  # frozenset повністю завантажених полів - тільки для only()/defer()
+    _original = None  # {field: значення в базі} - snapshot для dirty tracking
+    _read_preference = None  # маршрут читання моделі за замовчуванням (див. reads_from())
     
     def __init__(self, **kwargs):
-        # Конвертуємо _id в id - СТАРИЙ КОД
-        if '_id' in kwargs:
-            self.id = kwargs['_id']
-        else:
-            self.id = kwargs.get('id', None)
-        
-        # Ініціалізуємо поля зі значеннями за замовчуванням - ОНОВЛЕНИЙ КОД
-        for field_name, field in self._fields.items():
-            value = kwargs.get(field_name)
-            
-            # Якщо значення не передано, використовуємо default
-            if value is None:
-                # НОВЕ: Якщо default - це функція, викликаємо її
-                if callable(field.default):
-                    value = field.default()
-                else:
-                    value = field.default
-            
-            setattr(self, field_name, value)
-        
-        # Встановлюємо додаткові атрибути - СТАРИЙ КОД
-        for key, value in kwargs.items():
-            if key not in self._fields and key not in ['_id', 'id']:
-                setattr(self, key, value)
+        # ОНОВЛЕНИЙ КОД: _id -> id, поля з default та додаткові атрибути
+        # заповнює функція, згенерована метакласом (див. _compile_hydrator)
+        self._hydrate_fields(self, kwargs)
     
     @classmethod
     def get_collection(cls):
-        """Отримати колекцію MongoDB - СТАРИЙ МЕТОД"""
+        """Отримати колекцію MongoDB - СТАРИЙ МЕТОД (ОНОВЛЕНИЙ: read preference)"""
         db = get_db()
-        return db[cls._collection_name]
+        collection = db[cls._collection_name]
+        
+        # НОВЕ: маршрут з reads_from() має пріоритет над _read_preference моделі
+        preference = _read_route.get()
+        if preference is None and cls._read_preference is not None:
+            preference = _resolve_read_preference(cls._read_preference)
+        if preference is not None:
+            collection = collection.with_options(read_preference=preference)
+        return collection
+    
+    @classmethod
+    def estimated_count(cls):
+        """
+        Приблизна кількість документів колекції з метаданих - НОВИЙ МЕТОД
+        
+        estimated_document_count() не сканує колекцію, але не приймає фільтр
+        і може трохи відставати (напр. після аварійного завершення mongod).
+        """
+        return cls.get_collection().estimated_document_count(**_query_options(style='command'))
     
     @classmethod
     def objects(cls):
@@ -654,27 +2057,66 @@ class Model(metaclass=ModelMeta):
         return QuerySet(cls, cls.get_collection())
     
     @classmethod
-    def ensure_indexes(cls):
-        """Створити індекси для моделі - НОВИЙ МЕТОД"""
-        collection = cls.get_collection()
+    def get_index_specs(cls):
+        """
+        Усі індекси моделі у вигляді [(keys, options)] - НОВИЙ МЕТОД
         
-        # Створюємо індекси для unique полів
-        for field_name, field in cls._fields.items():
-            if field.unique:
-                try:
-                    collection.create_index(field_name, unique=True)
-                except Exception as e:
-                    print(f"Warning: Could not create index for {field_name}: {e}")
+        Спочатку unique поля, потім _indexes. Формати _indexes:
+            'sale_date' / '-sale_date'                   # одне поле (ASC / DESC)
+            ('sale_date', -1)                            # одне поле з напрямком
+            ['status', '-sale_date']                     # складений індекс
+            'products.product_id'                        # multikey по вкладеному списку
+            {'fields': 'expires_at', 'ttl': 0}           # TTL (expireAfterSeconds)
+            {'fields': ['user_id', 'used'], 'partial': {'used': False}, 'unique': True, 'name': '...'}
+        """
+        specs = [
+            _normalize_index({'fields': field_name, 'unique': True})
+            for field_name, field in cls._fields.items() if field.unique
+        ]
+        specs.extend(_normalize_index(index) for index in cls._indexes)
+        return specs
+    
+    @classmethod
+    def ensure_indexes(cls, dry_run=False):
+        """
+        Синхронізувати індекси колекції з оголошеними - ОНОВЛЕНИЙ МЕТОД
+        
+        Створює відсутні індекси і повертає звіт:
+            {'created': [...], 'existing': [...], 'extra': [...], 'errors': {name: message}}
+        Зайві індекси (є в базі, але не оголошені) тільки повідомляються, не видаляються.
+        Існуючий індекс з іншими ключами або опціями (unique, sparse, TTL,
+        partialFilterExpression) потрапляє в errors - його треба перестворити вручну.
+        """
+        collection = cls.get_collection()
+        existing = collection.index_information()
+        report = {'created': [], 'existing': [], 'extra': [], 'errors': {}}
+        declared = set()
         
-        # Створюємо додаткові індекси
-        for index in cls._indexes:
+        for keys, options in cls.get_index_specs():
+            name = options['name']
+            declared.add(name)
+            
+            if name in existing:
+                mismatches = _index_option_mismatches(existing[name], options)
+                if [tuple(key) for key in existing[name]['key']] != keys:
+                    report['errors'][name] = f"index exists with different keys {existing[name]['key']}"
+                elif mismatches:
+                    report['errors'][name] = f"index exists with different options: {', '.join(mismatches)}"
+                else:
+                    report['existing'].append(name)
+                continue
+            
+            if dry_run:
+                report['created'].append(name)
+                continue
             try:
-                if isinstance(index, str):
-                    collection.create_index(index)
-                elif isinstance(index, tuple):
-                    collection.create_index([index])
+                collection.create_index(keys, **options)
+                report['created'].append(name)
             except Exception as e:
-                print(f"Warning: Could not create index {index}: {e}")
+                report['errors'][name] = str(e)
+        
+        report['extra'] = [name for name in existing if name != '_id_' and name not in declared]
+        return report
     
     def pre_save(self):
         """Hook перед збереженням - НОВИЙ МЕТОД (override в дочірніх класах)"""
@@ -684,52 +2126,102 @@ class Model(metaclass=ModelMeta):
         """Hook після збереження - НОВИЙ МЕТОД (override в дочірніх класах)"""
         pass
     
-    def save(self):
-        """Зберегти документ - ОНОВЛЕНИЙ МЕТОД"""
+    @classmethod
+    def pre_save_batch(cls, instances):
+        """
+        Hook перед bulk_create()/bulk_update() для всієї пачки - НОВИЙ МЕТОД
+        
+        За замовчуванням викликає pre_save() кожного екземпляра; override,
+        щоб обробити пачку кількома запитами замість запитів на кожен екземпляр.
+        """
+        for instance in instances:
+            instance.pre_save()
+    
+    @classmethod
+    def post_save_batch(cls, instances):
+        """Hook після bulk_create()/bulk_update() для записаних екземплярів - НОВИЙ МЕТОД"""
+        for instance in instances:
+            instance.post_save()
+    
+    def save(self, allow_partial=False):
+        """
+        Зберегти документ - ОНОВЛЕНИЙ МЕТОД
+        
+        Для документів з бази валідуються та пишуться ($set) тільки змінені поля;
+        якщо нічого не змінилось - запиту в базу немає.
+        Частково завантажені екземпляри (only()/defer()) зберігаються тільки
+        з allow_partial=True і оновлюють лише завантажені поля.
+        """
+        if self._loaded_fields is not None and not allow_partial:
+            raise ValueError(
+                f"{self.__class__.__name__} {self.id} was loaded with only()/defer(); "
+                f"use save(allow_partial=True) to update only the loaded fields"
+            )
+        
         # НОВЕ: Hook перед збереженням
         self.pre_save()
         
-        data = {}
+        # Для завантажених з бази документів пишемо тільки змінені поля
+        if self.id and self._original is not None:
+            field_names = self.get_dirty_fields()
+            if not field_names:
+                return self
+        else:
+            field_names = list(self._fields)
         
-        # Валідація та підготовка даних - СТАРИЙ КОД
-        for field_name, field in self._fields.items():
-            value = getattr(self, field_name, None)
-            
-            # Debug: print field info if validation fails
-            try:
-                field.validate(value)
-            except ValueError as e:
-                import sys
-                print(f"VALIDATION ERROR for field '{field_name}': value={value}, type={type(value)}, required={field.required}, default={field.default}", file=sys.stderr)
-                raise ValueError(f"Field '{field_name}': {str(e)}")
-            
-            # Перетворення для MongoDB
-            if value is not None:
-                data[field_name] = field.to_mongo(value)
+        if self._loaded_fields is not None:
+            field_names = [name for name in field_names if name in self._loaded_fields]
+        
+        data = self._prepare_data(field_names)
         
         collection = self.get_collection()
         
         if self.id:
             # Оновлення існуючого документа - СТАРИЙ КОД
-            collection.update_one(
-                {'_id': self.id},
-                {'$set': data}
-            )
+            if data:
+                with observe_query(self._collection_name, 'update_one', {'_id': self.id}):
+                    collection.update_one(
+                        {'_id': self.id},
+                        {'$set': data},
+                        **_query_options(style='write')
+                    )
         else:
             # Створення нового документа - СТАРИЙ КОД
-            result = collection.insert_one(data)
+            with observe_query(self._collection_name, 'insert_one'):
+                result = collection.insert_one(data, **_query_options(style='write'))
             self.id = result.inserted_id
+            self._identity_put()
+        _forget_counts(self._collection_name)
+        
+        self._remember_saved(field_names)
         
         # НОВЕ: Hook після збереження
         self.post_save()
         
         return self
     
+    def _prepare_data(self, field_names):
+        """Валідація полів та перетворення для MongoDB (спільне для save() і bulk-операцій)"""
+        # ОНОВЛЕНО: функція зібрана метакласом (див. _compile_prepare)
+        return self._prepare_fields(self, field_names)
+    
+    def _remember_saved(self, field_names):
+        """Оновити snapshot після запису - записані поля більше не dirty"""
+        if self._original is None:
+            self._original = {}
+        for field_name in field_names:
+            self._original[field_name] = _snapshot_value(getattr(self, field_name, None))
+    
     def delete(self):
         """Видалити документ - СТАРИЙ МЕТОД"""
         if self.id:
             collection = self.get_collection()
-            collection.delete_one({'_id': self.id})
+            with observe_query(self._collection_name, 'delete_one', {'_id': self.id}):
+                collection.delete_one({'_id': self.id}, **_query_options(style='write'))
+            _forget_counts(self._collection_name)
+            cache = _identity_map.get()
+            if cache is not None:
+                cache.pop((self._collection_name, self.id), None)
             return True
         return False
     
@@ -790,16 +2282,207 @@ class Model(metaclass=ModelMeta):
             return field.get_choices_display(value)
         return getattr(self, field_name, None)
     
+    def get_related(self, path, value=None):
+        """
+        Отримати пов'язаний документ за ReferenceField - НОВИЙ МЕТОД
+        
+        Використовує результати QuerySet.prefetch(), інакше робить find_by_id.
+        Для вкладених шляхів потрібно передати значення id:
+            contract.get_related('supplier_id')
+            contract.get_related('products.product_id', item['product_id'])
+        """
+        if value is None and '.' not in path:
+            value = getattr(self, path, None)
+        value = _normalize_id(value)
+        if value is None or value == '':
+            return None
+        
+        if self._prefetched is not None and path in self._prefetched:
+            return self._prefetched[path].get(value)
+        
+        target_model = _resolve_reference_path(type(self), path).get_model()
+        return target_model.find_by_id(value)
+    
+    @classmethod
+    def _from_partial(cls, doc, loaded_fields, selected_fields):
+        """
+        Створити частково завантажений екземпляр (only()/defer())
+        
+        Невибрані поля не встановлюються зовсім, тому звернення до них
+        дає AttributeError замість тихого default. В identity map не потрапляє.
+        """
+        instance = cls.__new__(cls)
+        instance.id = doc.get('_id')
+        
+        for field_name in selected_fields:
+            value = doc.get(field_name)
+            if value is None and field_name in loaded_fields:
+                default = cls._fields[field_name].default
+                value = default() if callable(default) else default
+            setattr(instance, field_name, value)
+        
+        for key, value in doc.items():
+            if key not in cls._fields and key != '_id':
+                setattr(instance, key, value)
+        
+        instance._loaded_fields = frozenset(loaded_fields)
+        instance._snapshot(doc, selected_fields)
+        return instance
+    
+    @classmethod
+    def _from_document(cls, doc):
+        """Створити екземпляр з документа MongoDB і запам'ятати завантажені значення"""
+        instance = cls.__new__(cls)
+        cls._hydrate_fields(instance, doc)
+        instance._snapshot(doc, cls._fields)
+        return instance
+    
+    @classmethod
+    def _get_row_class(cls):
+        """Клас ModelRow з __slots__ під поля цієї моделі (створюється один раз)"""
+        row_class = cls.__dict__.get('_row_class')
+        if row_class is None:
+            row_class = type(f'{cls.__name__}Row', (ModelRow,), {
+                '__slots__': tuple(cls._fields),
+                '__module__': cls.__module__,
+                '_fields': cls._fields,
+                '_collection_name': cls._collection_name,
+                'model_class': cls,
+            })
+            row_class._hydrate = staticmethod(_compile_hydrator(cls._fields, row_class))
+            cls._row_class = row_class
+        return row_class
+    
+    def _snapshot(self, doc, field_names):
+        """
+        Запам'ятати значення полів так, як вони лежать в базі (для dirty tracking)
+        
+        Поля, яких немає в документі, позначаються _MISSING - їх default
+        буде записано при першому save().
+        """
+        self._original = {
+            name: _snapshot_value(doc[name]) if name in doc else _MISSING
+            for name in field_names
+        }
+    
+    def get_dirty_fields(self):
+        """
+        Список змінених з моменту завантаження полів - НОВИЙ МЕТОД
+        
+        Для екземплярів, створених не з бази, повертає всі поля.
+        """
+        if self._original is None:
+            return list(self._fields)
+        return [
+            name for name, original in self._original.items()
+            if original is _MISSING or getattr(self, name, None) != original
+        ]
+    
+    @classmethod
+    def _from_identity_map(cls, doc):
+        """Створити екземпляр з документа або повернути вже завантажений (identity map)"""
+        cache = _identity_map.get()
+        if cache is None:
+            return cls._from_document(doc)
+        
+        key = (cls._collection_name, doc.get('_id'))
+        instance = cache.get(key)
+        if instance is None:
+            instance = cls._from_document(doc)
+            cache[key] = instance
+        return instance
+    
+    def _identity_put(self):
+        """Зареєструвати екземпляр в активній identity map"""
+        cache = _identity_map.get()
+        if cache is not None and self.id is not None:
+            cache.setdefault((self._collection_name, self.id), self)
+    
     @classmethod
     def find_by_id(cls, id_value):
-        """Знайти документ за ID - СТАРИЙ МЕТОД"""
+        """Знайти документ за ID - СТАРИЙ МЕТОД (використовує identity map, якщо активна)"""
         if isinstance(id_value, str):
             id_value = ObjectId(id_value)
         
+        cache = _identity_map.get()
+        if cache is not None:
+            instance = cache.get((cls._collection_name, id_value))
+            if instance is not None:
+                return instance
+        
         collection = cls.get_collection()
-        doc = collection.find_one({'_id': id_value})
+        with observe_query(cls._collection_name, 'find_one', {'_id': id_value}) as stats:
+            doc = collection.find_one({'_id': id_value}, **_query_options())
+            stats['docs'] = 1 if doc else 0
+        
+        return cls._from_identity_map(doc) if doc else None
+    
+    @classmethod
+    def in_bulk(cls, ids):
+        """
+        Завантажити документи одним $in запитом - НОВИЙ МЕТОД
+        
+        Повертає {ObjectId: instance} тільки для знайдених документів.
+        Вже завантажені в identity map екземпляри не запитуються повторно.
+        """
+        ids = {_normalize_id(id_value) for id_value in ids}
+        ids.discard(None)
+        ids.discard('')
+        
+        result = {}
+        cache = _identity_map.get()
+        if cache is not None:
+            for id_value in ids:
+                instance = cache.get((cls._collection_name, id_value))
+                if instance is not None:
+                    result[id_value] = instance
+        
+        missing = [id_value for id_value in ids if id_value not in result]
+        if missing:
+            with observe_query(cls._collection_name, 'find', {'_id': {'$in': missing}}) as stats:
+                docs = list(cls.get_collection().find({'_id': {'$in': missing}}, **_query_options()))
+                stats['docs'] = len(docs)
+            for doc in docs:
+                result[doc['_id']] = cls._from_identity_map(doc)
+        
+        return result
+    
+    @classmethod
+    def bulk_create(cls, instances, ordered=True):
+        """
+        Створити багато документів одним insert_many - НОВИЙ МЕТОД
+        
+        pre_save (через pre_save_batch) і валідація виконуються для всієї
+        пачки до запису: якщо хоч один екземпляр невалідний, в базу нічого
+        не потрапляє. post_save_batch викликається після запису.
+        
+        Приклад:
+            Product.bulk_create([Product(name='A', ...), Product(name='B', ...)])
+        """
+        instances = list(instances)
+        if not instances:
+            return instances
         
-        return cls(**doc) if doc else None
+        field_names = list(cls._fields)
+        docs = []
+        for instance in instances:
+            if instance.id:
+                raise ValueError(f"{cls.__name__} {instance.id} already exists; use bulk_update()")
+        cls.pre_save_batch(instances)
+        for instance in instances:
+            docs.append(instance._prepare_data(field_names))
+        
+        with observe_query(cls._collection_name, 'insert_many'):
+            result = cls.get_collection().insert_many(docs, ordered=ordered, **_query_options(style='write'))
+        _forget_counts(cls._collection_name)
+        
+        for instance, inserted_id in zip(instances, result.inserted_ids):
+            instance.id = inserted_id
+            instance._identity_put()
+            instance._remember_saved(field_names)
+        cls.post_save_batch(instances)
+        
+        return instances
     
     @classmethod
     def create(cls, **kwargs):
@@ -815,3 +2498,40 @@ class Model(metaclass=ModelMeta):
     def __str__(self):
         """СТАРИЙ МЕТОД"""
         return self.__repr__()
+
+
+class ModelRow:
+    """
+    Екземпляр тільки для читання з QuerySet.read_only() - НОВИЙ КЛАС
+    
+    Поля зберігаються в __slots__ (без __dict__), snapshot для dirty tracking
+    не робиться, в identity map не потрапляє. Методів моделі (save() тощо)
+    немає - для зміни потрібен to_model(). Ключі документа, яких немає
+    серед полів моделі, не зберігаються.
+    """
+    __slots__ = ('id', '_prefetched')
+    _fields = {}
+    _collection_name = None
+    model_class = None
+    
+    get_field_display = Model.get_field_display
+    get_related = Model.get_related
+    
+    def to_model(self):
+        """Повноцінний екземпляр моделі з тими ж значеннями (save() запише всі поля)"""
+        instance = self.model_class.__new__(self.model_class)
+        doc = {name: getattr(self, name) for name in self._fields}
+        doc['_id'] = self.id
+        self.model_class._hydrate_fields(instance, doc)
+        instance._prefetched = self._prefetched
+        return instance
+    
+    def to_dict(self, *args, **kwargs):
+        """to_dict() моделі (з її перевизначеннями, напр. User без пароля)"""
+        return self.to_model().to_dict(*args, **kwargs)
+    
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.id}>"
+    
+    def __str__(self):
+        return self.__repr__()
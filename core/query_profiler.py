@@ -0,0 +1,288 @@
+import atexit
+import hashlib
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+
+from bson import ObjectId, json_util
+from pymongo import UpdateOne
+
+from core.mongo_connection import get_db
+
+
+# Колекція, куди скидаються зібрані форми запитів (читає manage.py index_report)
+SHAPES_COLLECTION = 'query_shapes'
+
+# Оператори діапазону - в індексі йдуть після рівності та сортування (правило ESR)
+RANGE_OPERATORS = {'$gt', '$gte', '$lt', '$lte', '$ne', '$nin', '$regex', '$exists', '$not'}
+
+
+def mask_value(value):
+    """
+    Замінити значення у фільтрі на маску типу: 'Intel' -> '<str>'
+
+    Структура (поля, оператори) зберігається, конкретні дані - ні.
+    bool та None лишаються як є - вони впливають на план і не містять даних.
+    Списки згортаються до унікальних масок, тож $in з 2 і з 20 значень - одна форма.
+    """
+    if isinstance(value, dict):
+        return {key: mask_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        masked = {}
+        for item in value:
+            item = mask_value(item)
+            masked.setdefault(json_util.dumps(item, sort_keys=True), item)
+        return list(masked.values())
+    if value is None or isinstance(value, bool):
+        return value
+    return f"<{type(value).__name__}>"
+
+
+def example_value(value):
+    """Маска -> приклад значення того ж типу (для explain())"""
+    if isinstance(value, dict):
+        return {key: example_value(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [example_value(item) for item in value]
+    if not isinstance(value, str) or not (value.startswith('<') and value.endswith('>')):
+        return value
+
+    examples = {
+        '<str>': '',
+        '<int>': 0,
+        '<float>': 0.0,
+        '<datetime>': datetime.now(),
+        '<ObjectId>': ObjectId(),
+    }
+    return examples.get(value)
+
+
+def normalize_sort(sort):
+    """_sort з QuerySet (tuple або list of tuples) -> [[field, direction]]"""
+    if not sort:
+        return []
+    if isinstance(sort, tuple):
+        sort = [sort]
+    return [[field, direction] for field, direction in sort]
+
+
+class QueryProfiler:
+    """
+    Збирає форми запитів QuerySet (фільтр без значень + сортування) з кількістю та часом
+
+    Вмикається змінною оточення MONGO_QUERY_PROFILING=True.
+    Накопичене скидається в колекцію query_shapes раз на
+    MONGO_QUERY_PROFILING_FLUSH_SECONDS секунд та при завершенні процесу.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv('MONGO_QUERY_PROFILING', 'False').lower() in ('1', 'true', 'yes')
+        self.flush_interval = float(os.getenv('MONGO_QUERY_PROFILING_FLUSH_SECONDS', '10'))
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def record(self, collection_name, operation, query_filter, sort, elapsed):
+        """Врахувати один виконаний запит"""
+        shape = mask_value(query_filter or {})
+        sort = normalize_sort(sort)
+        key = hashlib.sha1(
+            json_util.dumps([collection_name, operation, shape, sort], sort_keys=True).encode()
+        ).hexdigest()
+        elapsed_ms = elapsed * 1000
+
+        with self._lock:
+            entry = self._pending.get(key)
+            if entry is None:
+                entry = self._pending[key] = {
+                    'collection': collection_name,
+                    'operation': operation,
+                    'filter': json_util.dumps(shape, sort_keys=True),
+                    'sort': sort,
+                    'count': 0,
+                    'total_ms': 0.0,
+                    'max_ms': 0.0,
+                }
+            entry['count'] += 1
+            entry['total_ms'] += elapsed_ms
+            entry['max_ms'] = max(entry['max_ms'], elapsed_ms)
+            should_flush = time.monotonic() - self._last_flush >= self.flush_interval
+
+        if should_flush:
+            self.flush()
+
+    def flush(self):
+        """Записати накопичені форми в MongoDB (upsert з $inc лічильників)"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+        if not pending:
+            return
+
+        now = datetime.now()
+        operations = [
+            UpdateOne(
+                {'_id': key},
+                {
+                    '$inc': {'count': entry['count'], 'total_ms': entry['total_ms']},
+                    '$max': {'max_ms': entry['max_ms'], 'last_seen': now},
+                    '$setOnInsert': {
+                        'collection': entry['collection'],
+                        'operation': entry['operation'],
+                        'filter': entry['filter'],
+                        'sort': entry['sort'],
+                        'first_seen': now,
+                    },
+                },
+                upsert=True
+            )
+            for key, entry in pending.items()
+        ]
+        try:
+            get_db()[SHAPES_COLLECTION].bulk_write(operations, ordered=False)
+        except Exception as e:
+            print(f"Warning: Could not flush query shapes: {e}")
+
+
+class RequestQueries:
+    """
+    Запити до MongoDB в межах одного HTTP запиту (див. collect_request_queries())
+    
+    Кожен запис: колекція, операція, форма фільтра (mask_value), час та
+    кількість повернутих документів (None, якщо не застосовно).
+    """
+    
+    def __init__(self):
+        self.entries = []
+    
+    def record(self, collection_name, operation, query_filter, elapsed, docs=None):
+        shape = json_util.dumps(mask_value(query_filter or {}), sort_keys=True)
+        self.entries.append({
+            'collection': collection_name,
+            'operation': operation,
+            'shape': shape,
+            'ms': elapsed * 1000,
+            'docs': docs,
+        })
+    
+    @property
+    def count(self):
+        return len(self.entries)
+    
+    @property
+    def total_ms(self):
+        return sum(entry['ms'] for entry in self.entries)
+    
+    def repeated(self, threshold):
+        """Однакові за формою запити, виконані не менше threshold разів (ознака N+1)"""
+        counts = Counter(
+            (entry['collection'], entry['operation'], entry['shape']) for entry in self.entries
+        )
+        return [(key, n) for key, n in counts.most_common() if n >= threshold]
+
+
+# Збирач запитів поточного HTTP запиту (None - збір вимкнено)
+_request_queries = ContextVar('mongo_request_queries', default=None)
+
+
+@contextmanager
+def collect_request_queries():
+    """
+    Збирати всі запити ORM всередині блоку в RequestQueries
+    
+    Приклад:
+        with collect_request_queries() as queries:
+            response = get_response(request)
+        print(queries.count, queries.total_ms)
+    """
+    queries = RequestQueries()
+    token = _request_queries.set(queries)
+    try:
+        yield queries
+    finally:
+        _request_queries.reset(token)
+
+
+def observing():
+    """Чи потрібно заміряти запити (профілювання або збір для HTTP запиту)"""
+    return query_profiler.enabled or _request_queries.get() is not None
+
+
+def record_query(collection_name, operation, query_filter, sort, elapsed, docs=None):
+    """Передати виконаний запит у query_profiler та збирач поточного HTTP запиту"""
+    if query_profiler.enabled:
+        query_profiler.record(collection_name, operation, query_filter, sort, elapsed)
+    queries = _request_queries.get()
+    if queries is not None:
+        queries.record(collection_name, operation, query_filter, elapsed, docs)
+
+
+@contextmanager
+def observe_query(collection_name, operation, query_filter=None, sort=None):
+    """
+    Заміряти запит всередині блоку та передати в record_query()
+    
+    Блок отримує словник stats - кількість повернутих документів можна
+    вказати через stats['docs'].
+    """
+    stats = {'docs': None}
+    if not observing():
+        yield stats
+        return
+    
+    started = time.perf_counter()
+    try:
+        yield stats
+    finally:
+        record_query(collection_name, operation, query_filter, sort, time.perf_counter() - started, stats['docs'])
+
+
+def plan_stages(plan):
+    """Усі stage з explain() плану (включно з вкладеними inputStage/inputStages)"""
+    stages = []
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            stages.append(plan)
+        for value in plan.values():
+            stages.extend(plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(plan_stages(item))
+    return stages
+
+
+def suggest_index(query_filter, sort):
+    """
+    Запропонувати запис для _indexes за правилом ESR:
+    спочатку поля рівності, потім сортування, потім діапазони
+    """
+    equality, ranges = [], []
+    for field, condition in (query_filter or {}).items():
+        if field.startswith('$'):
+            continue
+        if isinstance(condition, dict) and RANGE_OPERATORS & set(condition):
+            ranges.append(field)
+        else:
+            equality.append(field)
+
+    keys = []
+    for field in equality:
+        keys.append(field)
+    for field, direction in normalize_sort(sort):
+        if field not in keys:
+            keys.append(f"-{field}" if direction == -1 else field)
+    for field in ranges:
+        if field not in keys and f"-{field}" not in keys:
+            keys.append(field)
+
+    if not keys:
+        return None
+    return keys[0] if len(keys) == 1 else keys
+
+
+query_profiler = QueryProfiler()
+atexit.register(query_profiler.flush)
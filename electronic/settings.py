@@ -82,6 +82,12 @@ MIDDLEWARE = [
     # 4. Sessions (для Django templates)
     'django.contrib.sessions.middleware.SessionMiddleware',
 
+    # 4.1. HTTP метрики для /api/metrics/ (латентність та статуси по маршрутах)
+    'apps.api.middleware.metrics.HTTPMetricsMiddleware',
+
+    # 4.2. Статистика запитів MongoDB (Server-Timing, попередження про N+1)
+    'apps.api.middleware.query_stats.MongoQueryStatsMiddleware',
+
     # 5. JWT автентифікація (для API)
     'apps.api.middleware.jwt_web.JWTWebAuthenticationMiddleware',
     
@@ -223,6 +229,11 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles', 'dist')
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static', 'dist')]
 
 
+# Однакові за формою запити MongoDB, повторені стільки разів за HTTP запит,
+# логуються як можливий N+1 (див. MongoQueryStatsMiddleware, 0 - вимкнено)
+MONGO_N_PLUS_ONE_THRESHOLD = config('MONGO_N_PLUS_ONE_THRESHOLD', default=10, cast=int)
+
+
 # Localization
 LANGUAGE_CODE = 'en-us'
 TIME_ZONE = 'Europe/Kiev'